@@ -1,20 +1,76 @@
-from flask import Flask, render_template, request, send_file
+from flask import Flask, g, jsonify, render_template, request, send_file, url_for
 from werkzeug.utils import secure_filename
-from PIL import Image
+from io import BytesIO
+import itertools
 import os
 import zipfile
-import time
-import traceback
-from steganography import text_steganography, file_steganography, encryption
-from steganography.compression_utils import zip_text, zip_file, unzip_bytes
-from steganography.multi_image_steganography import encode_chunks_to_images, decode_chunks_from_images, calculate_capacity
-from flask import jsonify
+# The encoders (NumPy, Pillow) and cryptography load on first use through
+# the lazy package namespace, so workers start without them
+import steganography
+from steganography import encryption, ingest, jobs, metrics
+from steganography.compression_utils import CODECS, compress
+from steganography.formats import DEFAULT_MODE, PNG_PROFILES, EmbedMode
+from steganography.capacity import capacity_for_size, plan_capacity, required_bytes, stream_capacity
+from steganography.payload import FLAG_MULTI_CHUNK, PAYLOAD_FILE, PAYLOAD_TEXT, pack_payload, stream_payload
+from steganography.result_cache import RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, ResultCache
 
 
 app = Flask(__name__)
-UPLOAD_FOLDER = os.path.join('static', 'uploads')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Worker processes for multi-image encode/decode. 1 (the default) keeps the
+# serial path; more starts one long-lived process pool shared by all requests
+app.config['STEGO_WORKERS'] = int(os.environ.get('STEGO_WORKERS', 1))
+# PNG output profile for stego images: store, fast, balanced or small
+app.config['STEGO_PNG_PROFILE'] = os.environ.get('STEGO_PNG_PROFILE', 'balanced')
+# Payload codec: 'auto' skips already-compressed data, or any name in compression_utils.CODECS
+app.config['STEGO_COMPRESSION'] = os.environ.get('STEGO_COMPRESSION', 'auto')
+# Embedding mode: low bits used per channel (1-4) and the channels carrying data
+# ('RGB', or e.g. 'RGBA' to also use the alpha channel of RGBA covers)
+app.config['STEGO_BITS_PER_CHANNEL'] = int(os.environ.get('STEGO_BITS_PER_CHANNEL', 2))
+app.config['STEGO_CHANNELS'] = os.environ.get('STEGO_CHANNELS', 'RGB')
+# Reed-Solomon parity chunks added to multi-image encodes; any that many chunks may be lost
+app.config['STEGO_PARITY'] = int(os.environ.get('STEGO_PARITY', 0))
+# Background jobs (/jobs): concurrent jobs, queued+running limit, seconds results
+# are kept (as temporary files; the uploads a job reads are spooled to disk)
+app.config['STEGO_JOB_WORKERS'] = jobs.JOB_WORKERS
+app.config['STEGO_JOB_QUEUE_SIZE'] = jobs.JOB_QUEUE_SIZE
+app.config['STEGO_JOB_TTL'] = jobs.JOB_TTL
+# Streamed uploads on /advanced/encode, /advanced/decode and /jobs: request body size and
+# file count limits, and bytes of each upload kept in memory before spilling to disk
+app.config['STEGO_UPLOAD_MAX_BYTES'] = ingest.UPLOAD_MAX_BYTES
+app.config['STEGO_UPLOAD_MAX_FILES'] = ingest.UPLOAD_MAX_FILES
+app.config['STEGO_UPLOAD_SPOOL_SIZE'] = ingest.UPLOAD_SPOOL_SIZE
+# Cache of encode results for retried requests (Idempotency-Key header); off unless a directory is set
+app.config['STEGO_RESULT_CACHE_DIR'] = RESULT_CACHE_DIR
+app.config['STEGO_RESULT_CACHE_MAX_BYTES'] = RESULT_CACHE_MAX_BYTES
+# Registry of reusable covers, stored as decoded RGB pixels (see /covers)
+app.config['STEGO_COVER_DIR'] = os.environ.get('STEGO_COVER_DIR', os.path.join(app.root_path, 'covers'))
+
+if app.config['STEGO_WORKERS'] > 1:
+    # Started once with the app, not per request (this loads the encoders)
+    steganography.multi_image_steganography.process_pool(app.config['STEGO_WORKERS'])
+
+
+@app.before_request
+def _start_request_metrics():
+    # With the log metrics backend, one record per request with the counters it added
+    rule = request.url_rule.rule if request.url_rule else request.path
+    g.metrics_request = metrics.request(f'{request.method} {rule}')
+    g.metrics_request.__enter__()
+
+
+@app.after_request
+def _record_request_status(response):
+    scope = g.get('metrics_request')
+    if scope is not None:
+        scope.set(status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def _finish_request_metrics(exc):
+    scope = g.pop('metrics_request', None)
+    if scope is not None:
+        scope.__exit__(type(exc) if exc else None, exc, None)
 
 
 @app.route('/')
@@ -24,45 +80,49 @@ def index():
 
 @app.route('/encode', methods=['POST'])
 def encode():
-    image = request.files['image']
+    image = request.files.get('image')
+    cover_id = request.form.get('cover_id')
     text_data = request.form.get('text_data')
     file_data = request.files.get('file_data')
     password = request.form.get('password')
     custom_filename = request.form.get('custom_filename')
 
-    if image.filename == '':
+    # A registered cover ID replaces the upload; its pixels are mapped, not decoded
+    if cover_id:
+        try:
+            cover = _cover_store().get(cover_id)
+        except KeyError:
+            return render_template('index.html', error='Unknown cover ID.')
+    elif not image or image.filename == '':
         return render_template('index.html', error='No image selected.')
-
-    image_filename = secure_filename(image.filename)
-    raw_image_path = os.path.join(app.config['UPLOAD_FOLDER'], image_filename)
-    image.save(raw_image_path)
-
-    img = Image.open(raw_image_path).convert('RGB')
-    png_image_filename = os.path.splitext(image_filename)[0] + '_converted.png'
-    png_image_path = os.path.join(app.config['UPLOAD_FOLDER'], png_image_filename)
-    img.save(png_image_path, 'PNG')
-    os.remove(raw_image_path)
-
+    else:
+        # Uploads stay in memory; the encoder converts the cover to RGB itself
+        with metrics.span('upload_read'):
+            cover = image.read()
     encoded_filename = secure_filename(custom_filename) + '.png' if custom_filename else 'encoded_image.png'
-    encoded_image_path = os.path.join(app.config['UPLOAD_FOLDER'], encoded_filename)
+
+    # A retry of an encode already done gets the same image back
+    result_key = _result_key('encode')
+    if result_key:
+        png = _result_cache().get(result_key)
+        if png is not None:
+            return send_file(BytesIO(png), mimetype='image/png', as_attachment=True, download_name=encoded_filename)
 
     try:
         if file_data and file_data.filename:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file_data.filename))
-            file_data.save(file_path)
-            zipped = zip_file(file_path)
-            os.remove(file_path)
-
             original_filename = secure_filename(file_data.filename)
-            filename_header = original_filename.encode() + b'::FN::'
-            combined = filename_header + zipped
-            encrypted = encryption.encrypt_data(combined, password)    
-            file_steganography.encode_file_to_image(png_image_path, encrypted, encoded_image_path)
+            codec, packed = compress(file_data.read(), _codec())
+            combined = pack_payload(packed, PAYLOAD_FILE, codec, original_filename)
+            encrypted = encryption.encrypt_data(combined, password)
+            png = steganography.encode_file_to_image(cover, encrypted, output_profile=_png_profile(),
+                                                   mode=_embed_mode())
 
         elif text_data:
-            zipped = zip_text(text_data)
-            encrypted = encryption.encrypt_data(zipped, password)
-            text_steganography.encode_text_to_image(png_image_path, encrypted, encoded_image_path)
+            codec, packed = compress(text_data.encode('utf-8'), _codec())
+            combined = pack_payload(packed, PAYLOAD_TEXT, codec)
+            encrypted = encryption.encrypt_data(combined, password)
+            png = steganography.encode_text_to_image(cover, encrypted, output_profile=_png_profile(),
+                                                   mode=_embed_mode())
 
         else:
             return render_template('index.html', error='Please provide text or file to encode.')
@@ -70,7 +130,9 @@ def encode():
     except Exception as e:
         return render_template('index.html', error=f'Encoding failed: {str(e)}')
 
-    return render_template('index.html', encoded_image=encoded_filename, original_image=os.path.basename(png_image_path))
+    if result_key:
+        _result_cache().put(result_key, png)
+    return send_file(BytesIO(png), mimetype='image/png', as_attachment=True, download_name=encoded_filename)
 
 
 @app.route('/decode', methods=['POST'])
@@ -81,185 +143,144 @@ def decode():
     if encoded_image.filename == '':
         return render_template('index.html', error='No image selected.')
 
-    filename = secure_filename(encoded_image.filename)
-    image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    encoded_image.save(image_path)
-
-    # --- 🧠 Try TEXT decoding ---
+    # Text and file payloads share one extraction and decryption pass;
+    # the payload header (or the legacy layout) decides how to present it.
     try:
-        encrypted_data = text_steganography.decode_text_from_image(image_path)
-        print("✅ Encrypted data extracted from text:", len(encrypted_data))
-        decrypted = encryption.decrypt_data(encrypted_data, password)
-        print("✅ Decryption succeeded")
-
-        try:
-            # Try to unzip (if zipped text)
-            files = unzip_bytes(decrypted)
-            print("📦 Archive contents:", list(files.keys()))
-            text_file = next(iter(files.values()))
-            return render_template('index.html', decoded_text=text_file.decode())
-        except Exception as unzip_err:
-            print("⚠️ Unzip failed, trying raw text:", unzip_err)
-            # Fallback to raw text
-            return render_template('index.html', decoded_text=decrypted.decode())
+        with metrics.span('upload_read'):
+            stego = encoded_image.read()
+        encrypted_data = steganography.decode_file_from_image(stego)
+        payload_type, filename, content = _open_payload(encrypted_data, password)
+        if payload_type == PAYLOAD_TEXT:
+            text = b''.join(content).decode()
     except Exception as e:
-        print("Text decode failed:", e)
-
-    # --- 🧠 Try FILE decoding ---
-    try:
-        encrypted_data = file_steganography.decode_file_from_image(image_path)
-        decrypted = encryption.decrypt_data(encrypted_data, password)
-
-        split_marker = b'::FN::'
-        if split_marker not in decrypted:
-            raise ValueError("This image does not contain a file.")
-
-        filename_bytes, zipped_file_bytes = decrypted.split(split_marker, 1)
-        files = unzip_bytes(zipped_file_bytes, extract_to=app.config['UPLOAD_FOLDER'])
-
-        filename = filename_bytes.decode()
-        saved_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
-
-        return render_template('index.html', decoded_file=secure_filename(filename))
-
-    except Exception as e:
-        print("File decode failed:", e)
+        app.logger.warning("Decode failed: %s", e)
         return render_template('index.html', error="Decoding failed. Ensure correct password and stego image.")
 
+    if payload_type == PAYLOAD_TEXT:
+        return render_template('index.html', decoded_text=text)
+    return _stream_decoded_file(filename, content)
+
 
 
 
 @app.route('/advanced/encode', methods=['POST'])
 def advanced_encode():
-    action = request.form.get('action')
-    images = request.files.getlist('images')
-    password = request.form.get('password')
-    file = request.files.get('file_data')
-    text_data = request.form.get('text_data')
-
-    if file and file.filename:
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file.filename))
-        file.save(temp_path)
-        zipped = zip_file(temp_path)
-        os.remove(temp_path)
-        filename_header = secure_filename(file.filename).encode() + b'::FN::'
-        combined = filename_header + zipped
-    elif text_data:
-        combined = zip_text(text_data)
-    else:
+    # The body is read as it arrives (steganography.ingest), so the payload
+    # and settings must come before the images, as the form sends them; only
+    # the submit button's 'action' may follow. Any other field after the
+    # first image is a 400.
+    if not _multipart():
+        # Say, text and registered 'cover_ids' as a urlencoded form: nothing to stream
+        result_key = _result_key('advanced_encode')
+        zip_data = result_key and _result_cache().get(result_key)
+        if zip_data:
+            return _send_zip(BytesIO(zip_data))
+        return _advanced_encode(request.form, request.files, (), result_key)
+    try:
+        with _ingest() as upload:
+            images = upload.iter_files('images')
+            first = next(images, None)  # everything sent ahead of the images is in by now
+            # A retry is recognised by its whole body, so idempotent requests are read in full first
+            if upload.form.get('action') == 'check' or not _payload_sent(upload.form, upload.files) or _idempotent():
+                upload.finish()
+            _require_fields_first(upload)
+            result_key = None
+            if upload.complete and upload.form.get('action') != 'check':
+                result_key = _result_key('advanced_encode', upload.form, upload.files)
+                zip_data = result_key and _result_cache().get(result_key)
+                if zip_data:
+                    return _send_zip(BytesIO(zip_data))
+            images = _fields_first(upload, itertools.chain([first] if first else [], images))
+            response = _advanced_encode(upload.form, upload.files, images, result_key)
+            _require_fields_first(upload.finish())
+            return response
+    except ingest.UploadTooLarge as e:
+        return render_template('index.html', error=str(e)), 413
+    except ValueError as e:
+        return render_template('index.html', error=str(e)), 400
+
+
+def _advanced_encode(form, files, images, result_key=None):
+    file = files.get('file_data')
+    if file:
+        file.stream.seek(0)
+    combined = _multi_payload(file, form.get('text_data'), form)
+    if combined is None:
         return render_template('index.html', error="Provide text or file to encode.")
 
-    encrypted = encryption.encrypt_data(combined, password)
-    required_bits = len(encrypted) * 8
-
-    image_paths = []
-    capacities = []
-    for img in images:
-        if img.filename:
-            path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(img.filename))
-            img.save(path)
-            image_paths.append(path)
-            capacities.append(calculate_capacity(path) * 8)
-
-    total_capacity_bits = sum(capacities)
-
-    if action == "check":
-        if total_capacity_bits >= required_bits:
-            msg = f"✅ Capacity OK. Required: {required_bits} bits. Available: {total_capacity_bits} bits."
-        else:
-            extra = required_bits - total_capacity_bits
-            avg_image_bits = total_capacity_bits / len(image_paths) if image_paths else 0
-            more = int((extra / avg_image_bits) + 1) if avg_image_bits else "N/A"
-            msg = f"❌ Not enough capacity. Required: {required_bits} bits. Available: {total_capacity_bits} bits. Add {more} more image(s)."
-        return render_template('index.html', capacity_result=msg)
-
     try:
-        print("encrypted payload size:",len(encrypted))
-        encoded_paths = encode_chunks_to_images(image_paths, encrypted, app.config['UPLOAD_FOLDER'])
-        zip_output = os.path.join(app.config['UPLOAD_FOLDER'], 'multi_encoded.zip')
-        with zipfile.ZipFile(zip_output, 'w') as zipf:
-            for path in encoded_paths:
-                zipf.write(path, arcname=os.path.basename(path))
-        return send_file(zip_output, as_attachment=True)
+        mode = _embed_mode(form)
+        stored = _stored_covers(form, mode)
+        parity = _parity(form)
+    except KeyError:
+        return render_template('index.html', error="Unknown cover ID.")
+    except ValueError as e:
+        return render_template('index.html', error=str(e))
+
+    if form.get('action') == "check":
+        images = list(images)
+        return render_template('index.html', capacity_result=_capacity_message(combined, images, stored, mode, parity))
+
+    covers = itertools.chain((cover for _, cover in stored), (_rewound(img) for img in images if img.filename))
+    try:
+        zip_output = _encode_multi(combined, form.get('password'), covers, mode, _png_profile(form), parity=parity)
+        if result_key:
+            _result_cache().put(result_key, zip_output.getvalue())
+        return _send_zip(zip_output)
+    except (ingest.UploadTooLarge, ingest.FieldOrderError):
+        raise
     except Exception as e:
         return render_template('index.html', error=f"Multi-image encoding failed: {str(e)}")
 
 
 @app.route('/advanced/decode', methods=['POST'])
 def advanced_decode():
-    stego_images = request.files.getlist('stego_images')
-    print("Raw stego_images list length:", len(stego_images))
-    for f in stego_images:
-        print("Received file object:", f.filename)
-    password = request.form.get('password')
-    
-    image_paths = []
+    # Each chunk is extracted as its image arrives (steganography.ingest)
+    try:
+        with _ingest() as upload:
+            return _advanced_decode(upload)
+    except ingest.UploadTooLarge as e:
+        return render_template('index.html', error=str(e)), 413
+    except ValueError as e:
+        return render_template('index.html', error=str(e)), 400
 
-    if not stego_images:
-        return render_template('index.html', error="Upload the stego images to decode.")
 
-    
+def _advanced_decode(upload):
+    received = []
 
-    image_paths = []
-    for img in stego_images:
-        if img.filename:
-            path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(img.filename))
-            img.save(path)
-            image_paths.append(path)
-            
-    print("files uploaded:")
-    for path in image_paths:
-        print("  - ",os.path.basename(path))
+    def arriving():
+        for img in upload.iter_files('stego_images'):
+            if img.filename:
+                received.append(img.filename)
+                yield img.stream
 
     try:
-        start = time.time()
-        try:
-            merged_encrypted_data = decode_chunks_from_images(image_paths)
-            print("✅ Decoding complete. Bytes merged:", len(merged_encrypted_data))
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return render_template('index.html',error=f"Multi-image decoding failed: {str(e)}")
-        print(f"chunk decode took {time.time() - start:.2f}s")
-        print("✅ Decoding complete. Bytes merged:", len(merged_encrypted_data))
-        print("📦 First 64 bytes:", merged_encrypted_data[:64])
-        print("📦 Last 64 bytes:", merged_encrypted_data[-64:])
-        start = time.time()
-        decrypted = encryption.decrypt_data(merged_encrypted_data, password)
-        print(f"decryption took {time.time() - start:.2f}s")
-        print("✅ Decryption successful. Size:", len(decrypted))
-
-        try:
-            start = time.time()
-            files = unzip_bytes(decrypted, extract_to=app.config['UPLOAD_FOLDER'])
-            print(f"unzipping took {time.time() - start:.2f}s")
-            start = time.time()
-            for name, content in files.items():
-                try:
-                    decoded = content.decode('utf-8')
-                    return render_template('index.html',decoded_text=decoded)
-                except UnicodeDecodeError:
-                    path = os.path.join(app.config['UPLOAD_FOLDER'],secure_filename(name))
-                    with open(path, 'wb') as f:
-                        f.write(content)
-                    return render_template('index.html', decoded_file=secure_filename(name))
-            print(f"file save took {time.time() - start:.2f}s")
-            return render_template('index.html', error="no readable content found") 
-              
-
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return render_template('index.html', error="Multi-image decoding failed: " + str(e))
+        merged_encrypted_data = steganography.decode_chunks_from_images(arriving(), workers=app.config['STEGO_WORKERS'])
+    except ingest.UploadTooLarge:
+        raise
+    except Exception as e:
+        if not received:
+            return render_template('index.html', error="Upload the stego images to decode.")
+        app.logger.exception("Multi-image extraction failed")
+        return render_template('index.html', error=f"Multi-image decoding failed: {str(e)}")
+    app.logger.info("Advanced decode of %d image(s)", len(received))
 
+    try:
+        password = upload.finish().form.get('password')
+        payload_type, filename, content = _open_payload(merged_encrypted_data, password)
+        if payload_type == PAYLOAD_TEXT:
+            text = b''.join(content).decode('utf-8')
+    except ingest.UploadTooLarge:
+        raise
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print("📦 Decoding failed after merging chunks.")
-        print("🧩 Encrypted data length (bytes):", len(merged_encrypted_data))
-        print("🔐 Password used:", password)
+        app.logger.exception("Multi-image decrypt failed (%d encrypted bytes)", len(merged_encrypted_data))
         return render_template('index.html', error=f"Multi-image decoding failed: {str(e)}")
 
+    if payload_type == PAYLOAD_TEXT:
+        return render_template('index.html', decoded_text=text)
+    if payload_type == PAYLOAD_FILE:
+        return _stream_decoded_file(filename, content)
+    return render_template('index.html', error="no readable content found")
 
 
 @app.route('/check_capacity', methods=['POST'])
@@ -269,39 +290,409 @@ def check_capacity():
     file = request.files.get('file_data')
     text_data = request.form.get('text_data')
 
-    if file and file.filename:
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file.filename))
-        file.save(temp_path)
-        zipped = zip_file(temp_path)
-        os.remove(temp_path)
-        combined = secure_filename(file.filename).encode() + b'::FN::' + zipped
-    elif text_data:
-        combined = zip_text(text_data)
-    else:
+    combined = _multi_payload(file, text_data)
+    if combined is None:
         return render_template('index.html', capacity_result="❌ No data provided")
 
+    try:
+        mode = _embed_mode()
+        msg = _capacity_message(combined, images, _stored_covers(mode=mode), mode, _parity())
+    except KeyError:
+        msg = "❌ Unknown cover ID"
+    except ValueError as e:
+        msg = f"❌ {e}"
+    return render_template('index.html', capacity_result=msg, advanced_text = text_data, advanced_password = password)
+
+
+def _encode_multi(combined, password, covers, mode, profile, progress=None, parity=0, zip_output=None):
+    # Encrypt and spread a payload over the covers; returns the chunk archive,
+    # in memory unless a file to write it to is given
     encrypted = encryption.encrypt_data(combined, password)
-    required_bits = len(encrypted) * 8
-
-    image_paths = []
-    total_capacity = 0
-    for img in images:
-        if img.filename:
-            path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(img.filename))
-            img.save(path)
-            cap = calculate_capacity(path) * 8
-            total_capacity += cap
-            image_paths.append(path)
-
-    if total_capacity >= required_bits:
-        msg = f"✅ Capacity OK. Required: {required_bits} bits. Available: {total_capacity} bits."
-    else:
-        extra = required_bits - total_capacity
-        avg_image_bits = total_capacity / len(image_paths) if image_paths else 0
-        more = int((extra / avg_image_bits) + 1) if avg_image_bits else "N/A"
-        msg = f"❌ Not enough capacity. Required: {required_bits} bits. Available: {total_capacity} bits. Add at least {more} more image(s)."
+    # Chunks are written straight into the archive. Without parity each
+    # cover is embedded as it arrives, and covers uploaded after those the
+    # payload needs are not waited for
+    zip_output = BytesIO() if zip_output is None else zip_output
+    with zipfile.ZipFile(zip_output, 'w') as zipf:
+        chunks = steganography.encode_chunks_to_images(covers, encrypted, workers=app.config['STEGO_WORKERS'],
+                                                       output_profile=profile, output_zip=zipf, mode=mode,
+                                                       progress=progress, parity=parity)
+    app.logger.info("Advanced encode: %d encrypted bytes over %d cover(s)", len(encrypted), len(chunks))
+    zip_output.seek(0)
+    return zip_output
+
+
+def _send_zip(zip_output):
+    return send_file(zip_output, mimetype='application/zip', as_attachment=True, download_name='multi_encoded.zip')
+
+
+def _open_payload(token, password):
+    # (payload type, filename, content pieces) of an encrypted payload. It is
+    # decrypted from slices of `token` and decompressed a segment at a time;
+    # the first piece is produced here, so a wrong password or a damaged
+    # payload fails before any response is sent.
+    payload_type, filename, content = stream_payload(encryption.decrypt_stream(token, password))
+    return payload_type, filename, itertools.chain([next(content, b'')], content)
+
+
+def _stream_decoded_file(filename, content):
+    # Sent as it is decrypted and decompressed; the whole file is never held at once
+    def logged():
+        try:
+            yield from content
+        except Exception:
+            app.logger.exception("Decoded file stream failed")
+            raise
+    download_name = secure_filename(filename) or 'decoded_file'
+    return app.response_class(logged(), mimetype='application/octet-stream',
+                              headers={'Content-Disposition': f'attachment; filename={download_name}'})
 
-    return render_template('index.html', capacity_result=msg, advanced_text = text_data, advanced_password = password)
+
+def _multi_payload(file, text_data, form=None):
+    # Headered, compressed plaintext for the multi-image routes
+    if file and file.filename:
+        filename = secure_filename(file.filename)
+        codec, packed = compress(file.read(), _codec(form))
+        return pack_payload(packed, PAYLOAD_FILE, codec, filename, FLAG_MULTI_CHUNK)
+    if text_data:
+        codec, packed = compress(text_data.encode('utf-8'), _codec(form))
+        return pack_payload(packed, PAYLOAD_TEXT, codec, flags=FLAG_MULTI_CHUNK)
+    return None
+
+
+def _payload_sent(form, files):
+    file = files.get('file_data')
+    return bool(form.get('text_data') or (file and file.filename))
+
+
+def _require_fields_first(upload):
+    # Only the submit button's 'action' may follow the images, and only to encode
+    upload.require_fields_first('images', () if upload.form.get('action') == 'check' else ('action',))
+
+
+def _fields_first(upload, images):
+    # The images, failing as soon as a form field turns up after them
+    for image in images:
+        _require_fields_first(upload)
+        yield image
+
+
+def _rewound(upload):
+    # A spooled upload's stream, from the start (it may have been read before)
+    upload.stream.seek(0)
+    return upload.stream
+
+
+def _multipart():
+    # Only multipart bodies are read through ingest; other forms carry no
+    # uploads and are parsed whole by Flask as usual
+    return request.mimetype == 'multipart/form-data'
+
+
+def _ingest():
+    # The current request's multipart body, read as it arrives, within the upload limits
+    return ingest.Ingest(request.stream, request.content_type, request.content_length,
+                         app.config['STEGO_UPLOAD_MAX_BYTES'], app.config['STEGO_UPLOAD_MAX_FILES'],
+                         app.config['STEGO_UPLOAD_SPOOL_SIZE'], request.max_form_memory_size)
+
+
+def _fields(form=None):
+    # Form fields of the request, or of a streamed upload
+    return request.form if form is None else form
+
+
+def _png_profile(form=None):
+    # Per-request override via the optional 'output_profile' form field
+    profile = _fields(form).get('output_profile')
+    return profile if profile in PNG_PROFILES else app.config['STEGO_PNG_PROFILE']
+
+
+def _codec(form=None):
+    # Per-request override via the optional 'compression' form field
+    codec = _fields(form).get('compression')
+    return codec if codec == 'auto' or codec in CODECS else app.config['STEGO_COMPRESSION']
+
+
+def _embed_mode(form=None):
+    # Per-request override via the optional 'bits_per_channel' and 'channels'
+    # form fields; raises ValueError for an invalid combination
+    bits = _fields(form).get('bits_per_channel') or app.config['STEGO_BITS_PER_CHANNEL']
+    channels = _fields(form).get('channels') or app.config['STEGO_CHANNELS']
+    try:
+        bits = int(bits)
+    except ValueError:
+        raise ValueError("Bits per channel must be between 1 and 4.") from None
+    return EmbedMode(bits, channels)
+
+
+def _parity(form=None):
+    # Per-request override via the optional 'parity' form field
+    parity = _fields(form).get('parity') or app.config['STEGO_PARITY']
+    try:
+        parity = int(parity)
+    except ValueError:
+        parity = -1
+    if parity < 0:
+        raise ValueError("Parity chunks must be a whole number, 0 or more.")
+    return parity
+
+
+def _capacity_message(combined, images, stored=(), mode=DEFAULT_MODE, parity=0):
+    # Sized from the container overhead and image headers (or stored cover
+    # metadata) for the chosen embedding mode; nothing is encrypted or saved
+    covers = [(cover_id, capacity_for_size(*cover.size, mode, chunked=True)) for cover_id, cover in stored]
+    covers += [(secure_filename(img.filename), stream_capacity(img.stream, mode, chunked=True))
+               for img in images if img.filename]
+    plan = plan_capacity(len(combined), [capacity for _, capacity in covers], chunked=True, parity=parity)
+    required_bits = plan.required_bytes * 8
+    available_bits = plan.available_bytes * 8
+
+    if plan.fits:
+        names = ', '.join(covers[i][0] for i in plan.recommended)
+        return (f"✅ Capacity OK. Required: {required_bits} bits. Available: {available_bits} bits. "
+                f"Smallest fitting set ({len(plan.recommended)} image(s)): {names}.")
+    more = plan.more_needed if plan.more_needed is not None else "N/A"
+    return f"❌ Not enough capacity. Required: {required_bits} bits. Available: {available_bits} bits. Add at least {more} more image(s)."
+
+
+def _cover_store():
+    return steganography.CoverStore(app.config['STEGO_COVER_DIR'])
+
+
+def _result_cache():
+    # None unless STEGO_RESULT_CACHE_DIR is set
+    root = app.config['STEGO_RESULT_CACHE_DIR']
+    if not root:
+        return None
+    cache = app.extensions.get('stego_results')
+    if cache is None or cache.root != root:
+        cache = app.extensions['stego_results'] = ResultCache(root, app.config['STEGO_RESULT_CACHE_MAX_BYTES'])
+    return cache
+
+
+def _idempotent():
+    # Whether this request's result may be cached: the client marked it with an Idempotency-Key
+    return _result_cache() is not None and bool(request.headers.get('Idempotency-Key'))
+
+
+def _result_key(route, form=None, files=None):
+    # Result cache key for this request, or None if it is not cached. Everything
+    # that shapes the output goes in: the idempotency key, every form field
+    # (password, settings, cover IDs, text), the server defaults the form can
+    # leave out, and the content and name of every upload.
+    if not _idempotent():
+        return None
+    files = request.files if files is None else files
+    params = {
+        'route': route,
+        'form': {name: values for name, values in _fields(form).lists()},
+        'defaults': [app.config[name] for name in ('STEGO_PNG_PROFILE', 'STEGO_COMPRESSION', 'STEGO_BITS_PER_CHANNEL',
+                                                   'STEGO_CHANNELS', 'STEGO_PARITY')],
+    }
+    inputs = [(f'{name}/{upload.filename}', upload.stream) for name, uploads in files.lists() for upload in uploads]
+    return _result_cache().key(request.headers['Idempotency-Key'], params, inputs)
+
+
+def _stored_covers(form=None, mode=DEFAULT_MODE):
+    # (cover ID, StoredCover) for each 'cover_ids' form value; KeyError if one is
+    # unknown, ValueError if `mode` needs the alpha channel stored covers lack
+    store = _cover_store()
+    ids = [cover_id for value in _fields(form).getlist('cover_ids') for cover_id in value.replace(',', ' ').split()]
+    if ids and mode.image_mode != 'RGB':
+        raise ValueError(f"Registered covers are stored without alpha; channels {mode.channels} cannot be used with them.")
+    return [(cover_id, store.get(cover_id)) for cover_id in ids]
+
+
+@app.route('/covers', methods=['POST'])
+def register_cover():
+    # Decode an uploaded cover once and keep its pixels for reuse by ID
+    image = request.files.get('image')
+    if not image or image.filename == '':
+        return jsonify(error='No image selected.'), 400
+    try:
+        meta = _cover_store().add(image.stream, secure_filename(image.filename))
+    except Exception as e:
+        return jsonify(error=f'Cover registration failed: {e}'), 400
+    return jsonify(meta), 201
+
+
+@app.route('/covers', methods=['GET'])
+def list_covers():
+    return jsonify(_cover_store().list())
+
+
+@app.route('/covers/<cover_id>', methods=['GET'])
+def cover_info(cover_id):
+    try:
+        return jsonify(_cover_store().metadata(cover_id))
+    except KeyError:
+        return jsonify(error='Unknown cover ID.'), 404
+
+
+@app.route('/covers/<cover_id>', methods=['DELETE'])
+def delete_cover(cover_id):
+    try:
+        _cover_store().remove(cover_id)
+    except KeyError:
+        return jsonify(error='Unknown cover ID.'), 404
+    return '', 204
+
+
+def _job_queue():
+    queue = app.extensions.get('stego_jobs')
+    if queue is None:
+        queue = app.extensions['stego_jobs'] = jobs.JobQueue(
+            app.config['STEGO_JOB_WORKERS'], app.config['STEGO_JOB_QUEUE_SIZE'], app.config['STEGO_JOB_TTL'])
+    return queue
+
+
+def _submit_job(kind, run, bits_total=None, inputs=()):
+    # `inputs` are the uploads kept for the job; the queue closes them
+    try:
+        job = _job_queue().submit(kind, run, bits_total, inputs)
+    except jobs.QueueFull as e:
+        return jsonify(error=str(e)), 503, {'Retry-After': '30'}
+    return jsonify(_job_info(job)), 202, {'Location': url_for('job_status', job_id=job.id)}
+
+
+def _kept_uploads(upload, name):
+    # The uploads of field `name`, kept past the request for a background job
+    return [upload.keep(img) for img in upload.files.getlist(name) if img.filename]
+
+
+def _job_info(job):
+    info = job.to_dict()
+    if job.status == jobs.DONE:
+        info['result_url'] = url_for('job_result', job_id=job.id)
+    return info
+
+
+@app.route('/jobs/encode', methods=['POST'])
+def submit_encode_job():
+    # Same form and upload limits as /advanced/encode; the encode runs in the background
+    if not _multipart():
+        return _submit_encode_job(request.form, request.files)
+    try:
+        with _ingest() as upload:
+            upload.finish()
+            return _submit_encode_job(upload.form, upload.files, upload)
+    except ingest.UploadTooLarge as e:
+        return jsonify(error=str(e)), 413
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+
+def _submit_encode_job(form, files, upload=None):
+    # `upload` is the streamed multipart body the cover uploads are kept from, if any
+    password = form.get('password')
+
+    combined = _multi_payload(files.get('file_data'), form.get('text_data'), form)
+    if combined is None:
+        return jsonify(error='Provide text or file to encode.'), 400
+    try:
+        mode = _embed_mode(form)
+        stored = _stored_covers(form, mode)
+        parity = _parity(form)
+    except KeyError:
+        return jsonify(error='Unknown cover ID.'), 400
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    # Registered covers come first, in the order given, then the uploads
+    uploads = _kept_uploads(upload, 'images') if upload else []
+    covers = [cover for _, cover in stored] + uploads
+    profile = _png_profile(form)
+
+    def run(job):
+        with job.create_result() as f:
+            _encode_multi(combined, password, covers, mode, profile, job.progress, parity, f)
+        return 'application/zip', 'multi_encoded.zip'
+
+    bits_total = required_bytes(len(combined), chunked=True) * 8
+    if parity:
+        # Parity chunks add to the bits embedded; their size depends on the covers
+        plan = plan_capacity(len(combined), [steganography.calculate_capacity(cover, mode) for cover in covers], True, parity)
+        bits_total = plan.required_bytes * 8 if plan.fits else None
+    return _submit_job('encode', run, bits_total, uploads)
+
+
+@app.route('/jobs/decode', methods=['POST'])
+def submit_decode_job():
+    # Same form and upload limits as /advanced/decode; the result is the decoded file or text
+    try:
+        with _ingest() as upload:
+            upload.finish()
+            password = upload.form.get('password')
+            images = _kept_uploads(upload, 'stego_images')
+    except ingest.UploadTooLarge as e:
+        return jsonify(error=str(e)), 413
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if not images:
+        return jsonify(error='Upload the stego images to decode.'), 400
+
+    def run(job):
+        merged = steganography.decode_chunks_from_images(images, workers=app.config['STEGO_WORKERS'], progress=job.progress)
+        payload_type, filename, content = stream_payload(encryption.decrypt_stream(merged, password))
+        with job.create_result() as f:
+            for piece in content:
+                f.write(piece)
+        if payload_type == PAYLOAD_TEXT:
+            return 'text/plain; charset=utf-8', 'decoded.txt'
+        return 'application/octet-stream', secure_filename(filename) or 'decoded_file'
+
+    return _submit_job('decode', run, inputs=images)
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    try:
+        return jsonify(_job_info(_job_queue().get(job_id)))
+    except KeyError:
+        return jsonify(error='Unknown or expired job.'), 404
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    try:
+        job = _job_queue().get(job_id)
+    except KeyError:
+        return jsonify(error='Unknown or expired job.'), 404
+    if job.status != jobs.DONE:
+        return jsonify(_job_info(job)), 409
+    mimetype, download_name = job.result
+    try:
+        return send_file(job.result_path, mimetype=mimetype, as_attachment=True, download_name=download_name)
+    except FileNotFoundError:
+        return jsonify(error='Unknown or expired job.'), 404
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    # Cancels a queued job or discards a finished one; running jobs answer 409
+    try:
+        job = _job_queue().cancel(job_id)
+    except KeyError:
+        return jsonify(error='Unknown or expired job.'), 404
+    if job.status == jobs.RUNNING:
+        return jsonify(_job_info(job)), 409
+    return '', 204
+
+
+@app.route('/result-cache')
+def result_cache_stats():
+    # Hit rate and size of the encode result cache
+    cache = _result_cache()
+    if cache is None:
+        return jsonify(error='Result cache disabled.'), 404
+    return jsonify(cache.stats())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus scrape target; enable with STEGO_METRICS=prometheus
+    if not metrics.is_enabled():
+        return "metrics disabled\n", 404, {'Content-Type': 'text/plain'}
+    return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
 
 
 if __name__ == '__main__':
@@ -0,0 +1,347 @@
+"""Reproducible encode/decode benchmarks for the steganography pipeline.
+
+Synthetic covers (seeded noise, saved as PNG) and payloads are generated
+for every size in the chosen preset. Each stage then runs in its own
+process, so its peak RSS is measured in isolation. Every stage records
+wall time, payload throughput (MB/s) and, for image stages, megapixels/s.
+
+    python benchmarks/bench_pipeline.py --preset quick --output results.json
+    python benchmarks/bench_pipeline.py --preset full --output new.json \\
+        --compare baseline.json --threshold 0.15
+
+With --compare, any case whose wall time grew by more than the threshold
+is reported as a regression and the exit status is 1.
+
+Encoder stages run once per PNG output profile (--profiles) and record the
+stego output size, which shows each profile's speed/size trade-off.
+
+The parity_* stages measure the Reed-Solomon coding overhead of
+multi-image parity chunks on their own: computing the parity for a payload
+split into PARITY_SHARDS, and rebuilding as many lost data chunks as
+there are parity chunks.
+
+The decrypt_payload_stream stage runs the decode routes' path from an
+encrypted payload to its content: segments decrypted from slices of the
+token and decompressed piece by piece, never holding the whole plaintext.
+
+The *_tiled stages run the single-image encoder and decoder in row bands
+(steganography.tiles) on the same covers, for comparison with the flat
+stages, which are pinned to the flat path.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from steganography import compression_utils, encryption, fec, file_steganography, text_steganography  # noqa: E402
+from steganography.capacity import capacity_for_size  # noqa: E402
+from steganography.cover_store import CoverStore  # noqa: E402
+from steganography.embedding import DEFAULT_PNG_PROFILE, PNG_PROFILES  # noqa: E402
+from steganography.payload import PAYLOAD_FILE, pack_payload, stream_payload  # noqa: E402
+from steganography.multi_image_steganography import decode_chunks_from_images, encode_chunks_to_images  # noqa: E402
+
+PRESETS = {
+    'quick': {
+        'images': [(256, 256), (1024, 1024)],
+        'payloads': [64, 64 * 1024],
+    },
+    'full': {
+        'images': [(256, 256), (1024, 1024), (1920, 1080), (3840, 2160), (7680, 4320)],
+        'payloads': [64, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 256 * 1024 * 1024],
+    },
+}
+
+SINGLE_IMAGE_STAGES = [
+    'encode_text_to_image', 'decode_text_from_image',
+    'encode_file_to_image', 'decode_file_from_image',
+    'encode_stored_cover',
+    'encode_file_tiled', 'decode_file_tiled',
+]
+MULTI_IMAGE_STAGES = ['encode_chunks_to_images', 'decode_chunks_from_images']
+IMAGE_STAGES = ['image_load'] + SINGLE_IMAGE_STAGES + MULTI_IMAGE_STAGES
+ENCODE_STAGES = [
+    'encode_text_to_image', 'encode_file_to_image', 'encode_stored_cover', 'encode_file_tiled',
+    'encode_chunks_to_images',
+]
+PAYLOAD_STAGES = [
+    'encrypt_data', 'decrypt_data', 'decrypt_payload_stream',
+    'zip_text', 'zip_file', 'unzip_bytes',
+    'compress', 'decompress',
+    'parity_encode', 'parity_recover',
+]
+PASSWORD = 'benchmark'
+SEED = 1234
+MAX_COVERS = 64  # multi-image cases needing more covers than this are skipped
+PARITY_SHARDS = (8, 2)  # data and parity chunks for the parity_* stages
+
+
+# --- Inputs -----------------------------------------------------------------
+
+def make_cover(size, directory):
+    path = os.path.join(directory, f'cover_{size[0]}x{size[1]}.png')
+    if not os.path.exists(path):
+        rng = np.random.default_rng(SEED)
+        pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        Image.fromarray(pixels, 'RGB').save(path, 'PNG')
+    return path
+
+
+def make_payload(length: int) -> bytes:
+    # Half random bytes, half repeated text, so codecs have something to do
+    rng = np.random.default_rng(SEED)
+    noise = rng.integers(0, 256, length // 2, dtype=np.uint8).tobytes()
+    text = (b'steganography benchmark payload ' * (length // 32 + 1))[:length - len(noise)]
+    return noise + text
+
+
+def covers_needed(size, length) -> int:
+    # Covers needed as multi-image chunks; a single image holds slightly more
+    return -(-length // capacity_for_size(*size, chunked=True))
+
+
+# --- Stages -----------------------------------------------------------------
+# Each builder does its untimed setup and returns the thunk to be timed.
+# Encoder thunks return the path(s) they wrote so output size can be recorded.
+
+def build_stage(stage, cover, size, payload, workdir, profile=DEFAULT_PNG_PROFILE):
+    out = os.path.join(workdir, 'out.png')
+
+    if stage == 'image_load':
+        return lambda: Image.open(cover).convert('RGB').load()
+    if stage == 'encode_text_to_image':
+        return lambda: text_steganography.encode_text_to_image(cover, payload, out, profile, tiled=False)
+    if stage == 'encode_file_to_image':
+        return lambda: file_steganography.encode_file_to_image(cover, payload, out, profile, tiled=False)
+    if stage == 'encode_file_tiled':
+        return lambda: file_steganography.encode_file_to_image(cover, payload, out, profile, tiled=True)
+    if stage == 'encode_stored_cover':
+        # Same as encode_file_to_image, but from a registered (pre-decoded) cover
+        store = CoverStore(os.path.join(workdir, 'covers'))
+        stored = store.get(store.add(cover)['id'])
+        return lambda: file_steganography.encode_file_to_image(stored, payload, out, profile, tiled=False)
+    if stage in ('decode_text_from_image', 'decode_file_from_image'):
+        file_steganography.encode_file_to_image(cover, payload, out, tiled=False)
+        module = text_steganography if stage == 'decode_text_from_image' else file_steganography
+        return lambda: getattr(module, stage)(out, tiled=False)
+    if stage == 'decode_file_tiled':
+        file_steganography.encode_file_to_image(cover, payload, out, tiled=True)
+        return lambda: file_steganography.decode_file_from_image(out, tiled=True)
+    if stage in ('encode_chunks_to_images', 'decode_chunks_from_images'):
+        covers = [cover] * covers_needed(size, len(payload))
+        if stage == 'encode_chunks_to_images':
+            return lambda: encode_chunks_to_images(covers, payload, workdir, output_profile=profile)
+        chunks = encode_chunks_to_images(covers, payload, workdir)
+        return lambda: decode_chunks_from_images(chunks)
+
+    if stage == 'encrypt_data':
+        def run():
+            encryption.key_cache.clear()
+            encryption.encrypt_data(payload, PASSWORD)
+        return run
+    if stage == 'decrypt_data':
+        token = encryption.encrypt_data(payload, PASSWORD)
+
+        def run():
+            encryption.key_cache.clear()
+            encryption.decrypt_data(token, PASSWORD)
+        return run
+    if stage == 'decrypt_payload_stream':
+        codec, packed = compression_utils.compress(payload)
+        token = encryption.encrypt_data(pack_payload(packed, PAYLOAD_FILE, codec, 'payload.bin'), PASSWORD)
+
+        def run():
+            encryption.key_cache.clear()
+            _, _, chunks = stream_payload(encryption.decrypt_stream(token, PASSWORD))
+            for _ in chunks:
+                pass
+        return run
+    if stage == 'zip_text':
+        text = payload.decode('latin-1')
+        return lambda: compression_utils.zip_text(text)
+    if stage == 'zip_file':
+        path = os.path.join(workdir, 'payload.bin')
+        with open(path, 'wb') as f:
+            f.write(payload)
+        return lambda: compression_utils.zip_file(path)
+    if stage == 'unzip_bytes':
+        archive = compression_utils.zip_text(payload.decode('latin-1'))
+        return lambda: compression_utils.unzip_bytes(archive)
+    if stage == 'compress':
+        return lambda: compression_utils.compress(payload)
+    if stage == 'decompress':
+        codec, packed = compression_utils.compress(payload)
+        return lambda: compression_utils.decompress(packed, codec)
+    if stage in ('parity_encode', 'parity_recover'):
+        k, m = PARITY_SHARDS
+        shard = -(-len(payload) // k)
+        shards = [payload[i * shard:(i + 1) * shard] for i in range(k)]
+        if stage == 'parity_encode':
+            return lambda: fec.encode_parity(shards, m, shard)
+        parity = dict(enumerate(fec.encode_parity(shards, m, shard)))
+        intact = {i: data for i, data in enumerate(shards) if i >= m}  # the first m data chunks are lost
+        return lambda: fec.recover(k, m, shard, intact, parity)
+    raise ValueError(f"Unknown stage {stage}")
+
+
+def max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def output_size(written):
+    paths = [written] if isinstance(written, str) else written
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def run_case(stage, cover, size, length, repeat, profile, queue):
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            payload = make_payload(length)
+            thunk = build_stage(stage, cover, size, payload, workdir, profile)
+            rss_before = max_rss_mb()
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                written = thunk()
+                times.append(time.perf_counter() - start)
+            output_bytes = output_size(written) if stage in ENCODE_STAGES else None
+        queue.put({'wall_s': min(times), 'peak_rss_mb': max_rss_mb(), 'rss_growth_mb': max_rss_mb() - rss_before,
+                   'output_bytes': output_bytes})
+    except Exception as e:
+        queue.put({'error': f'{type(e).__name__}: {e}'})
+
+
+def measure(stage, cover, size, length, repeat, profile):
+    # Fresh process per case so ru_maxrss reflects this stage only
+    ctx = multiprocessing.get_context('fork' if sys.platform.startswith('linux') else 'spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_case, args=(stage, cover, size, length, repeat, profile, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    if 'error' in result:
+        raise RuntimeError(f"{stage} failed: {result['error']}")
+
+    wall = result['wall_s']
+    pixels = size[0] * size[1] if size else 0
+    if stage in MULTI_IMAGE_STAGES:
+        pixels *= covers_needed(size, length)
+    result.update({
+        'stage': stage,
+        'image': f'{size[0]}x{size[1]}' if size else None,
+        'payload_bytes': length,
+        'profile': profile if stage in ENCODE_STAGES else None,
+        'payload_mb_s': (length / (1024 * 1024)) / wall if wall else None,
+        'megapixels_s': (pixels / 1e6) / wall if pixels and wall else None,
+    })
+    return result
+
+
+def cases(preset, stages, profiles):
+    for length in preset['payloads']:
+        for stage in stages:
+            if stage in PAYLOAD_STAGES:
+                yield stage, None, length, None
+                continue
+            for size in preset['images']:
+                if stage == 'image_load' and length != preset['payloads'][0]:
+                    continue
+                if stage in SINGLE_IMAGE_STAGES and covers_needed(size, length) > 1:
+                    continue
+                if stage in MULTI_IMAGE_STAGES and covers_needed(size, length) > MAX_COVERS:
+                    continue
+                for profile in (profiles if stage in ENCODE_STAGES else [DEFAULT_PNG_PROFILE]):
+                    yield stage, size, length, profile
+
+
+# --- Reporting --------------------------------------------------------------
+
+def case_key(result):
+    return result['stage'], result['image'], result['payload_bytes'], result.get('profile')
+
+
+def compare(results, baseline, threshold):
+    # Return the cases whose wall time regressed by more than `threshold`
+    previous = {case_key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if not old or not old['wall_s']:
+            continue
+        change = result['wall_s'] / old['wall_s'] - 1
+        if change > threshold:
+            regressions.append((result, old, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--stages', nargs='+', choices=IMAGE_STAGES + PAYLOAD_STAGES,
+                        default=IMAGE_STAGES + PAYLOAD_STAGES)
+    parser.add_argument('--profiles', nargs='+', choices=list(PNG_PROFILES), default=list(PNG_PROFILES),
+                        help='PNG output profiles to run the encoder stages with')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case; the fastest is kept')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--compare', help='baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown, e.g. 0.10 = 10%%')
+    parser.add_argument('--cover-dir', help='where synthetic covers are cached (default: temp dir)')
+    args = parser.parse_args(argv)
+
+    preset = PRESETS[args.preset]
+    cover_dir = args.cover_dir or tempfile.mkdtemp(prefix='stego-bench-')
+    os.makedirs(cover_dir, exist_ok=True)
+    covers = {size: make_cover(size, cover_dir) for size in preset['images']}
+
+    results = []
+    for stage, size, length, profile in cases(preset, args.stages, args.profiles):
+        result = measure(stage, covers.get(size), size, length, args.repeat, profile)
+        results.append(result)
+        rate = f"{result['payload_mb_s']:.2f} MB/s" if result['payload_mb_s'] else '-'
+        output = f"{result['output_bytes'] / 1024:10.1f} KiB" if result['output_bytes'] else ''
+        print(f"{stage:28} {result['image'] or '-':>10} {length:>11} B {result['profile'] or '':>9} "
+              f"{result['wall_s'] * 1000:10.2f} ms  {rate:>14}  {result['peak_rss_mb']:8.1f} MB {output}")
+
+    report = {
+        'meta': {
+            'preset': args.preset,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pillow': Image.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for result, old, change in regressions:
+            print(f"REGRESSION {result['stage']} {result['image'] or '-'} {result['payload_bytes']} B {result['profile'] or ''}: "
+                  f"{old['wall_s'] * 1000:.2f} ms -> {result['wall_s'] * 1000:.2f} ms (+{change:.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions above {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
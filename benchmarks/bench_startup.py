@@ -0,0 +1,98 @@
+"""Startup-time benchmarks: what a fresh interpreter pays before real work.
+
+Each case runs in a new Python process, like an autoscaled worker or a
+one-off CLI call. It records the time spent importing (and, for capacity,
+answering one query) and the total process wall time, plus which heavy
+dependencies ended up loaded.
+
+    python benchmarks/bench_startup.py --repeat 10 --output startup.json
+
+The 'eager' case imports what `import steganography` used to load
+(cryptography, NumPy, Pillow and the encoders), for comparison with the
+lazy cases.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['numpy', 'PIL', 'cryptography', 'flask']
+
+CASES = {
+    'package': 'import steganography',
+    'capacity': (
+        'from steganography.capacity import capacity_for_size, plan_capacity\n'
+        'plan_capacity(64 * 1024, [capacity_for_size(1920, 1080)] * 4, chunked=True)'
+    ),
+    'chunk_header': 'from steganography.formats import unpack_chunk_header',
+    'cli': 'from steganography import cli',
+    'encoder': 'from steganography import encode_file_to_image',
+    'eager': (
+        'import cryptography.hazmat.primitives.ciphers.aead, cryptography.hazmat.primitives.kdf.pbkdf2\n'
+        'from steganography import encryption, file_steganography, text_steganography'
+    ),
+    'app': 'import app',
+}
+
+# Runs in the child: time the case's code and report loaded heavy modules
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+exec(compile({code!r}, '<case>', 'exec'))
+elapsed = time.perf_counter() - started
+print(json.dumps({{'import_s': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def run_case(name, repeat):
+    code = CHILD.format(code=CASES[name], heavy=HEAVY_MODULES)
+    imports, walls = [], []
+    loaded = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+        walls.append(time.perf_counter() - started)
+        if proc.returncode:
+            raise RuntimeError(f"{name} failed: {proc.stderr.strip().splitlines()[-1]}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        imports.append(result['import_s'])
+        loaded = result['loaded']
+    return {
+        'case': name,
+        'import_ms_min': min(imports) * 1000,
+        'import_ms_median': statistics.median(imports) * 1000,
+        'process_ms_median': statistics.median(walls) * 1000,
+        'loaded': loaded,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=5, help='processes per case')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    args = parser.parse_args(argv)
+
+    # Warm the bytecode cache so the first case is not penalised
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', 'steganography', 'app.py'], cwd=ROOT, check=False)
+
+    results = []
+    print(f"{'case':<14}{'import min':>12}{'median':>10}{'process':>10}  loaded")
+    for name in args.cases:
+        result = run_case(name, args.repeat)
+        results.append(result)
+        print(f"{name:<14}{result['import_ms_min']:>10.1f}ms{result['import_ms_median']:>8.1f}ms"
+              f"{result['process_ms_median']:>8.1f}ms  {', '.join(result['loaded']) or '-'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
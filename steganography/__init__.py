@@ -1,3 +1,43 @@
-from .encryption import encrypt_data, decrypt_data
-from .text_steganography import encode_text_to_image
-from .file_steganography import encode_file_to_image
\ No newline at end of file
+import importlib
+
+# The public API is loaded lazily: importing the package is free, and each
+# name imports its module on first access. Capacity planning and header
+# parsing (capacity, formats, payload) need neither NumPy, Pillow nor
+# cryptography; the encoders pull in NumPy and Pillow, and encryption loads
+# cryptography only when something is actually encrypted or decrypted.
+_EXPORTS = {
+    'encryption': ('encrypt_data', 'decrypt_data', 'encrypt_stream', 'decrypt_stream', 'encrypted_size'),
+    'text_steganography': ('encode_text_to_image', 'decode_text_from_image'),
+    'file_steganography': ('encode_file_to_image', 'decode_file_from_image'),
+    'multi_image_steganography': ('encode_chunks_to_images', 'decode_chunks_from_images', 'calculate_capacity',
+                                  'read_chunk_header'),
+    'capacity': ('capacity_for_size', 'plan_capacity', 'read_image_size', 'required_bytes', 'stream_capacity'),
+    'formats': ('DEFAULT_MODE', 'DEFAULT_PNG_PROFILE', 'PNG_PROFILES', 'ChunkHeader', 'EmbedMode',
+                'unpack_chunk_header'),
+    'payload': ('pack_payload', 'read_payload', 'stream_payload', 'unpack_payload'),
+    'cover_store': ('CoverStore',),
+    'result_cache': ('ResultCache',),
+    'tiles': ('embed_bytes_tiled', 'extract_bytes_tiled'),
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+_SUBMODULES = {
+    'capacity', 'cli', 'compression_utils', 'cover_store', 'embedding', 'encryption', 'fec', 'file_steganography',
+    'formats', 'ingest', 'jobs', 'metrics', 'multi_image_steganography', 'payload', 'result_cache',
+    'text_steganography', 'tiles',
+}
+
+__all__ = sorted(_MODULES)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{_MODULES[name]}', __name__), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | _SUBMODULES)
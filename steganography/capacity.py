@@ -0,0 +1,159 @@
+import struct
+from collections import namedtuple
+from .encryption import encrypted_size
+from .formats import CHUNK_HEADER_PIXELS, DEFAULT_MODE, LENGTH_HEADER_SIZE, MAX_SHARDS
+
+# Capacity planning without encrypting the payload or decoding any pixels.
+# Ciphertext size follows from the plaintext size and the fixed container
+# overhead; cover dimensions are read from the image header bytes.
+# `chunked` sizes for multi-image chunks, where each cover gives up its
+# chunk-header pixels and there is no shared length header. With `parity`
+# chunks, every chunk has the same size (see plan_shards).
+
+CapacityPlan = namedtuple('CapacityPlan', 'required_bytes available_bytes fits recommended more_needed')
+
+
+def required_bytes(payload_length: int, chunked: bool = False) -> int:
+    # Bytes embedded for a plaintext payload: [length header +] encrypted container
+    size = encrypted_size(payload_length)
+    return size if chunked else LENGTH_HEADER_SIZE + size
+
+
+def capacity_for_size(width: int, height: int, mode=DEFAULT_MODE, chunked: bool = False) -> int:
+    # Payload bytes one cover holds in the given embedding mode
+    slots = mode.capacity(width, height, CHUNK_HEADER_PIXELS if chunked else None)
+    return (slots * mode.bits) // 8
+
+
+def read_image_size(stream):
+    """Return (width, height) from an image stream's header bytes.
+
+    PNG, GIF, BMP and JPEG headers are parsed directly; anything else falls
+    back to Pillow's lazy open, which also stops at the header. The stream
+    position is restored afterwards. Raises ValueError if no size can be
+    read (not an image, or a truncated header).
+    """
+    pos = stream.tell()
+    try:
+        head = stream.read(26)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR' and len(head) >= 24:
+            return struct.unpack('>II', head[16:24])
+        if head[:4] == b'GIF8' and len(head) >= 10:
+            return struct.unpack('<HH', head[6:10])
+        if head[:2] == b'BM' and len(head) >= 26:
+            width, height = struct.unpack('<ii', head[18:26])
+            return width, abs(height)
+        if head[:2] == b'\xff\xd8':
+            stream.seek(pos + 2)
+            size = _jpeg_size(stream)
+            if size:
+                return size
+        stream.seek(pos)
+        from PIL import Image  # only for formats parsed above
+        try:
+            return Image.open(stream).size
+        except OSError as e:
+            raise ValueError("Not a readable image (unknown format or truncated header).") from e
+    finally:
+        stream.seek(pos)
+
+
+def _jpeg_size(stream):
+    # Walk marker segments up to the first start-of-frame; None if the
+    # segments are cut short or malformed
+    while True:
+        marker = stream.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:
+            stream.seek(-1, 1)  # fill byte
+            continue
+        if code in (0x01, 0xD8) or 0xD0 <= code <= 0xD7:
+            continue
+        segment = stream.read(2)
+        if len(segment) < 2:
+            return None
+        (length,) = struct.unpack('>H', segment)
+        if length < 2:
+            return None
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            frame = stream.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack('>xHH', frame)
+            return width, height
+        stream.seek(length - 2, 1)
+
+
+def stream_capacity(stream, mode=DEFAULT_MODE, chunked: bool = False) -> int:
+    return capacity_for_size(*read_image_size(stream), mode, chunked)
+
+
+def recommend_covers(required: int, capacities):
+    """Pick the fewest covers whose combined capacity holds `required` bytes.
+
+    Returns cover indices in their original order, or None if even all of
+    them together are too small.
+    """
+    order = sorted(range(len(capacities)), key=lambda i: capacities[i], reverse=True)
+    chosen = []
+    total = 0
+    for i in order:
+        if total >= required:
+            break
+        chosen.append(i)
+        total += capacities[i]
+    if total < required:
+        return None
+    if not chosen:
+        return []
+
+    # Same count, but swap the last pick for the smallest cover that still fits
+    remaining = required - (total - capacities[chosen[-1]])
+    spare = [i for i in order if i not in chosen[:-1] and capacities[i] >= remaining]
+    chosen[-1] = min(spare, key=lambda i: capacities[i])
+    return sorted(chosen)
+
+
+def plan_shards(length: int, capacities, parity: int):
+    """Choose covers for a payload protected by `parity` parity chunks.
+
+    Every chunk has the same size, so the fewest covers are the largest
+    ones: n covers fit when the n-th largest holds ceil(length / (n - parity))
+    bytes. Returns (cover indices in their original order, chunk size), or
+    None if no split fits.
+    """
+    order = sorted(range(len(capacities)), key=lambda i: capacities[i], reverse=True)
+    for n in range(parity + 1, min(len(order), MAX_SHARDS) + 1):
+        shard = -(-length // (n - parity))
+        if capacities[order[n - 1]] > 0 and capacities[order[n - 1]] >= shard:
+            return sorted(order[:n]), shard
+    return None
+
+
+def plan_capacity(payload_length: int, capacities, chunked: bool = False, parity: int = 0) -> CapacityPlan:
+    required = required_bytes(payload_length, chunked)
+    available = sum(capacities)
+    if parity:
+        return _plan_parity(required, available, capacities, parity)
+    recommended = recommend_covers(required, capacities)
+
+    more_needed = 0
+    if recommended is None:
+        average = available / len(capacities) if capacities else 0
+        more_needed = int((required - available) / average) + 1 if average else None
+    return CapacityPlan(required, available, recommended is not None, recommended, more_needed)
+
+
+def _plan_parity(required, available, capacities, parity):
+    # Required bytes include the parity chunks once a split is found
+    shards = plan_shards(required, capacities, parity)
+    if shards is not None:
+        recommended, shard = shards
+        return CapacityPlan(required + parity * shard, available, True, recommended, 0)
+    # Estimate with more covers of average size
+    average = available // len(capacities) if capacities else 0
+    more_needed = next((n for n in range(1, MAX_SHARDS) if plan_shards(required, list(capacities) + [average] * n, parity)),
+                       None) if average else None
+    return CapacityPlan(required, available, False, None, more_needed)
@@ -0,0 +1,365 @@
+"""Command-line batch encoder/decoder for directories of images.
+
+    python -m steganography encode 'covers/*.png' --text "© Example" -o marked/
+    python -m steganography decode 'marked/**/*.png' -o decoded/ --summary report.json
+    python -m steganography capacity photos/ --payload-size 4096
+    python -m steganography multi encode 'covers/*.png' --file secret.pdf --parity 1 -o chunks/
+    python -m steganography multi decode 'chunks/*.png' -o decoded/
+
+Inputs are paths, directories (their image files) or glob patterns, with
+** matching subdirectories. Images are embedded and extracted in a worker
+pool (--workers). Encoding encrypts in the main process, with one salt
+for the whole batch (each output still gets its own nonces), so the key is
+derived once. Decoding decrypts in the workers, so the key derivation for
+each new salt runs in parallel; each worker caches the keys it derives, so
+images from one batch cost one derivation per worker. Decoding without
+--output-dir only audits the images.
+
+Progress is streamed to stderr, one line per image. The JSON summary, with
+per-file timings, goes to stdout or to --summary; the exit status is 1 if
+any file failed.
+"""
+import argparse
+import functools
+import getpass
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+
+from . import encryption
+from .capacity import capacity_for_size, read_image_size, required_bytes
+from .compression_utils import CODECS, compress
+from .formats import DEFAULT_PNG_PROFILE, PNG_PROFILES, EmbedMode
+from .payload import FLAG_MULTI_CHUNK, PAYLOAD_FILE, PAYLOAD_TEXT, pack_payload, read_payload
+
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.gif', '.jpg', '.jpeg', '.tif', '.tiff', '.webp')
+
+
+def expand_inputs(patterns):
+    # Paths in argument order, each file once
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))
+                       if name.lower().endswith(IMAGE_EXTENSIONS)]
+        elif glob.has_magic(pattern):
+            matches = [path for path in sorted(glob.glob(pattern, recursive=True)) if os.path.isfile(path)]
+        else:
+            matches = [pattern]  # a missing file is reported with the results
+        paths.extend(matches)
+    return list(dict.fromkeys(paths))
+
+
+def _output_names(paths, ext):
+    # <stem><ext> per input, numbered when stems repeat across directories
+    seen = {}
+    names = []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        names.append(f'{stem}{ext}' if seen[stem] == 1 else f'{stem}_{seen[stem]}{ext}')
+    return names
+
+
+def _log_to_stderr(verbose):
+    # Called in each worker too: pool processes do not inherit the handler.
+    # Returns the handler it added, if any.
+    library = logging.getLogger('steganography')
+    if not verbose or library.handlers:
+        return None
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(name)s: %(message)s'))
+    library.addHandler(handler)
+    library.setLevel(logging.DEBUG)
+    return handler
+
+
+def _start_pool(workers):
+    # submit(func, *args) on the library's shared pool, imported here so
+    # `capacity` never loads NumPy; None to run serially
+    if not workers or workers <= 1:
+        return None
+    from .multi_image_steganography import pool_submit, process_pool
+    return functools.partial(pool_submit, workers) if process_pool(workers) else None
+
+
+def _run_batch(tasks, workers, report):
+    """Run (name, func, args, finish) tasks; yield one result dict per task.
+
+    `func(*args)` runs in the pool and `finish(value)` back in this
+    process, returning extra summary fields (without a `finish`, the
+    value itself is those fields); both count towards the file's time.
+    At most two tasks per worker are in flight, so inputs are prepared as
+    the pool drains.
+    """
+    submit = _start_pool(workers)
+    limit = workers * 2 if submit else 1
+    pending = deque()
+
+    def collect():
+        name, run, finish = pending.popleft()
+        entry = {'input': name, 'status': 'ok'}
+        seconds = 0.0
+        try:
+            value, seconds = run()
+            started = time.perf_counter()
+            entry.update((finish(value) if finish else value) or {})
+            seconds += time.perf_counter() - started
+        except Exception as e:
+            entry = {'input': name, 'status': 'error', 'error': str(e) or type(e).__name__}
+        entry['seconds'] = round(seconds, 6)
+        report(entry)
+        return entry
+
+    for name, func, args, finish in tasks:
+        run = submit(_timed, func, *args).result if submit else functools.partial(_timed, func, *args)
+        pending.append((name, run, finish))
+        if len(pending) >= limit:
+            yield collect()
+    while pending:
+        yield collect()
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    value = func(*args)
+    return value, time.perf_counter() - started
+
+
+# --- Workers ----------------------------------------------------------------
+# Run in the pool. The encoders are imported here, so `capacity` never
+# loads NumPy or Pillow.
+
+def _embed_worker(cover, encrypted, out_path, profile, mode, verbose):
+    from . import file_steganography
+    _log_to_stderr(verbose)
+    file_steganography.encode_file_to_image(cover, encrypted, out_path, profile, mode)
+    return os.path.getsize(out_path)
+
+
+def _decode_worker(image, password, output_dir, stem, verbose):
+    # Extract, decrypt and (if asked) write one payload; returns its summary
+    # fields, with the key derivations this file cost in this process
+    from . import file_steganography
+    _log_to_stderr(verbose)
+    derived = encryption.key_cache_stats()['misses']
+    token = file_steganography.decode_file_from_image(image)
+    entry = _write_decoded(output_dir, stem, encryption.decrypt_data(token, password))
+    entry['key_derivations'] = encryption.key_cache_stats()['misses'] - derived
+    return entry
+
+
+# --- Commands ---------------------------------------------------------------
+
+def _payload(args, flags=0):
+    # Headered, compressed plaintext, as the web app builds it
+    if args.file:
+        with open(args.file, 'rb') as f:
+            codec, packed = compress(f.read(), args.compression)
+        return pack_payload(packed, PAYLOAD_FILE, codec, os.path.basename(args.file), flags)
+    codec, packed = compress(args.text.encode('utf-8'), args.compression)
+    return pack_payload(packed, PAYLOAD_TEXT, codec, flags=flags)
+
+
+def _password(args):
+    return args.password or os.environ.get('STEGO_PASSWORD') or getpass.getpass('Password: ')
+
+
+def _write_decoded(output_dir, stem, payload):
+    # Returns the summary fields for a decrypted payload, writing it if asked
+    payload_type, filename, content = read_payload(payload)
+    entry = {'payload_type': 'text' if payload_type == PAYLOAD_TEXT else 'file', 'payload_bytes': len(content)}
+    if filename:
+        entry['filename'] = filename
+    if output_dir:
+        name = f'{stem}.txt' if payload_type == PAYLOAD_TEXT else f'{stem}_{os.path.basename(filename) or "decoded_file"}'
+        entry['output'] = os.path.join(output_dir, name)
+        with open(entry['output'], 'wb') as f:
+            f.write(content)
+    return entry
+
+
+def cmd_encode(args, report):
+    covers = expand_inputs(args.inputs)
+    payload = _payload(args)
+    password = _password(args)
+    mode = EmbedMode(args.bits, args.channels)
+    os.makedirs(args.output_dir, exist_ok=True)
+    # One salt for the whole batch, so the key is derived once
+    salt = os.urandom(encryption.PBKDF2_SALT_SIZE)
+
+    def tasks():
+        for cover, name in zip(covers, _output_names(covers, '.png')):
+            out_path = os.path.join(args.output_dir, name)
+            encrypted = encryption.encrypt_data(payload, password, salt=salt)
+            finish = lambda size, out_path=out_path: {'output': out_path, 'output_bytes': size}
+            yield cover, _embed_worker, (cover, encrypted, out_path, args.profile, mode, args.verbose), finish
+
+    return list(_run_batch(tasks(), args.workers, report))
+
+
+def cmd_decode(args, report):
+    images = expand_inputs(args.inputs)
+    password = _password(args)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    def tasks():
+        for image, stem in zip(images, _output_names(images, '')):
+            yield image, _decode_worker, (image, password, args.output_dir, stem, args.verbose), None
+
+    return list(_run_batch(tasks(), args.workers, report))
+
+
+def cmd_capacity(args, report):
+    # Image headers only; nothing is decoded or encrypted
+    mode = EmbedMode(args.bits, args.channels)
+    results = []
+    for image in expand_inputs(args.inputs):
+        started = time.perf_counter()
+        entry = {'input': image, 'status': 'ok'}
+        try:
+            with open(image, 'rb') as f:
+                width, height = read_image_size(f)
+            entry.update(width=width, height=height, capacity_bytes=capacity_for_size(width, height, mode))
+            if args.payload_size is not None:
+                entry['fits'] = required_bytes(args.payload_size) <= entry['capacity_bytes']
+        except Exception as e:
+            entry = {'input': image, 'status': 'error', 'error': str(e) or type(e).__name__}
+        entry['seconds'] = round(time.perf_counter() - started, 6)
+        report(entry)
+        results.append(entry)
+    return results
+
+
+def cmd_multi(args, report):
+    from .multi_image_steganography import decode_chunks_from_images, encode_chunks_to_images
+    images = expand_inputs(args.inputs)
+    password = _password(args)
+    started = time.perf_counter()
+    entry = {'input': images, 'status': 'ok'}
+    try:
+        if args.action == 'encode':
+            os.makedirs(args.output_dir, exist_ok=True)
+            encrypted = encryption.encrypt_data(_payload(args, FLAG_MULTI_CHUNK), password)
+            mode = EmbedMode(args.bits, args.channels)
+            outputs = encode_chunks_to_images(images, encrypted, args.output_dir, workers=args.workers,
+                                              output_profile=args.profile, mode=mode, parity=args.parity)
+            entry.update(output=outputs, payload_bytes=len(encrypted))
+        else:
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+            merged = decode_chunks_from_images(images, workers=args.workers)
+            entry.update(_write_decoded(args.output_dir, 'decoded', encryption.decrypt_data(merged, password)))
+    except Exception as e:
+        entry = {'input': images, 'status': 'error', 'error': str(e) or type(e).__name__}
+    entry['seconds'] = round(time.perf_counter() - started, 6)
+    report(entry)
+    return [entry]
+
+
+# --- Entry point ------------------------------------------------------------
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m steganography', description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def common(sub, workers=True):
+        sub.add_argument('inputs', nargs='+', help='image paths, directories or glob patterns')
+        sub.add_argument('--summary', help='write the JSON summary here instead of stdout')
+        sub.add_argument('--verbose', action='store_true', help='log library progress to stderr')
+        if workers:
+            sub.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+
+    def mode(sub):
+        sub.add_argument('--bits', type=int, default=2, help='low bits used per channel (1-4)')
+        sub.add_argument('--channels', default='RGB', help="channels carrying data, e.g. 'RGB' or 'RGBA'")
+
+    def secret(sub):
+        sub.add_argument('--password', help='defaults to $STEGO_PASSWORD, else prompted')
+
+    def payload(sub, required=True):
+        group = sub.add_mutually_exclusive_group(required=required)
+        group.add_argument('--text', help='text to embed')
+        group.add_argument('--file', help='file to embed')
+        sub.add_argument('--compression', default='auto', choices=['auto'] + list(CODECS))
+        sub.add_argument('--profile', default=DEFAULT_PNG_PROFILE, choices=list(PNG_PROFILES),
+                         help='PNG output profile')
+
+    encode = commands.add_parser('encode', help='embed one payload into every cover')
+    common(encode)
+    mode(encode)
+    secret(encode)
+    payload(encode)
+    encode.add_argument('-o', '--output-dir', required=True)
+
+    decode = commands.add_parser('decode', help='extract and decrypt every image')
+    common(decode)
+    secret(decode)
+    decode.add_argument('-o', '--output-dir', help='write decoded payloads here (default: audit only)')
+
+    capacity = commands.add_parser('capacity', help='report what each cover can hold')
+    common(capacity, workers=False)
+    mode(capacity)
+    capacity.add_argument('--payload-size', type=int, help='also check whether this many plaintext bytes fit')
+
+    multi = commands.add_parser('multi', help='spread one payload over several images, or rebuild it')
+    multi.add_argument('action', choices=['encode', 'decode'])
+    common(multi)
+    mode(multi)
+    secret(multi)
+    payload(multi, required=False)
+    multi.add_argument('--parity', type=int, default=0, help='parity chunks (images that may be lost)')
+    multi.add_argument('-o', '--output-dir')
+    return parser
+
+
+COMMANDS = {'encode': cmd_encode, 'decode': cmd_decode, 'capacity': cmd_capacity, 'multi': cmd_multi}
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'multi' and args.action == 'encode' and not (args.output_dir and (args.text or args.file)):
+        parser.error('multi encode needs --output-dir and --text or --file')
+
+    count = [0]
+
+    def report(entry):
+        count[0] += 1
+        detail = entry.get('error') or entry.get('output') or ''
+        print(f"[{count[0]}] {entry['status']:5} {entry['seconds']:8.3f}s  {entry['input']}  {detail}",
+              file=sys.stderr, flush=True)
+
+    started = time.perf_counter()
+    handler = _log_to_stderr(args.verbose)
+    try:
+        files = COMMANDS[args.command](args, report)
+    finally:
+        if handler:
+            logging.getLogger('steganography').removeHandler(handler)
+            logging.getLogger('steganography').setLevel(logging.NOTSET)
+    failed = sum(1 for entry in files if entry['status'] != 'ok')
+    derivations = encryption.key_cache_stats()['misses']
+    if args.command == 'decode':
+        # Decoding derives keys in the workers, which report them per file
+        derivations = sum(entry.get('key_derivations', 0) for entry in files)
+    summary = {
+        'command': args.command if args.command != 'multi' else f'multi {args.action}',
+        'files': files,
+        'ok': len(files) - failed,
+        'failed': failed,
+        'seconds': round(time.perf_counter() - started, 6),
+        'key_derivations': derivations,
+    }
+    text = json.dumps(summary, indent=2)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if failed else 0
@@ -2,6 +2,16 @@
 import os
 import zipfile
 import io
+import bz2
+import lzma
+import zlib
+from . import metrics
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
 
 def zip_file(file_path: str) -> bytes:
     buffer = io.BytesIO()
@@ -11,6 +21,14 @@ def zip_file(file_path: str) -> bytes:
     return buffer.getvalue()
 
 
+def zip_bytes(data: bytes, filename: str) -> bytes:
+    # Same archive layout as zip_file, built from in-memory contents
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zipf:
+        zipf.writestr(filename, data)
+    return buffer.getvalue()
+
+
 
 def zip_text(text: str, filename: str = "text.txt") -> bytes:
     memory_file = io.BytesIO()
@@ -23,7 +41,6 @@ def zip_text(text: str, filename: str = "text.txt") -> bytes:
 def unzip_bytes(zip_bytes: bytes, extract_to: str = None) -> dict:
     result = {}
     with zipfile.ZipFile(io.BytesIO(zip_bytes), 'r') as zf:
-        print("Archive contents:",zf.namelist())
         if extract_to:
             zf.extractall(extract_to)
             for name in zf.namelist():
@@ -33,3 +50,149 @@ def unzip_bytes(zip_bytes: bytes, extract_to: str = None) -> dict:
             for name in zf.namelist():
                 result[name] = zf.read(name)
     return result
+
+
+# --- Codec layer -----------------------------------------------------------
+# Payloads are compressed with a single codec whose ID is recorded in the
+# payload header, so decoding never has to guess or trial-unzip.
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZIP = 1  # legacy single-member ZIP archive (zip_text / zip_file)
+COMPRESSION_ZLIB = 2
+COMPRESSION_LZMA = 3
+COMPRESSION_BZ2 = 4
+COMPRESSION_ZSTD = 5
+
+# Selectable codecs: name -> (codec ID, compress function)
+CODECS = {
+    'none': (COMPRESSION_NONE, bytes),
+    'zlib-1': (COMPRESSION_ZLIB, lambda data: zlib.compress(data, 1)),
+    'zlib-6': (COMPRESSION_ZLIB, lambda data: zlib.compress(data, 6)),
+    'zlib-9': (COMPRESSION_ZLIB, lambda data: zlib.compress(data, 9)),
+    'lzma': (COMPRESSION_LZMA, lzma.compress),
+    'bz2': (COMPRESSION_BZ2, bz2.compress),
+}
+if zstandard is not None:
+    CODECS['zstd'] = (COMPRESSION_ZSTD, lambda data: zstandard.ZstdCompressor(level=3).compress(data))
+
+DEFAULT_CODEC = 'auto'
+AUTO_CODEC = 'zstd' if zstandard is not None else 'zlib-6'
+
+# Signatures of formats that are already compressed (JPEG, PNG, GIF, WebP,
+# ZIP-based documents such as DOCX/XLSX, gzip, bzip2, xz, zstd, 7z, RAR,
+# PDF, MP3, MP4/MOV, Ogg)
+_COMPRESSED_SIGNATURES = (
+    b'\xff\xd8\xff', b'\x89PNG', b'GIF8', b'PK\x03\x04', b'\x1f\x8b', b'BZh',
+    b'\xfd7zXZ\x00', b'\x28\xb5\x2f\xfd', b'7z\xbc\xaf\x27\x1c', b'Rar!',
+    b'%PDF', b'ID3', b'OggS',
+)
+SAMPLE_SIZE = 64 * 1024
+INCOMPRESSIBLE_RATIO = 0.9
+
+
+def looks_compressed(data: bytes) -> bool:
+    """Guess whether compressing `data` is worth it.
+
+    Known compressed formats are recognised by their signature; anything
+    else is judged by how well a few samples deflate at level 1.
+    """
+    head = bytes(data[:12])
+    if head.startswith(_COMPRESSED_SIGNATURES):
+        return True
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP' or head[4:8] == b'ftyp':
+        return True
+
+    if len(data) <= 3 * SAMPLE_SIZE:
+        samples = [bytes(data)]
+    else:
+        middle = len(data) // 2
+        samples = [bytes(data[:SAMPLE_SIZE]), bytes(data[middle:middle + SAMPLE_SIZE]), bytes(data[-SAMPLE_SIZE:])]
+    sampled = sum(len(s) for s in samples)
+    if not sampled:
+        return True
+    deflated = sum(len(zlib.compress(s, 1)) for s in samples)
+    return deflated / sampled > INCOMPRESSIBLE_RATIO
+
+
+def compress(data: bytes, codec: str = DEFAULT_CODEC):
+    """Compress `data` with the named codec and return (codec ID, bytes).
+
+    'auto' stores already-compressed data as-is and otherwise uses
+    AUTO_CODEC; any codec that fails to shrink the data falls back to none.
+    """
+    with metrics.span('compress', payload_bytes=len(data)) as stage:
+        if codec == 'auto':
+            codec = 'none' if looks_compressed(data) else AUTO_CODEC
+        if codec not in CODECS:
+            raise ValueError(f"Unknown compression codec '{codec}'.")
+
+        codec_id, compress_fn = CODECS[codec]
+        packed = compress_fn(data)
+        if codec_id != COMPRESSION_NONE and len(packed) >= len(data):
+            codec, codec_id, packed = 'none', COMPRESSION_NONE, bytes(data)
+        stage.set(codec=codec, compressed_bytes=len(packed))
+    return codec_id, packed
+
+
+def decompress(data: bytes, codec_id: int) -> bytes:
+    with metrics.span('decompress', codec=codec_id):
+        return _decompress(data, codec_id)
+
+
+def _decompress(data: bytes, codec_id: int) -> bytes:
+    if codec_id == COMPRESSION_NONE:
+        return data
+    if codec_id == COMPRESSION_ZIP:
+        return next(iter(unzip_bytes(data).values()))
+    if codec_id == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    if codec_id == COMPRESSION_LZMA:
+        return lzma.decompress(data)
+    if codec_id == COMPRESSION_BZ2:
+        return bz2.decompress(data)
+    if codec_id == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError("Payload is zstd-compressed but the zstandard package is not installed.")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unknown compression method {codec_id}.")
+
+
+def decompress_stream(chunks, codec_id: int):
+    """Decompress an iterable of byte chunks, yielding output as it is produced.
+
+    Only the legacy ZIP codec needs its whole input; it is buffered and the
+    archive member is then read out in pieces.
+    """
+    if codec_id == COMPRESSION_NONE:
+        yield from chunks
+        return
+    if codec_id == COMPRESSION_ZIP:
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf, zf.open(zf.namelist()[0]) as member:
+            yield from iter(lambda: member.read(SAMPLE_SIZE), b'')
+        return
+
+    decompressor = _decompressor(codec_id)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if hasattr(decompressor, 'flush'):
+        data = decompressor.flush()
+        if data:
+            yield data
+    if not getattr(decompressor, 'eof', True):
+        raise ValueError("Compressed payload is truncated.")
+
+
+def _decompressor(codec_id: int):
+    if codec_id == COMPRESSION_ZLIB:
+        return zlib.decompressobj()
+    if codec_id == COMPRESSION_LZMA:
+        return lzma.LZMADecompressor()
+    if codec_id == COMPRESSION_BZ2:
+        return bz2.BZ2Decompressor()
+    if codec_id == COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError("Payload is zstd-compressed but the zstandard package is not installed.")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unknown compression method {codec_id}.")
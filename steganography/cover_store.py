@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import numpy as np
+from . import metrics
+from .embedding import DEFAULT_MODE, StoredCover, open_image
+
+# Server-side registry of reusable cover images.
+#
+# A cover is decoded and converted to RGB once, at registration, and its
+# pixels are kept as <id>.npy next to a small <id>.json metadata record.
+# Encoders then take a StoredCover, which maps the .npy file instead of
+# decoding a PNG/JPEG per request; capacity and dimensions come from the
+# metadata alone. IDs are derived from the pixel content, so registering
+# the same cover twice returns the existing entry.
+
+COVER_ID_LENGTH = 32
+_COVER_ID = re.compile(r'[0-9a-f]{%d}\Z' % COVER_ID_LENGTH)
+
+
+class CoverStore:
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, cover_id: str, ext: str) -> str:
+        if not _COVER_ID.match(cover_id or ''):
+            raise KeyError(f"Unknown cover ID '{cover_id}'.")
+        return os.path.join(self.root, cover_id + ext)
+
+    def add(self, source, name: str = '') -> dict:
+        """Decode a cover (path, bytes or file-like) and store its RGB pixels.
+
+        Returns the cover's metadata, including its `id`.
+        """
+        with metrics.span('cover_register') as stage:
+            pixels = np.asarray(open_image(source).convert('RGB'))
+            height, width, _ = pixels.shape
+            digest = hashlib.sha256(_size_prefix(width, height))
+            digest.update(pixels.data)
+            cover_id = digest.hexdigest()[:COVER_ID_LENGTH]
+            stage.set(width=width, height=height)
+
+            if os.path.exists(self._path(cover_id, '.json')):
+                return self.metadata(cover_id)
+
+            meta = {
+                'id': cover_id,
+                'name': name,
+                'width': width,
+                'height': height,
+                # In the default embedding mode; see capacity.capacity_for_size
+                'capacity_bytes': DEFAULT_MODE.capacity(width, height) * DEFAULT_MODE.bits // 8,
+            }
+            os.makedirs(self.root, exist_ok=True)
+            # Pixels first, metadata last: an entry exists once its .json does
+            self._write(cover_id, '.npy', lambda f: np.save(f, pixels))
+            self._write(cover_id, '.json', lambda f: f.write(json.dumps(meta).encode()))
+        return meta
+
+    def _write(self, cover_id, ext, write):
+        # Write to a temporary file and rename, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, self._path(cover_id, ext))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def metadata(self, cover_id: str) -> dict:
+        try:
+            with open(self._path(cover_id, '.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f"Unknown cover ID '{cover_id}'.") from None
+
+    def get(self, cover_id: str) -> StoredCover:
+        # Only the metadata is read; pixels are mapped when an encoder loads the cover
+        meta = self.metadata(cover_id)
+        return StoredCover(self._path(cover_id, '.npy'), (meta['width'], meta['height']))
+
+    def list(self):
+        if not os.path.isdir(self.root):
+            return []
+        ids = sorted(name[:-5] for name in os.listdir(self.root) if name.endswith('.json'))
+        return [self.metadata(cover_id) for cover_id in ids if _COVER_ID.match(cover_id)]
+
+    def remove(self, cover_id: str):
+        # Metadata goes first so the entry disappears atomically; encoders that
+        # already mapped the pixels keep their mapping until they finish.
+        meta_path = self._path(cover_id, '.json')
+        if not os.path.exists(meta_path):
+            raise KeyError(f"Unknown cover ID '{cover_id}'.")
+        os.unlink(meta_path)
+        try:
+            os.unlink(self._path(cover_id, '.npy'))
+        except FileNotFoundError:
+            pass
+
+
+def _size_prefix(width: int, height: int) -> bytes:
+    # Dimensions are hashed with the pixels so transposed images differ
+    return f'{width}x{height}:'.encode()
@@ -0,0 +1,369 @@
+import io
+import struct
+from collections import namedtuple
+import numpy as np
+from PIL import Image
+from . import metrics
+from .formats import (
+    BITS_PER_CHANNEL, DEFAULT_MODE, DEFAULT_PNG_PROFILE, HEADER_SYMBOLS, LENGTH_HEADER_SIZE, PNG_PROFILES, EmbedMode,
+)
+
+# Shared LSB core used by the text, file and multi-image encoders; the
+# frame, mode header and PNG profile definitions live in formats.
+STREAM_READ_SIZE = 1 << 20
+
+
+class StoredCover(namedtuple('StoredCover', 'path size')):
+    """A cover whose decoded RGB pixels live in a .npy file (see cover_store).
+
+    Stands in for an image path anywhere an encoder accepts a cover. `size`
+    is (width, height), so capacity is known without touching the pixels;
+    it is small enough to pass to worker processes, which map the file
+    themselves.
+    """
+
+    def pixels(self) -> np.ndarray:
+        # Read-only np.memmap of the (height, width, 3) uint8 pixel array
+        return np.load(self.path, mmap_mode='r')
+
+
+def frame_payload(data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + bytes(data)
+
+
+def bytes_to_symbols(data: bytes, bits: int = BITS_PER_CHANNEL) -> np.ndarray:
+    # One uint8 symbol per channel, most significant bits first
+    return bits_to_symbols(np.unpackbits(np.frombuffer(data, dtype=np.uint8)), bits)
+
+
+def bits_to_symbols(stream: np.ndarray, bits: int = BITS_PER_CHANNEL) -> np.ndarray:
+    # Group a 0/1 array into `bits`-wide symbols, zero-padding the last one
+    pad = -len(stream) % bits
+    if pad:
+        stream = np.concatenate((stream, np.zeros(pad, dtype=np.uint8)))
+    groups = stream.reshape(-1, bits)
+    symbols = groups[:, 0]
+    for i in range(1, bits):
+        symbols = (symbols << 1) | groups[:, i]
+    return symbols
+
+
+def symbols_to_bytes(symbols: np.ndarray, bits: int = BITS_PER_CHANNEL) -> bytes:
+    # Inverse of bytes_to_symbols; trailing pad bits are dropped
+    return pack_symbols(symbols, bits).tobytes()
+
+
+def pack_symbols(symbols: np.ndarray, bits: int = BITS_PER_CHANNEL) -> np.ndarray:
+    # symbols_to_bytes as a uint8 array, for callers that slice or copy it on
+    if bits == 1:
+        return np.packbits(symbols[:len(symbols) - len(symbols) % 8])
+    if 8 % bits == 0:
+        # Whole symbols per byte: shift them together in place instead of
+        # expanding to one array element per bit (8x the payload size)
+        per_byte = 8 // bits
+        groups = symbols[:len(symbols) - len(symbols) % per_byte].reshape(-1, per_byte)
+        packed = groups[:, 0].copy()
+        for i in range(1, per_byte):
+            packed <<= bits
+            packed |= groups[:, i]
+        return packed
+    shifts = np.arange(bits - 1, -1, -1, dtype=np.uint8)
+    stream = ((symbols[:, None] >> shifts) & 1).reshape(-1)
+    return np.packbits(stream[:len(stream) - len(stream) % 8])
+
+
+def channel_capacity(image, mode: EmbedMode = DEFAULT_MODE) -> int:
+    # Number of channel slots (and therefore symbols) an image can hold
+    return mode.capacity(*image.size)
+
+
+def embed_symbols(image, symbols: np.ndarray, mode: EmbedMode = DEFAULT_MODE):
+    """Write `symbols` into the low bits of an image, in place.
+
+    The image must already be in `mode.image_mode`. Non-default modes also
+    write the mode header into the first pixels.
+    """
+    n = len(symbols)
+    if n > channel_capacity(image, mode):
+        raise ValueError("Payload too large to encode in this image.")
+    if n == 0:
+        return image
+
+    with metrics.span('embed', symbols=n, bits=mode.bits):
+        if not mode.is_default:
+            write_symbols(image, bytes_to_symbols(mode.pack()), 0, DEFAULT_MODE)
+        write_symbols(image, symbols, mode.header_pixels, mode)
+    metrics.count('payload_bytes', n * mode.bits // 8, stage='embed')
+    return image
+
+
+def write_symbols(image, symbols, first_pixel: int, mode: EmbedMode = DEFAULT_MODE):
+    # Write symbols from `first_pixel` on, with no capacity check or header.
+    # Only the rows the symbols touch are copied out and pasted back.
+    w, _ = image.size
+    n = len(symbols)
+    per_pixel = len(mode.channels)
+    last_pixel = first_pixel + -(-n // per_pixel)
+    top, bottom = first_pixel // w, -(-last_pixel // w)
+
+    band = np.array(image.crop((0, top, w, bottom)), dtype=np.uint8)
+    write_pixels(band.reshape(-1, band.shape[-1])[first_pixel - top * w:last_pixel - top * w], symbols, mode)
+    image.paste(Image.fromarray(band, image.mode), (0, top))
+
+
+def write_pixels(pixels: np.ndarray, symbols, mode: EmbedMode = DEFAULT_MODE, offset: int = 0):
+    # Write symbols into an (n, channels) pixel array in place, from channel
+    # slot `offset` of its first pixel
+    n = len(symbols)
+    keep = np.uint8(0xFF ^ ((1 << mode.bits) - 1))
+    if len(mode.channels) == pixels.shape[1]:
+        flat = pixels.reshape(-1)
+        flat[offset:offset + n] = (flat[offset:offset + n] & keep) | symbols
+    else:
+        selected = pixels[:, mode.channel_indices].reshape(-1)
+        selected[offset:offset + n] = (selected[offset:offset + n] & keep) | symbols
+        pixels[:, mode.channel_indices] = selected.reshape(-1, len(mode.channels))
+
+
+def read_pixels(pixels: np.ndarray, count: int, mode: EmbedMode = DEFAULT_MODE, offset: int = 0) -> np.ndarray:
+    # Low bits of `count` channel slots of an (n, channels) pixel array, from
+    # slot `offset` of its first pixel
+    if len(mode.channels) != pixels.shape[1]:
+        pixels = pixels[:, mode.channel_indices]
+    return pixels.reshape(-1)[offset:offset + count] & ((1 << mode.bits) - 1)
+
+
+def framed_slice(header: bytes, data, start: int, count: int, bits: int):
+    # Bytes of header + data covering symbols [start, start + count), and
+    # the bit offset of the first symbol within them
+    first_bit = start * bits
+    first = first_bit // 8
+    last = -(-(start + count) * bits // 8)
+    head = header[first:last]
+    body = data[max(first - len(header), 0):max(last - len(header), 0)]
+    return head + bytes(body), first_bit - first * 8
+
+
+def payload_length(data, data_length=None) -> int:
+    # Length of a bytes-like or seekable payload, or the declared length
+    if data_length is not None:
+        return data_length
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, memoryview):
+        return data.nbytes
+    if hasattr(data, 'seek') and data.seekable():
+        pos = data.tell()
+        end = data.seek(0, io.SEEK_END)
+        data.seek(pos)
+        return end - pos
+    raise ValueError("data_length is required for streamed payloads.")
+
+
+def iter_chunks(source, chunk_size: int = STREAM_READ_SIZE):
+    # Yield a bytes-like, file-like or iterable payload as buffer chunks
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast('B')
+        for i in range(0, len(view), chunk_size):
+            yield view[i:i + chunk_size]
+    elif hasattr(source, 'read'):
+        yield from iter(lambda: source.read(chunk_size), b'')
+    else:
+        yield from source
+
+
+class SymbolReader:
+    """Hand out a payload as `bits`-wide symbols, reading the source on demand.
+
+    At most one request's worth of bytes is held in memory, so a caller
+    feeding images one by one never materialises the whole payload.
+    """
+
+    def __init__(self, *sources, bits: int = BITS_PER_CHANNEL):
+        self._chunks = (chunk for source in sources for chunk in iter_chunks(source))
+        self._buffer = memoryview(b'')
+        self._bits = bits
+        self._pending = np.empty(0, dtype=np.uint8)  # unread bits
+
+    def read_bytes(self, size: int) -> bytes:
+        # Up to `size` raw bytes, for callers splitting the payload on byte
+        # boundaries; do not mix with read() once symbols are pending
+        parts = []
+        while size > 0:
+            if not self._buffer:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buffer = memoryview(chunk).cast('B')
+            part, self._buffer = self._buffer[:size], self._buffer[size:]
+            parts.append(part)
+            size -= len(part)
+        return b''.join(parts)
+
+    def read(self, count: int) -> np.ndarray:
+        # Return up to `count` symbols; fewer only once the source is exhausted
+        wanted = count * self._bits
+        needed = wanted - len(self._pending)
+        if needed > 0:
+            fresh = np.unpackbits(np.frombuffer(self.read_bytes(-(-needed // 8)), dtype=np.uint8))
+            self._pending = np.concatenate((self._pending, fresh))
+        out, self._pending = self._pending[:wanted], self._pending[wanted:]
+        return bits_to_symbols(out, self._bits)
+
+
+def open_image(source):
+    # Accept a path, raw image bytes or a file-like object. Stored covers
+    # and already opened images are returned as-is.
+    if isinstance(source, (StoredCover, Image.Image)):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
+
+def load_cover(source, mode: EmbedMode = DEFAULT_MODE):
+    # Open and convert a cover to RGB (RGBA for modes using alpha)
+    if isinstance(source, StoredCover):
+        if mode.image_mode != 'RGB':
+            raise ValueError("Stored covers have no alpha channel.")
+        return _map_cover(source)
+    with metrics.span('image_convert'):
+        image = open_image(source)
+        if mode.image_mode == 'RGBA' and not _has_alpha(image):
+            raise ValueError("Cover image has no alpha channel.")
+        image = image.convert(mode.image_mode)
+    metrics.count('pixels', image.size[0] * image.size[1], stage='image_convert')
+    metrics.count('images', stage='image_convert')
+    return image
+
+
+def _has_alpha(image) -> bool:
+    return 'A' in image.getbands() or 'transparency' in image.info
+
+
+def _map_cover(cover: StoredCover):
+    # Stored pixels are already RGB: no decode or convert, just a copy of the
+    # mapped array into Pillow's buffer. embed_symbols then copies out only
+    # the rows the payload touches; the mapping itself is never written.
+    with metrics.span('cover_map'):
+        image = Image.fromarray(cover.pixels(), 'RGB')
+    metrics.count('pixels', image.size[0] * image.size[1], stage='cover_map')
+    metrics.count('images', stage='cover_map')
+    return image
+
+
+def save_png(image, output=None, profile: str = DEFAULT_PNG_PROFILE):
+    """Save `image` as PNG to a path or file-like object.
+
+    With no output the encoded PNG bytes are returned instead. `profile`
+    names an entry in PNG_PROFILES.
+    """
+    if profile not in PNG_PROFILES:
+        raise ValueError(f"Unknown PNG output profile '{profile}'.")
+    options = PNG_PROFILES[profile]
+    with metrics.span('png_save', profile=profile):
+        if output is None:
+            buffer = io.BytesIO()
+            image.save(buffer, 'PNG', **options)
+            return buffer.getvalue()
+        image.save(output, 'PNG', **options)
+        return output
+
+
+def embed_bytes(image_source, data: bytes, output=None, output_profile: str = DEFAULT_PNG_PROFILE,
+                mode: EmbedMode = DEFAULT_MODE):
+    # Frame the payload, embed it and save the stego image as PNG
+    image = load_cover(image_source, mode)
+    embed_symbols(image, bytes_to_symbols(frame_payload(data), mode.bits), mode)
+    return save_png(image, output, output_profile)
+
+
+def read_symbols(image, start: int, count: int, mode: EmbedMode = DEFAULT_MODE,
+                 header_pixels: int = None) -> np.ndarray:
+    """Return the low bits of channel slots [start, start + count) of an image.
+
+    Slots are counted from the end of the image's header (the mode header
+    unless `header_pixels` says otherwise). Only the rows covering that
+    range are converted.
+    """
+    if header_pixels is None:
+        header_pixels = mode.header_pixels
+    w, h = image.size
+    per_pixel = len(mode.channels)
+    end = min(start + count, mode.capacity(w, h, header_pixels))
+    if end <= start:
+        return np.empty(0, dtype=np.uint8)
+
+    first_pixel = header_pixels + start // per_pixel
+    last_pixel = header_pixels + -(-end // per_pixel)
+    top, bottom = first_pixel // w, -(-last_pixel // w)
+    band = np.asarray(image.crop((0, top, w, bottom)).convert(mode.image_mode))
+    pixels = band.reshape(-1, band.shape[-1])[first_pixel - top * w:last_pixel - top * w]
+    return read_pixels(pixels, end - start, mode, start % per_pixel)
+
+
+def extract_bytes(image_sources) -> bytes:
+    """Read a length-framed payload spread across one or more images.
+
+    Only the header channels are read before the mode and payload length are
+    known; after that just the channels holding the payload are sliced out.
+    """
+    with metrics.span('extract') as stage:
+        images = [open_image(source) for source in image_sources]
+        mode, data_len = read_frame_header(images)
+        available = sum(channel_capacity(img, mode) for img in images)
+        total_bits = (data_len + LENGTH_HEADER_SIZE) * 8
+
+        if available * mode.bits < total_bits:
+            raise ValueError(f"Incomplete data: expected {total_bits} bits, got {available * mode.bits} bits")
+
+        symbols = _gather_symbols(images, mode.symbol_count(data_len + LENGTH_HEADER_SIZE), mode)
+        stage.set(images=len(images), payload_bytes=data_len, bits=mode.bits)
+    metrics.count('payload_bytes', data_len, stage='extract')
+    metrics.count('images', len(images), stage='extract')
+    return unframe_symbols(symbols, data_len, mode)
+
+
+def read_frame_header(images):
+    """Return (mode, payload length) from the start of the first image.
+
+    The first 16 default-layout channels hold either a mode header, followed
+    by the length header in that mode, or a legacy length header.
+    """
+    if sum(channel_capacity(img) for img in images) < HEADER_SYMBOLS:
+        raise ValueError("Not enough data for header")
+    header = symbols_to_bytes(_gather_symbols(images, HEADER_SYMBOLS))
+    mode = EmbedMode.unpack(header)
+    if mode is None:
+        return DEFAULT_MODE, struct.unpack('>I', header)[0]
+    return mode, read_length_header(images, mode)
+
+
+def read_length_header(images, mode: EmbedMode = DEFAULT_MODE) -> int:
+    # Decode the 32-bit payload length from the first frame symbols
+    count = mode.symbol_count(LENGTH_HEADER_SIZE)
+    if sum(channel_capacity(img, mode) for img in images) < count:
+        raise ValueError("Not enough data for header")
+    header = symbols_to_bytes(_gather_symbols(images, count, mode), mode.bits)
+    return struct.unpack('>I', header[:LENGTH_HEADER_SIZE])[0]
+
+
+def unframe_symbols(symbols: np.ndarray, data_len: int, mode: EmbedMode = DEFAULT_MODE) -> bytes:
+    # Payload bytes following the length header in a frame's symbols
+    skip, partial = divmod(LENGTH_HEADER_SIZE * 8, mode.bits)
+    if partial:
+        return pack_symbols(symbols, mode.bits)[LENGTH_HEADER_SIZE:LENGTH_HEADER_SIZE + data_len].tobytes()
+    return pack_symbols(symbols[skip:], mode.bits)[:data_len].tobytes()
+
+
+def _gather_symbols(images, count: int, mode: EmbedMode = DEFAULT_MODE) -> np.ndarray:
+    # Fill `count` symbols from the images in order, stopping once full
+    out = np.empty(count, dtype=np.uint8)
+    filled = 0
+    for img in images:
+        if filled >= count:
+            break
+        part = read_symbols(img, 0, count - filled, mode)
+        out[filled:filled + len(part)] = part
+        filled += len(part)
+    return out
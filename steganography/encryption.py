@@ -1,38 +1,273 @@
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-import os, base64
+from collections import OrderedDict
+from . import metrics
+import os, base64, struct, hashlib, hmac, threading, time
+
+# `cryptography` is imported on first use (see _aesgcm and _pbkdf2), so
+# the container constants and encrypted_size cost nothing to import.
 
 # 128‑bit salt + 12‑byte nonce lengths are standard
 PBKDF2_SALT_SIZE = 16
 AES_NONCE_SIZE = 12
 KDF_ITERATIONS = 100_000
 AES_KEY_SIZE = 32  # 256 bits
+AES_TAG_SIZE = 16
 
-def derive_key(password: str, salt: bytes) -> bytes:
+# Chunked container: magic + salt + nonce prefix + segment size, then one
+# AES-GCM segment per SEGMENT_SIZE bytes of plaintext. Each segment's nonce
+# is the random prefix + a 32-bit segment index + a final-segment flag, so
+# segments cannot be reordered, dropped or truncated without failing the tag.
+STREAM_MAGIC = b'SGC1'
+STREAM_NONCE_PREFIX_SIZE = 7
+STREAM_HEADER_SIZE = len(STREAM_MAGIC) + PBKDF2_SALT_SIZE + STREAM_NONCE_PREFIX_SIZE + 4
+SEGMENT_SIZE = 64 * 1024
+
+# Derived keys are cached in-process so repeated decodes of the same image
+# skip PBKDF2. Entries are keyed by an HMAC of (password, salt) under a
+# per-process secret; plaintext passwords are never stored.
+KEY_CACHE_SIZE = int(os.environ.get('STEGO_KEY_CACHE_SIZE', 128))
+KEY_CACHE_TTL = float(os.environ.get('STEGO_KEY_CACHE_TTL', 300))
+
+class KeyCache:
+    def __init__(self, maxsize: int = KEY_CACHE_SIZE, ttl: float = KEY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # cache key -> (created_at, derived key)
+        self._secret = os.urandom(32)
+        self._lock = threading.Lock()
+
+    def _cache_key(self, password: str, salt: bytes) -> bytes:
+        secret = password.encode()
+        message = struct.pack('>I', len(secret)) + secret + bytes(salt)
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def get(self, password: str, salt: bytes, derive) -> bytes:
+        # Return the cached key for (password, salt), deriving it on a miss
+        if self.maxsize <= 0:
+            return derive(password, salt)
+
+        cache_key = self._cache_key(password, salt)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(cache_key, None)
+            self.misses += 1
+
+        # Derive outside the lock so one slow KDF does not block other lookups
+        key = derive(password, salt)
+        with self._lock:
+            self._entries[cache_key] = (time.monotonic(), key)
+            self._evict(now)
+        return key
+
+    def _evict(self, now: float):
+        for cache_key in [k for k, (created, _) in self._entries.items() if now - created >= self.ttl]:
+            del self._entries[cache_key]
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def configure(self, maxsize: int = None, ttl: float = None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._evict(time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+            }
+
+key_cache = KeyCache()
+
+def configure_key_cache(maxsize: int = None, ttl: float = None):
+    # Set maxsize to 0 to disable caching
+    key_cache.configure(maxsize, ttl)
+
+def key_cache_stats() -> dict:
+    return key_cache.stats()
+
+def _aesgcm(key: bytes):
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    return AESGCM(key)
+
+def _pbkdf2(password: str, salt: bytes) -> bytes:
     # Derive an AES key using PBKDF2
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=AES_KEY_SIZE,
-        salt=salt,
-        iterations=KDF_ITERATIONS,
-    )
-    return kdf.derive(password.encode())
-
-def encrypt_data(data: bytes, password: str) -> bytes:
-    # Format: salt + nonce + ciphertext + tag
-    salt = os.urandom(PBKDF2_SALT_SIZE)
-    key = derive_key(password, salt)
-    aesgcm = AESGCM(key)
-    nonce = os.urandom(AES_NONCE_SIZE)
-    encrypted = aesgcm.encrypt(nonce, data, None)
-    return salt + nonce + encrypted
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    with metrics.span('kdf'):
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=AES_KEY_SIZE,
+            salt=bytes(salt),
+            iterations=KDF_ITERATIONS,
+        )
+        return kdf.derive(password.encode())
+
+def derive_key(password: str, salt: bytes) -> bytes:
+    return key_cache.get(password, salt, _pbkdf2)
+
+def encrypt_data(data: bytes, password: str, salt: bytes = None) -> bytes:
+    # One-shot wrapper around the chunked container format
+    with metrics.span('encrypt', payload_bytes=len(data)):
+        return b''.join(encrypt_stream([data], password, salt=salt))
 
 def decrypt_data(token: bytes, password: str) -> bytes:
-    # Parse salt, nonce, encrypted payload, verify integrity
+    # Accepts both the chunked container and the legacy one-shot format.
+    # A token with the container magic whose header does not parse is
+    # tried as legacy; a failed tag (a wrong password) is final, so it
+    # costs one key derivation, not two.
+    with metrics.span('decrypt', payload_bytes=len(token)):
+        if bytes(token[:len(STREAM_MAGIC)]) == STREAM_MAGIC:
+            try:
+                return b''.join(decrypt_stream(token, password))
+            except ValueError:
+                pass  # a legacy salt that happens to start with the magic bytes
+        return decrypt_legacy(token, password)
+
+def decrypt_legacy(token: bytes, password: str) -> bytes:
+    # Legacy format: salt + nonce + ciphertext + tag
     salt = token[:PBKDF2_SALT_SIZE]
     nonce = token[PBKDF2_SALT_SIZE:PBKDF2_SALT_SIZE + AES_NONCE_SIZE]
     ciphertext = token[PBKDF2_SALT_SIZE + AES_NONCE_SIZE:]
     key = derive_key(password, salt)
-    aesgcm = AESGCM(key)
+    aesgcm = _aesgcm(key)
     return aesgcm.decrypt(nonce, ciphertext, None)
+
+def encrypted_size(data_length: int, segment_size: int = SEGMENT_SIZE) -> int:
+    # Exact container size for a plaintext of `data_length` bytes
+    segments = max(1, -(-data_length // segment_size))
+    return STREAM_HEADER_SIZE + data_length + segments * AES_TAG_SIZE
+
+def encrypt_stream(chunks, password: str, segment_size: int = SEGMENT_SIZE, salt: bytes = None):
+    """Encrypt an iterable of plaintext chunks into the chunked container.
+
+    Yields the header and then one sealed segment at a time, so the caller
+    can embed ciphertext as it is produced.
+
+    A batch of containers may share one `salt` (and so one cached key);
+    each still gets a fresh random nonce prefix. By default every
+    container gets its own salt.
+    """
+    if salt is None:
+        salt = os.urandom(PBKDF2_SALT_SIZE)
+    elif len(salt) != PBKDF2_SALT_SIZE:
+        raise ValueError(f"Salt must be {PBKDF2_SALT_SIZE} bytes.")
+    prefix = os.urandom(STREAM_NONCE_PREFIX_SIZE)
+    header = STREAM_MAGIC + salt + prefix + struct.pack('>I', segment_size)
+    aesgcm = _aesgcm(derive_key(password, salt))
+    yield header
+
+    # Hold one segment back so the last one can be flagged as final
+    blocks = _blocks(chunks, segment_size)
+    index = 0
+    current = next(blocks, b'')
+    for following in blocks:
+        yield aesgcm.encrypt(_segment_nonce(prefix, index, False), current, header)
+        current = following
+        index += 1
+    yield aesgcm.encrypt(_segment_nonce(prefix, index, True), current, header)
+
+def decrypt_stream(chunks, password: str):
+    """Decrypt and verify a container one segment at a time.
+
+    Yields plaintext segments as soon as their tag checks out. Legacy
+    one-shot tokens are buffered and decrypted in a single step.
+
+    `chunks` may also be one whole token (bytes, bytearray or memoryview);
+    segments are then decrypted straight from slices of it, so the
+    ciphertext is never copied.
+    """
+    if isinstance(chunks, (bytes, bytearray, memoryview)):
+        source = _ViewReader(chunks)
+    else:
+        source = _ByteReader(chunks)
+    magic = bytes(source.read(len(STREAM_MAGIC)))
+    if magic != STREAM_MAGIC:
+        yield decrypt_legacy(magic + bytes(source.read()), password)
+        return
+
+    rest = bytes(source.read(STREAM_HEADER_SIZE - len(STREAM_MAGIC)))
+    if len(rest) < STREAM_HEADER_SIZE - len(STREAM_MAGIC):
+        raise ValueError("Truncated encrypted stream header.")
+    header = magic + rest
+    salt = rest[:PBKDF2_SALT_SIZE]
+    prefix = rest[PBKDF2_SALT_SIZE:PBKDF2_SALT_SIZE + STREAM_NONCE_PREFIX_SIZE]
+    segment_size = struct.unpack('>I', rest[-4:])[0]
+    if segment_size == 0:
+        raise ValueError("Invalid segment size in encrypted stream.")
+    aesgcm = _aesgcm(derive_key(password, salt))
+
+    sealed_size = segment_size + AES_TAG_SIZE
+    current = source.read(sealed_size)
+    if len(current) < AES_TAG_SIZE:
+        raise ValueError("Truncated encrypted stream.")
+    index = 0
+    while True:
+        following = source.read(sealed_size)
+        final = not following
+        yield aesgcm.decrypt(_segment_nonce(prefix, index, final), current, header)
+        if final:
+            return
+        current = following
+        index += 1
+
+def _segment_nonce(prefix: bytes, index: int, final: bool) -> bytes:
+    return prefix + struct.pack('>IB', index, final)
+
+def _blocks(chunks, size: int):
+    # Regroup arbitrary chunks into `size`-byte blocks (the last may be short)
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+class _ByteReader:
+    # Minimal read(n) over an iterable of byte chunks
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        out = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return out
+
+class _ViewReader:
+    # read(n) over one bytes-like token, as memoryview slices of it
+    def __init__(self, data):
+        self._view = memoryview(data).cast('B')
+        self._pos = 0
+
+    def read(self, size: int = -1) -> memoryview:
+        end = len(self._view) if size < 0 else min(self._pos + size, len(self._view))
+        out = self._view[self._pos:end]
+        self._pos = end
+        return out
@@ -0,0 +1,133 @@
+import numpy as np
+from . import metrics
+from .formats import MAX_SHARDS
+
+# Systematic Reed-Solomon erasure code over GF(256) for multi-image payloads.
+#
+# k data shards of equal size are extended with m parity shards; any k of
+# the k + m shards rebuild the data. Parity rows come from a Cauchy matrix,
+# so every square submatrix is invertible. Arithmetic is table driven:
+# multiplying a whole shard by a constant is a single lookup into a row of
+# MUL, and addition is XOR, so each shard operation is one NumPy pass.
+# With m = 1 this is a plain XOR-strength single-loss code, just with
+# Cauchy coefficients instead of ones.
+GF_POLY = 0x11D
+
+EXP = np.zeros(512, dtype=np.uint8)
+LOG = np.zeros(256, dtype=np.int32)
+_x = 1
+for _i in range(255):
+    EXP[_i] = _x
+    LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= GF_POLY
+EXP[255:510] = EXP[:255]
+
+# MUL[a, b] = a * b in GF(256); MUL[a] is the lookup table for "times a"
+MUL = EXP[(LOG[:, None] + LOG[None, :]) % 255]
+MUL[0, :] = 0
+MUL[:, 0] = 0
+
+
+def gf_inverse(a: int) -> int:
+    if a == 0:
+        raise ZeroDivisionError("0 has no inverse in GF(256).")
+    return int(EXP[255 - LOG[a]])
+
+
+def parity_matrix(k: int, m: int) -> np.ndarray:
+    # m x k Cauchy matrix: 1 / (x_j + y_i) with x_j = k + j, y_i = i
+    if k + m > MAX_SHARDS:
+        raise ValueError(f"At most {MAX_SHARDS} data and parity chunks are supported.")
+    x = np.arange(k, k + m)[:, None]
+    y = np.arange(k)[None, :]
+    return EXP[(255 - LOG[x ^ y]) % 255]
+
+
+def invert_matrix(matrix: np.ndarray) -> np.ndarray:
+    # Gauss-Jordan elimination over GF(256); rows are reduced as whole vectors
+    n = len(matrix)
+    work = np.concatenate((matrix.astype(np.uint8), np.eye(n, dtype=np.uint8)), axis=1)
+    for col in range(n):
+        pivot = next((r for r in range(col, n) if work[r, col]), None)
+        if pivot is None:
+            raise ValueError("Singular matrix.")
+        work[[col, pivot]] = work[[pivot, col]]
+        work[col] = MUL[gf_inverse(int(work[col, col]))][work[col]]
+        for r in range(n):
+            if r != col and work[r, col]:
+                work[r] ^= MUL[work[r, col]][work[col]]
+    return work[:, n:]
+
+
+def _padded(shard, size: int) -> np.ndarray:
+    row = np.zeros(size, dtype=np.uint8)
+    data = np.frombuffer(shard, dtype=np.uint8)
+    row[:len(data)] = data
+    return row
+
+
+class ParityEncoder:
+    """Accumulate parity as data shards arrive, in any order.
+
+    Only the m parity shards are held, so a streamed payload never has to
+    be in memory at once. Short shards are zero-padded to `shard_size`.
+    """
+
+    def __init__(self, k: int, m: int, shard_size: int):
+        self.matrix = parity_matrix(k, m)
+        self.shard_size = shard_size
+        self._parity = np.zeros((m, shard_size), dtype=np.uint8)
+
+    def add(self, index: int, shard):
+        row = _padded(shard, self.shard_size)
+        with metrics.span('parity_encode', bytes=self.shard_size):
+            for j, coefficient in enumerate(self.matrix[:, index]):
+                self._parity[j] ^= MUL[coefficient][row]
+
+    def parity(self):
+        return [row.tobytes() for row in self._parity]
+
+
+def encode_parity(shards, m: int, shard_size: int):
+    # m parity shards for a complete list of data shards
+    encoder = ParityEncoder(len(shards), m, shard_size)
+    for index, shard in enumerate(shards):
+        encoder.add(index, shard)
+    return encoder.parity()
+
+
+def recover(k: int, m: int, shard_size: int, data: dict, parity: dict) -> dict:
+    """Rebuild the missing data shards.
+
+    `data` maps the indices of intact data shards to their bytes and
+    `parity` maps parity indices (0..m-1) to theirs. Returns a dict of the
+    rebuilt data shards, each `shard_size` bytes.
+    """
+    missing = [i for i in range(k) if i not in data]
+    if not missing:
+        return {}
+    rows = sorted(parity)[:len(missing)]
+    if len(rows) < len(missing):
+        raise ValueError(f"Cannot rebuild {len(missing)} lost chunk(s) from {len(parity)} parity chunk(s).")
+
+    matrix = parity_matrix(k, m)
+    with metrics.span('parity_recover', shards=len(missing), bytes=shard_size):
+        # Strip the known data shards' contribution from each parity shard...
+        residual = np.stack([_padded(parity[j], shard_size) for j in rows])
+        for i, shard in data.items():
+            row = _padded(shard, shard_size)
+            for r, j in enumerate(rows):
+                if matrix[j, i]:
+                    residual[r] ^= MUL[matrix[j, i]][row]
+        # ...leaving a square Cauchy system in the missing shards
+        solve = invert_matrix(matrix[np.ix_(rows, missing)])
+        rebuilt = {}
+        for r, i in enumerate(missing):
+            out = np.zeros(shard_size, dtype=np.uint8)
+            for c in range(len(rows)):
+                if solve[r, c]:
+                    out ^= MUL[solve[r, c]][residual[c]]
+            rebuilt[i] = out.tobytes()
+    return rebuilt
@@ -0,0 +1,178 @@
+import struct
+import zlib
+from collections import namedtuple
+
+# Pure-Python definitions of the on-image formats: embedding modes, header
+# layouts and PNG output profiles. Nothing here needs NumPy, Pillow or
+# cryptography, so capacity planning and header parsing stay cheap to
+# import; the encoders re-export these names.
+#
+# Payloads are framed as a 4-byte big-endian length header followed by the
+# data, split into symbols of `bits` bits and written MSB-first into the low
+# bits of the selected channels in pixel order. By default that is 2 bits in
+# each of R, G and B.
+BITS_PER_CHANNEL = 2
+LENGTH_HEADER_SIZE = 4
+HEADER_SYMBOLS = LENGTH_HEADER_SIZE * 8 // BITS_PER_CHANNEL
+
+# Any mode other than the default starts every image with a 4-byte mode
+# header, written in the default layout over the first MODE_HEADER_PIXELS
+# pixels, so decoders configure themselves; the frame follows from the next
+# pixel on. A legacy length header never starts with 0xFF (that would be a
+# 4 GiB payload), so images without a mode header still decode as before.
+#   0xFF 'M' | bits per channel (1) | channel mask (1): R=1, G=2, B=4, A=8
+CHANNELS = 'RGBA'
+MODE_MAGIC = b'\xffM'
+MODE_HEADER_PIXELS = -(-HEADER_SYMBOLS // 3)
+
+# PNG output profiles: Pillow save options trading encode time for file size.
+# 'balanced' is Pillow's default (zlib level 6, adaptive filtering) and
+# produces the same bytes as before profiles existed.
+PNG_PROFILES = {
+    'store': {'compress_level': 0},
+    'fast': {'compress_level': 1, 'compress_type': zlib.Z_RLE},
+    'balanced': {},
+    'small': {'compress_level': 9, 'optimize': True},
+}
+DEFAULT_PNG_PROFILE = 'balanced'
+
+
+class EmbedMode(namedtuple('EmbedMode', 'bits channels')):
+    """Bits per channel (1-4) and the channels, a subset of 'RGBA', that carry the payload."""
+
+    __slots__ = ()
+
+    def __new__(cls, bits: int = BITS_PER_CHANNEL, channels: str = 'RGB'):
+        channels = channels.upper()
+        if not 1 <= bits <= 4:
+            raise ValueError("Bits per channel must be between 1 and 4.")
+        if not channels or len(set(channels)) != len(channels) or not set(channels) <= set(CHANNELS):
+            raise ValueError(f"Channels must be a subset of {CHANNELS}, got '{channels}'.")
+        # Canonical order, so 'BGR' and 'RGB' are the same mode
+        return super().__new__(cls, bits, ''.join(c for c in CHANNELS if c in channels))
+
+    @classmethod
+    def from_mask(cls, bits: int, mask: int):
+        return cls(bits, ''.join(c for i, c in enumerate(CHANNELS) if mask >> i & 1))
+
+    @classmethod
+    def unpack(cls, header: bytes):
+        # Mode recorded in a mode header, or None for a legacy length header
+        if bytes(header[:len(MODE_MAGIC)]) != MODE_MAGIC:
+            return None
+        return cls.from_mask(header[2], header[3])
+
+    def pack(self) -> bytes:
+        return MODE_MAGIC + bytes((self.bits, self.channel_mask))
+
+    @property
+    def channel_mask(self) -> int:
+        return sum(1 << CHANNELS.index(c) for c in self.channels)
+
+    @property
+    def is_default(self) -> bool:
+        return self.bits == BITS_PER_CHANNEL and self.channels == 'RGB'
+
+    @property
+    def image_mode(self) -> str:
+        # Pillow mode the cover is converted to
+        return 'RGBA' if 'A' in self.channels else 'RGB'
+
+    @property
+    def channel_indices(self):
+        return [CHANNELS.index(c) for c in self.channels]
+
+    @property
+    def header_pixels(self) -> int:
+        # Pixels taken by the mode header at the start of each image
+        return 0 if self.is_default else MODE_HEADER_PIXELS
+
+    def capacity(self, width: int, height: int, header_pixels: int = None) -> int:
+        # Symbols (channel slots) one image of this size holds after its header
+        if header_pixels is None:
+            header_pixels = self.header_pixels
+        return max(width * height - header_pixels, 0) * len(self.channels)
+
+    def symbol_count(self, size: int) -> int:
+        # Symbols needed for `size` bytes; the last one may be zero-padded
+        return -(-size * 8 // self.bits)
+
+
+DEFAULT_MODE = EmbedMode()
+
+
+def header_pixels(size: int) -> int:
+    # Pixels a `size`-byte header takes when written in the default layout
+    return -(-size * 8 // BITS_PER_CHANNEL // 3)
+
+
+# Every chunk image starts with a chunk header, written in the default
+# 2-bit RGB layout, so chunks can be decoded in any order and checked for
+# gaps before any payload bits are extracted:
+#   0xFF 'C' | version (1) | bits per channel (1) | channel mask (1) | flags (1)
+#   | payload ID (8) | chunk index (4) | chunk count (4) | byte offset (8)
+#   | chunk length (4) | payload length (8) | parity chunks (2)
+#   | CRC-32 of the chunk's bytes (4) | CRC-32 of the above (4)
+# The chunk's bytes follow in its own embedding mode. Version 1 headers
+# lack the parity count and body CRC. From version 3 the count may be 0:
+# chunks embedded as their covers arrive cannot know how many follow, so
+# the one whose bytes end the payload is the last (such sets have no
+# parity). Covers written as one length-framed stream across all images
+# (manifest=False, and everything before chunk headers existed) still
+# decode, in upload order.
+#
+# With parity chunks, the payload is cut into k = count - parity data
+# chunks of ceil(total / k) bytes (the last may be shorter), followed by
+# `parity` Reed-Solomon parity chunks of that full size at offset 0; any k
+# intact chunks rebuild the payload (see fec).
+# MAX_SHARDS bounds data + parity chunks: the code works over GF(256).
+CHUNK_MAGIC = b'\xffC'
+CHUNK_VERSION = 3
+PAYLOAD_ID_SIZE = 8
+_CHUNK_HEADERS = {
+    1: struct.Struct('>2sBBBB8sIIQIQ'),
+    2: struct.Struct('>2sBBBB8sIIQIQHI'),
+    3: struct.Struct('>2sBBBB8sIIQIQHI'),
+}
+_CHUNK_HEADER = _CHUNK_HEADERS[CHUNK_VERSION]
+_CHUNK_CRC = struct.Struct('>I')
+CHUNK_HEADER_SIZE = _CHUNK_HEADER.size + _CHUNK_CRC.size
+CHUNK_HEADER_PIXELS = header_pixels(CHUNK_HEADER_SIZE)
+MAX_SHARDS = 256
+
+ChunkHeader = namedtuple('ChunkHeader', 'mode flags payload_id index count offset length total parity crc version',
+                         defaults=(0, None, CHUNK_VERSION))
+
+
+def pack_chunk_header(header: ChunkHeader) -> bytes:
+    packed = _CHUNK_HEADER.pack(
+        CHUNK_MAGIC, CHUNK_VERSION, header.mode.bits, header.mode.channel_mask, header.flags,
+        header.payload_id, header.index, header.count, header.offset, header.length, header.total,
+        header.parity, header.crc or 0)
+    return packed + _CHUNK_CRC.pack(zlib.crc32(packed))
+
+
+def chunk_header_pixels(version: int = CHUNK_VERSION) -> int:
+    # Pixels before a chunk's bytes, for a header of the given version
+    return header_pixels(_CHUNK_HEADERS[version].size + _CHUNK_CRC.size)
+
+
+def unpack_chunk_header(raw: bytes):
+    # ChunkHeader from header bytes, or None if they are not a valid chunk header
+    if len(raw) <= len(CHUNK_MAGIC) or bytes(raw[:len(CHUNK_MAGIC)]) != CHUNK_MAGIC:
+        return None
+    version = raw[len(CHUNK_MAGIC)]
+    if version > CHUNK_VERSION:
+        raise ValueError(f"Unsupported chunk header version {version}.")
+    layout = _CHUNK_HEADERS.get(version)
+    if layout is None or len(raw) < layout.size + _CHUNK_CRC.size:
+        return None
+    (crc,) = _CHUNK_CRC.unpack_from(raw, layout.size)
+    if zlib.crc32(raw[:layout.size]) != crc:
+        return None
+    _, _, bits, mask, flags, payload_id, index, count, offset, length, total, *extra = layout.unpack_from(raw)
+    parity, body_crc = extra or (0, None)
+    if not count and (version < 3 or parity):
+        return None
+    return ChunkHeader(EmbedMode.from_mask(bits, mask), flags, payload_id, index, count, offset, length, total,
+                       parity, body_crc, version)
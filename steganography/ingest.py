@@ -0,0 +1,168 @@
+import os
+import tempfile
+from werkzeug.datastructures import FileStorage, MultiDict
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from . import metrics
+
+# Streaming ingest for multi-file uploads.
+#
+# Flask parses a whole multipart body before a view sees any of it, so with
+# dozens of large images nothing starts until the last byte is in. An
+# Ingest reads the body itself, part by part: each file is spooled in
+# memory up to UPLOAD_SPOOL_SIZE bytes, then in a temporary file, and handed
+# over as soon as it is complete while later parts are still arriving.
+# The request's total size and number of files are checked as data comes
+# in, so an oversized upload fails at the byte that crosses the limit
+# instead of after it has been stored.
+UPLOAD_MAX_BYTES = int(os.environ.get('STEGO_UPLOAD_MAX_BYTES', 512 * 1024 * 1024))
+UPLOAD_MAX_FILES = int(os.environ.get('STEGO_UPLOAD_MAX_FILES', 64))
+UPLOAD_SPOOL_SIZE = int(os.environ.get('STEGO_UPLOAD_SPOOL_SIZE', 8 * 1024 * 1024))
+READ_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class FieldOrderError(ValueError):
+    pass
+
+
+class Ingest:
+    """A multipart/form-data body, parsed as it is read.
+
+    iter_files(name) yields the uploads of one field as each completes,
+    reading the body only as far as needed; fields and other files met on
+    the way collect in `form` and `files`, and `order` lists the names of
+    the parts received so far. finish() reads the rest. Use as
+    a context manager: closing drains any unread body and removes the
+    spool files, except those handed over with keep().
+    """
+
+    def __init__(self, stream, content_type, content_length=None, max_bytes=UPLOAD_MAX_BYTES,
+                 max_files=UPLOAD_MAX_FILES, spool_size=UPLOAD_SPOOL_SIZE, max_field_size=None):
+        mimetype, options = parse_options_header(content_type or '')
+        if mimetype != 'multipart/form-data' or not options.get('boundary'):
+            raise ValueError("Expected a multipart/form-data upload.")
+        if content_length is not None and content_length > max_bytes:
+            raise UploadTooLarge(f"Upload of {content_length} bytes is over the {max_bytes} byte limit.")
+        self.form = MultiDict()
+        self.files = MultiDict()
+        self.order = []
+        self.received = 0
+        self.complete = False
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.spool_size = spool_size
+        self.max_field_size = max_field_size
+        self._stream = stream
+        # The decoder's own limit applies to every read, file data included;
+        # form fields are measured in _parse instead
+        self._decoder = MultipartDecoder(options['boundary'].encode('latin-1'))
+        self._parts = self._parse()
+        self._spools = []
+        self._file_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def iter_files(self, name: str):
+        # Uploads of field `name` in arrival order, each once its last byte is in
+        handed = 0
+        while True:
+            uploads = self.files.getlist(name)
+            if handed < len(uploads):
+                handed += 1
+                yield uploads[handed - 1]
+            elif next(self._parts, None) is None:
+                return
+
+    def sent_after(self, name: str) -> set:
+        # Names of the parts received from the first `name` part on
+        return set(self.order[self.order.index(name):]) if name in self.order else set()
+
+    def require_fields_first(self, name: str, trailing=()):
+        # Raise FieldOrderError if a part other than `name` and `trailing`
+        # has arrived after the first `name` part
+        late = self.sent_after(name) - {name} - set(trailing)
+        if late:
+            raise FieldOrderError(f"Send {', '.join(sorted(late))} before the {name} files.")
+
+    def keep(self, upload):
+        # Hand an upload's spool to the caller, who must close it; it is moved
+        # to disk first, so it can outlive the request without holding memory
+        self._spools.remove(upload.stream)
+        upload.stream.rollover()
+        upload.stream.seek(0)
+        return upload.stream
+
+    def finish(self):
+        # Read (and spool) the rest of the body
+        for _ in self._parts:
+            pass
+        return self
+
+    def close(self):
+        # Discard what is left of the body, within the size limit, and the spools
+        self._parts.close()
+        while not self.complete and self.received <= self.max_bytes:
+            data = self._stream.read(READ_SIZE)
+            if not data:
+                break
+            self.received += len(data)
+        for spool in self._spools:
+            spool.close()
+
+    def _read(self) -> bytes:
+        data = self._stream.read(READ_SIZE)
+        self.received += len(data)
+        if self.received > self.max_bytes:
+            raise UploadTooLarge(f"Upload is over the {self.max_bytes} byte limit.")
+        return data
+
+    def _parse(self):
+        # Yields each file part as it completes; fields go straight into `form`
+        decoder = self._decoder
+        part = container = None
+        while True:
+            data = self._read()
+            decoder.receive_data(data or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, Field):
+                    part, container, size = event, [], 0
+                elif isinstance(event, File):
+                    if event.filename:
+                        self._file_count += 1
+                        if self._file_count > self.max_files:
+                            raise UploadTooLarge(f"At most {self.max_files} files may be uploaded at once.")
+                    part, container = event, tempfile.SpooledTemporaryFile(self.spool_size)
+                    self._spools.append(container)
+                elif isinstance(event, Data):
+                    if isinstance(part, Field):
+                        size += len(event.data)
+                        if self.max_field_size is not None and size > self.max_field_size:
+                            raise UploadTooLarge(f"Form field '{part.name}' is over {self.max_field_size} bytes.")
+                        container.append(event.data)
+                        if not event.more_data:
+                            self.form.add(part.name, b''.join(container).decode('utf-8', 'replace'))
+                            self.order.append(part.name)
+                    else:
+                        container.write(event.data)
+                        if not event.more_data:
+                            container.seek(0)
+                            self.files.add(part.name, FileStorage(container, part.filename, part.name,
+                                                                  headers=part.headers))
+                            self.order.append(part.name)
+                            yield part.name
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not data:
+                break
+        self.complete = True
+        metrics.count('upload_bytes', self.received, stage='ingest')
+        metrics.count('images', self._file_count, stage='ingest')
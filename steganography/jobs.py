@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+from . import metrics
+import os, tempfile, threading, time, uuid
+
+# In-process job queue for long multi-image encodes and decodes.
+#
+# Jobs run on a local thread pool (no external broker); each job may still
+# fan its images out to the multi-image process pool. At most
+# `max_pending` jobs are queued or running at once, and finished jobs,
+# results included, are dropped `ttl` seconds after they complete, by a
+# timer thread as well as on every lookup. Nothing large is held in
+# memory: a job's inputs are open files it is handed (spooled uploads),
+# closed once it has run, and its result is written to a temporary file.
+JOB_WORKERS = int(os.environ.get('STEGO_JOB_WORKERS', 2))
+JOB_QUEUE_SIZE = int(os.environ.get('STEGO_JOB_QUEUE_SIZE', 8))
+JOB_TTL = float(os.environ.get('STEGO_JOB_TTL', 3600))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, bits_total: int = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.images_done = 0
+        self.bits_done = 0
+        self.bits_total = bits_total
+        self.result = None
+        self.result_path = None
+        self.error = None
+        self.inputs = ()
+        self._future = None
+        self._lock = threading.Lock()
+
+    def progress(self, images: int = 0, bits: int = 0):
+        # Callback handed to the encoders: add finished images and embedded/extracted bits
+        with self._lock:
+            self.images_done += images
+            self.bits_done += bits
+
+    def create_result(self, directory: str = None):
+        # A new temporary file, open for writing, for the job's output
+        fd, self.result_path = tempfile.mkstemp(prefix='stego-job-', dir=directory)
+        return os.fdopen(fd, 'wb')
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+                'images_done': self.images_done,
+                'bits_done': self.bits_done,
+                'bits_total': self.bits_total,
+                'error': self.error,
+            }
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, max_pending: int = JOB_QUEUE_SIZE, ttl: float = JOB_TTL):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stego-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._reaper = threading.Thread(target=self._reap, name='stego-job-expiry', daemon=True)
+        self._reaper.start()
+
+    def submit(self, kind: str, run, bits_total: int = None, inputs=()) -> Job:
+        """Queue `run(job)`; its return value becomes the job's result.
+
+        `inputs` are files the job reads (kept as `job.inputs`); they are
+        closed once it has run or been cancelled, or at once if it is not
+        queued. A job that writes its output with `job.create_result()`
+        has the file removed when the job is dropped.
+
+        Raises QueueFull when `max_pending` jobs are already queued or running.
+        """
+        job = Job(kind, bits_total)
+        job.inputs = tuple(inputs)
+        with self._lock:
+            self._expire(time.time())
+            pending = sum(1 for j in self._jobs.values() if j.status in (QUEUED, RUNNING))
+            if pending >= self.max_pending:
+                _close_inputs(job)
+                raise QueueFull(f"Job queue is full ({pending} pending).")
+            self._jobs[job.id] = job
+            job._future = self._executor.submit(self._run, job, run)
+        metrics.count('jobs', kind=kind, status='submitted')
+        return job
+
+    def _run(self, job: Job, run):
+        with job._lock:
+            if job.status == CANCELLED:
+                return
+            job.status = RUNNING
+            job.started = time.time()
+        try:
+            with metrics.request(f'job {job.kind}', job=job.id), metrics.span('job', kind=job.kind):
+                result = run(job)
+        except Exception as e:
+            with job._lock:
+                job.status, job.error, job.finished = FAILED, str(e) or type(e).__name__, time.time()
+            _remove_result(job)
+        else:
+            with job._lock:
+                job.status, job.result, job.finished = DONE, result, time.time()
+        finally:
+            _close_inputs(job)
+        metrics.count('jobs', kind=job.kind, status=job.status)
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            self._expire(time.time())
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown job ID '{job_id}'.")
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        # Queued jobs are cancelled; finished ones are dropped with their result.
+        # Running jobs cannot be interrupted and are left to finish.
+        job = self.get(job_id)
+        with job._lock:
+            if job.status == QUEUED:
+                job.status, job.finished = CANCELLED, time.time()
+                job._future.cancel()
+            elif job.status == RUNNING:
+                return job
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        _drop(job)
+        return job
+
+    def _expire(self, now: float):
+        for job_id in [i for i, j in self._jobs.items() if j.finished is not None and now - j.finished >= self.ttl]:
+            _drop(self._jobs.pop(job_id))
+
+    def _reap(self):
+        # Expire finished jobs even when no request comes in to look them up
+        while not self._stopped.wait(min(max(self.ttl, 0.1), 60)):
+            with self._lock:
+                self._expire(time.time())
+
+    def shutdown(self, wait: bool = True):
+        self._stopped.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status != RUNNING:  # still running only if not waited for
+                    _drop(job)
+
+
+def _close_inputs(job: Job):
+    for f in job.inputs:
+        f.close()
+
+
+def _remove_result(job: Job):
+    if job.result_path:
+        try:
+            os.unlink(job.result_path)
+        except FileNotFoundError:
+            pass
+
+
+def _drop(job: Job):
+    # Release what a job holds on disk once it is cancelled, discarded or expired
+    _close_inputs(job)
+    _remove_result(job)
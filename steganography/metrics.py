@@ -0,0 +1,213 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+
+# Per-stage timing and counters for the encode/decode pipeline.
+#
+# Off by default. While disabled, span(), request() and count() hand back
+# one shared no-op object or return immediately, so instrumented code pays
+# next to nothing. Enable with STEGO_METRICS=1 (both backends), or a comma
+# list of backends such as STEGO_METRICS=log or STEGO_METRICS=prometheus,
+# or call enable(). Counters are totalled under either backend.
+#   log        - one INFO record per finished span, and one per request()
+#                with the counters it added, on the 'steganography.metrics'
+#                logger; enabling it sets that logger to INFO and, unless
+#                logging is already set up (a handler on it or an
+#                ancestor), sends it to stderr
+#   prometheus - aggregate span durations into histograms; served with the
+#                counters by render_prometheus() (the app exposes it at
+#                /metrics)
+
+logger = logging.getLogger('steganography.metrics')
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_log_enabled = False
+_prometheus_enabled = False
+_lock = threading.Lock()
+_durations = {}  # stage -> [bucket counts..., count, sum]
+_counters = {}   # (name, ((label, value), ...)) -> total
+_request_counters = contextvars.ContextVar('stego_request_counters', default=None)  # the same, per request()
+
+
+def enable(log: bool = True, prometheus: bool = True):
+    global _log_enabled, _prometheus_enabled
+    _log_enabled = log
+    _prometheus_enabled = prometheus
+    if log:
+        _configure_logger()
+
+
+def _configure_logger():
+    # Without this the records would meet the WARNING default and no handler
+    logger.setLevel(logging.INFO)
+    if not logger.hasHandlers():
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+
+
+def disable():
+    enable(False, False)
+
+
+def is_enabled() -> bool:
+    return _log_enabled or _prometheus_enabled
+
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _counters.clear()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if _prometheus_enabled:
+            _observe(self.stage, elapsed)
+        if _log_enabled:
+            extra = ''.join(f' {k}={v}' for k, v in self.attrs.items())
+            status = ' error=' + exc_type.__name__ if exc_type else ''
+            logger.info("stage=%s duration_ms=%.2f%s%s", self.stage, elapsed * 1000, extra, status)
+        return False
+
+    def set(self, **attrs):
+        # Attach attributes known only once the stage has run (e.g. sizes)
+        self.attrs.update(attrs)
+
+
+class _Request(_Span):
+    # Collects the counters added in its context and logs them in one record
+    def __init__(self, name, attrs):
+        super().__init__('request', attrs)
+        self.name = name
+
+    def __enter__(self):
+        self.outer = _request_counters.get()
+        self.counters = {}
+        _request_counters.set(self.counters)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _request_counters.set(self.outer)
+        with _lock:
+            counters = sorted(self.counters.items())
+        extra = ''.join(f' {k}={v}' for k, v in self.attrs.items())
+        extra += ''.join(f' {_counter_name(name, labels)}={value}' for (name, labels), value in counters)
+        status = ' error=' + exc_type.__name__ if exc_type else ''
+        logger.info("request=%s duration_ms=%.2f%s%s", self.name, elapsed * 1000, extra, status)
+        return False
+
+
+def span(stage: str, **attrs):
+    """Time a pipeline stage: `with metrics.span('embed', images=3): ...`"""
+    if not (_log_enabled or _prometheus_enabled):
+        return _NOOP_SPAN
+    return _Span(stage, attrs)
+
+
+def request(name: str, **attrs):
+    """Log one record for a whole request, with the counters added inside it.
+
+    `with metrics.request('POST /encode'): ...`; a no-op unless the log
+    backend is on. Counters added on other threads (or in worker
+    processes) count towards the totals only.
+    """
+    if not _log_enabled:
+        return _NOOP_SPAN
+    return _Request(name, attrs)
+
+
+def count(name: str, value: int = 1, **labels):
+    """Add to a counter such as payload bytes, pixels or images processed."""
+    if not (_log_enabled or _prometheus_enabled):
+        return
+    key = (name, tuple(sorted(labels.items())))
+    current = _request_counters.get()
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        if current is not None:
+            current[key] = current.get(key, 0) + value
+
+
+def _counter_name(name, labels):
+    # payload_bytes{stage=embed}, as counters appear in request records
+    rendered = ','.join(f'{k}={v}' for k, v in labels)
+    return f'{name}{{{rendered}}}' if rendered else name
+
+
+def _observe(stage, seconds):
+    with _lock:
+        entry = _durations.get(stage)
+        if entry is None:
+            entry = _durations[stage] = [0] * len(DURATION_BUCKETS) + [0, 0.0]
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                entry[i] += 1
+        entry[-2] += 1
+        entry[-1] += seconds
+
+
+def render_prometheus() -> str:
+    """Render all collected metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        if _durations:
+            lines.append('# HELP stego_stage_duration_seconds Time spent in each pipeline stage.')
+            lines.append('# TYPE stego_stage_duration_seconds histogram')
+        for stage, entry in sorted(_durations.items()):
+            for bound, value in zip(DURATION_BUCKETS, entry):
+                lines.append(f'stego_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {value}')
+            lines.append(f'stego_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {entry[-2]}')
+            lines.append(f'stego_stage_duration_seconds_count{{stage="{stage}"}} {entry[-2]}')
+            lines.append(f'stego_stage_duration_seconds_sum{{stage="{stage}"}} {entry[-1]}')
+
+        seen = set()
+        for (name, labels), value in sorted(_counters.items()):
+            metric = f'stego_{name}_total'
+            if metric not in seen:
+                lines.append(f'# TYPE {metric} counter')
+                seen.add(metric)
+            rendered = ','.join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f'{metric}{{{rendered}}} {value}' if rendered else f'{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _configure_from_env():
+    setting = os.environ.get('STEGO_METRICS', '').strip().lower()
+    if setting in ('', '0', 'false', 'no', 'off'):
+        return
+    if setting in ('1', 'true', 'yes', 'on'):
+        enable()
+        return
+    backends = {part.strip() for part in setting.split(',')}
+    enable(log='log' in backends, prometheus='prometheus' in backends)
+
+
+_configure_from_env()
@@ -1,98 +1,729 @@
+import logging
+import multiprocessing
 import struct
-from PIL import Image
+import threading
+import zlib
+from collections import deque
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import os
 import numpy as np
+from . import fec, metrics
+from .embedding import (
+    DEFAULT_MODE, DEFAULT_PNG_PROFILE, LENGTH_HEADER_SIZE, SymbolReader, bits_to_symbols, bytes_to_symbols,
+    channel_capacity, embed_symbols, extract_bytes, framed_slice, load_cover, open_image, pack_symbols, payload_length,
+    read_frame_header, read_symbols, save_png, symbols_to_bytes, unframe_symbols, write_symbols,
+)
+from .capacity import plan_shards
+from .formats import (
+    CHUNK_HEADER_PIXELS, CHUNK_HEADER_SIZE, PAYLOAD_ID_SIZE, ChunkHeader, chunk_header_pixels, pack_chunk_header,
+    unpack_chunk_header,
+)
 
-BITS_PER_CHANNEL = 2
+# Every chunk image starts with a chunk header (see formats), so chunks can
+# be decoded in any order and checked for gaps before any payload bits are
+# extracted. Covers written as one length-framed stream across all images
+# (manifest=False, and everything before chunk headers existed) still
+# decode, in upload order.
 
-def calculate_capacity(image_path):
-    img = Image.open(image_path)
-    w, h = img.size
-    return (w * h * 3 * BITS_PER_CHANNEL) // 8
+logger = logging.getLogger(__name__)
 
-def encode_chunks_to_images(image_paths, data: bytes, output_dir):
-    header = struct.pack('>I', len(data))
-    full_data = header + data
-    binary = ''.join(format(b, '08b') for b in full_data)
-    bit_list = list(binary)
-    total_bits = len(bit_list)
+
+def read_chunk_header(image):
+    # Only the header pixels are read; None for images without a chunk header
+    symbols = read_symbols(image, 0, DEFAULT_MODE.symbol_count(CHUNK_HEADER_SIZE))
+    return unpack_chunk_header(symbols_to_bytes(symbols))
+
+
+def chunk_capacity(image, mode=DEFAULT_MODE) -> int:
+    # Payload bytes one cover carries as a chunk
+    return mode.capacity(*image.size, CHUNK_HEADER_PIXELS) * mode.bits // 8
+
+
+def calculate_capacity(image_path, mode=DEFAULT_MODE):
+    # Only the image header is read; pixels are not decoded
+    return chunk_capacity(_cover(image_path), mode)
+
+def channel_count(image_path, mode=DEFAULT_MODE):
+    # Channel slots in the single-stream layout, from the image header only
+    return channel_capacity(_cover(image_path), mode)
+
+def encode_chunks_to_images(image_paths, data, output_dir=None, data_length=None, workers=None,
+                            output_profile=DEFAULT_PNG_PROFILE, output_zip=None, mode=DEFAULT_MODE, progress=None,
+                            manifest=True, parity=0):
+    """Spread `data` over the cover images, writing chunk_N.png as it goes.
+
+    `data` may be bytes, a file-like object or an iterable of byte chunks.
+    Each cover is opened, filled with only the bytes it can hold and saved
+    before the next one is read, so memory stays bounded by one image plus
+    its chunk. Non-seekable streams must pass `data_length`.
+
+    Covers may be paths, image bytes or file-like objects, and
+    `image_paths` may be an iterator, such as uploads still arriving.
+    Without parity, each cover from an iterator is then embedded as soon
+    as it is in, while later ones are still arriving, and covers past those
+    the payload needs are not waited for; as the number of chunks is only
+    known at the last one, their headers record no count (see formats).
+    A sequence of covers, or any with parity, is planned first (image
+    headers only), so capacity errors come before anything is written.
+    Without an `output_dir` the chunks are returned as PNG bytes instead of
+    paths.
+    Passing an open zipfile.ZipFile as `output_zip` writes each chunk
+    straight into the archive and returns the entry names.
+    `output_profile` selects the PNG compression profile and `mode` the
+    bits per channel and channels used; every chunk records its mode.
+    `progress`, if given, is called as progress(images, bits) after each
+    chunk is written.
+
+    Each chunk carries a chunk header (see above) and an independent byte
+    range of the payload; `manifest=False` writes the older single
+    length-framed stream instead. With `workers` > 1 and an in-memory
+    payload, covers are embedded and PNG-compressed in the shared process
+    pool (see process_pool); each chunk's offset follows from the sizes of
+    the covers before it.
+
+    `parity` > 0 adds that many Reed-Solomon parity chunks: the payload is
+    split into equal data chunks, and any `parity` chunks may later be
+    lost or damaged. Parity is accumulated as the data chunks stream past,
+    so only the parity chunks themselves are held in memory.
+    """
+    length = payload_length(data, data_length)
+    if not manifest:
+        if parity:
+            raise ValueError("Parity chunks need chunk headers (manifest=True).")
+        return _encode_stream(image_paths, data, length, output_dir, workers, output_profile, output_zip, mode,
+                              progress)
+
+    if parity or isinstance(image_paths, Sequence):
+        chunks = _planned_chunks(image_paths, data, length, mode, parity)
+    else:
+        chunks = _arriving_chunks(image_paths, data, length, mode)
+
+    if workers and workers > 1 and isinstance(data, (bytes, bytearray, memoryview)):
+        if process_pool(workers) is not None:
+            return _encode_manifest_parallel(workers, chunks, output_dir, output_profile, output_zip, progress)
 
     results = []
-    index = 0
+    for img_path, header, body in chunks:
+        img = load_cover(img_path, mode)
+        embed_chunk(img, header, body)
+
+        name = f'chunk_{header.index + 1}.png'
+        results.append(_write_chunk(img, name, output_dir, output_zip, output_profile))
+        logger.debug("Saved %s, bits encoded: %d", name, header.length * 8)
+        if progress:
+            progress(1, header.length * 8)
+
+    logger.debug("All data encoded")
+    return results
+
+
+def _planned_chunks(image_paths, data, length, mode, parity):
+    # (cover, header, body) per chunk, once every header is known; the plan
+    # is made (and checked) when the first chunk is asked for
+    plan = _plan_manifest(image_paths, length, mode, parity)
+    payload_id = os.urandom(PAYLOAD_ID_SIZE)
+    headers = [ChunkHeader(mode, 0, payload_id, n, len(plan), offset, size, length, parity)
+               for n, (_, offset, size) in enumerate(plan)]
+    yield from zip((path for path, _, _ in plan), headers, _chunk_bodies(data, headers))
+
+
+def _arriving_chunks(image_paths, data, length, mode):
+    # (cover, header, body) per chunk as each cover comes in. How many the
+    # payload takes is only known at the last one, so the headers record
+    # no count (see formats)
+    payload_id = os.urandom(PAYLOAD_ID_SIZE)
+    reader = SymbolReader(data)
+    for n, (path, offset, size) in enumerate(_fill_covers(image_paths, length, mode)):
+        body = reader.read_bytes(size)
+        if len(body) < size:
+            raise ValueError(f"Payload ended early: expected {length} bytes.")
+        yield path, ChunkHeader(mode, 0, payload_id, n, 0, offset, size, length), body
+
+
+def embed_chunk(image, header: ChunkHeader, body: bytes):
+    """Write a chunk header and its bytes into a cover, in place.
+
+    The image must already be in `header.mode.image_mode`. The header's
+    body CRC is filled in from `body`.
+    """
+    mode = header.mode
+    header = header._replace(crc=zlib.crc32(body))
+    symbols = bytes_to_symbols(body, mode.bits)
+    w, h = image.size
+    if w * h <= CHUNK_HEADER_PIXELS or len(symbols) > mode.capacity(w, h, CHUNK_HEADER_PIXELS):
+        raise ValueError("Payload too large to encode in this image.")
+
+    with metrics.span('embed', symbols=len(symbols), bits=mode.bits):
+        write_symbols(image, bytes_to_symbols(pack_chunk_header(header)), 0)
+        if len(symbols):
+            write_symbols(image, symbols, CHUNK_HEADER_PIXELS, mode)
+    metrics.count('payload_bytes', len(body), stage='embed')
+    return image
+
+
+def decode_chunks_from_images(image_paths, workers=None, progress=None):
+    """Rebuild a payload from its stego images, given in any order.
+
+    Chunk headers are read and checked first, so a missing, duplicated or
+    foreign chunk fails before any payload bits are extracted. Each chunk
+    is then extracted independently straight into one preallocated buffer,
+    on a thread pool when `workers` > 1. Images written as a single stream
+    (no chunk headers) are read in the order given.
+
+    If the payload was written with parity chunks, data chunks that are
+    missing, unreadable or fail their CRC are rebuilt from the parity
+    chunks; parity chunks are only extracted when something is lost.
+
+    `progress(images, bits)` is called as chunks are extracted.
+
+    `image_paths` may also be an iterator of images still arriving (say,
+    uploads being received). Each data chunk is then extracted as soon as
+    its image is in, on a thread pool, and the checks on the set as a whole
+    run once the iterator is exhausted.
+    """
+    if not isinstance(image_paths, Sequence):
+        return _decode_arriving(image_paths, workers, progress)
+    images = [open_image(path) for path in image_paths]
+    pool = ThreadPoolExecutor(max_workers=workers) if workers and workers > 1 and len(images) > 1 else None
+    try:
+        mapper = pool.map if pool else map
+        headers = list(mapper(read_chunk_header, images))
+        if any(headers):
+            data = _decode_manifest(images, headers, mapper, progress)
+            logger.debug("Total payload: %d bytes in %d chunk(s)", len(data), len(headers))
+            return data
+    finally:
+        if pool:
+            pool.shutdown()
+    return _decode_stream(image_paths, images, workers, progress)
+
+
+def _decode_arriving(sources, workers, progress):
+    # Extraction of each data chunk starts as its image arrives; validating
+    # the whole set and any rebuild from parity wait for the last image
+    pool = ThreadPoolExecutor(max_workers=max(workers or 1, 1))
+    images, headers, pending = [], [], {}
+    first = None
+    try:
+        for source in sources:
+            image = open_image(source)
+            header = read_chunk_header(image)
+            images.append(image)
+            headers.append(header)
+            if header is None:
+                continue
+            if first is None:
+                first = header
+                buffer = bytearray(first.total)
+                out = np.frombuffer(buffer, dtype=np.uint8)
+            elif _payload_key(header) != _payload_key(first):
+                raise ValueError("Images belong to different payloads.")
+            data_count = _data_count(header)
+            if header.index < data_count and header.index not in pending:
+                if header.offset + header.length > first.total:
+                    raise ValueError("Chunk offsets do not line up.")
+                pending[header.index] = pool.submit(_extract_chunk, image, header, out, data_count)
+                images[-1] = None  # held by the task until extracted, then dropped
+        if first is None:
+            return _decode_stream(images, images, None, progress)
+
+        # Only the tail left once the last image is in is timed here
+        with metrics.span('extract', images=len(images), payload_bytes=len(buffer)):
+            chunks = _validate_chunks(images, headers)
+            first = next(iter(chunks.values()))[1]  # with the count filled in
+            data_count = first.count - first.parity
+            intact = {}
+            for index, future in pending.items():
+                header, part = future.result()
+                if part is not None:
+                    intact[index] = part
+                if progress:
+                    progress(1, header.length * 8)
+            _restore_lost(out, first, intact, chunks, _extractor(out, data_count, pool.map, progress))
+    finally:
+        pool.shutdown()
+    metrics.count('payload_bytes', len(buffer), stage='extract')
+    metrics.count('images', len(chunks), stage='extract')
+    logger.debug("Total payload: %d bytes in %d chunk(s)", len(buffer), len(headers))
+    return buffer
+
+
+def _payload_key(header: ChunkHeader):
+    # Fields every chunk of one payload shares
+    return header.payload_id, header.count, header.total, header.parity
+
+
+def _data_count(header: ChunkHeader) -> int:
+    # Data chunks in a header's set, as far as that header tells: sets
+    # embedded as their covers arrived record no count and have no parity
+    return header.count - header.parity if header.count else header.index + 1
+
+
+def _validate_chunks(images, headers):
+    # {index: (image, header)} for the chunks present, with the count filled
+    # in where the set records none; raises on mismatches, or on gaps the
+    # parity chunks cannot cover
+    first = next(header for header in headers if header)
+    unmarked = [str(n + 1) for n, header in enumerate(headers) if header is None]
+    if unmarked and not first.parity:
+        raise ValueError(f"Image(s) {', '.join(unmarked)} carry no chunk header.")
+    by_index = {}
+    for image, header in zip(images, headers):
+        if header is None:
+            continue  # unreadable; counted as lost below
+        if _payload_key(header) != _payload_key(first):
+            raise ValueError("Images belong to different payloads.")
+        by_index.setdefault(header.index, (image, header))  # repeated uploads of one chunk are ignored
+    if not first.count:
+        by_index = _count_arrived(by_index, first.total)
+        first = next(iter(by_index.values()))[1]
+    if any(n >= first.count for n in by_index):
+        raise ValueError("Chunk index out of range.")
+
+    data_count = first.count - first.parity
+    missing = [str(n + 1) for n in range(first.count) if n not in by_index]
+    if missing and (not first.parity or len(by_index) < data_count):
+        needed = f"; any {data_count} are needed" if first.parity else ""
+        raise ValueError(f"Missing chunk(s) {', '.join(missing)} of {first.count}{needed}.")
+
+    if first.parity:
+        shard = _shard_size(first)
+        for n in range(data_count):
+            if n in by_index and (by_index[n][1].offset, by_index[n][1].length) != _shard_span(n, shard, first.total):
+                raise ValueError("Chunk offsets do not line up.")
+        return by_index
+
+    offset = 0
+    for n in range(first.count):
+        header = by_index[n][1]
+        if header.offset != offset:
+            raise ValueError("Chunk offsets do not line up.")
+        offset += header.length
+    if offset != first.total:
+        raise ValueError(f"Incomplete data: chunks hold {offset} of {first.total} bytes.")
+    return by_index
+
+
+def _count_arrived(by_index, total):
+    # The chunk whose bytes end the payload is the last of a set that
+    # records no count
+    ends = [n for n, (_, header) in by_index.items() if header.offset + header.length == total]
+    if not ends:
+        held = sum(header.length for _, header in by_index.values())
+        raise ValueError(f"Missing chunk(s) after {max(by_index) + 1}: chunks hold {held} of {total} bytes.")
+    count = min(ends) + 1
+    return {n: (image, header._replace(count=count)) for n, (image, header) in by_index.items()}
+
+
+def _shard_span(index: int, shard: int, total: int):
+    # (offset, length) of data chunk `index` when the payload is split evenly
+    return index * shard, max(min(shard, total - index * shard), 0)
+
+
+def _decode_manifest(images, headers, mapper, progress):
+    chunks = _validate_chunks(images, headers)
+    first = next(iter(chunks.values()))[1]
+    data_count = first.count - first.parity
+    buffer = bytearray(first.total)
+    out = np.frombuffer(buffer, dtype=np.uint8)
+    extract_all = _extractor(out, data_count, mapper, progress)
+
+    with metrics.span('extract', images=len(chunks), payload_bytes=len(buffer)):
+        intact = extract_all([chunks[n] for n in range(data_count) if n in chunks])
+        _restore_lost(out, first, intact, chunks, extract_all)
+    metrics.count('payload_bytes', len(buffer), stage='extract')
+    metrics.count('images', len(chunks), stage='extract')
+    return buffer
+
+
+def _extract_chunk(image, header: ChunkHeader, out: np.ndarray, data_count: int):
+    # Data chunks land in the buffer; returns (header, bytes or None if damaged)
+    mode = header.mode
+    symbols = read_symbols(image, 0, mode.symbol_count(header.length), mode, chunk_header_pixels(header.version))
+    part = pack_symbols(symbols, mode.bits)[:header.length]
+    if len(part) < header.length or (header.crc is not None and zlib.crc32(part) != header.crc):
+        return header, None
+    if header.index < data_count:
+        # Intact data chunks are handed on as views of the buffer, not copies
+        view = out[header.offset:header.offset + header.length]
+        view[:] = part
+        return header, view
+    return header, part.tobytes()
+
+
+def _extractor(out, data_count, mapper, progress):
+    # extract_all(chunks) -> {index: bytes} for the intact ones among (image, header) pairs
+    def extract_all(selected):
+        intact = {}
+        for header, part in mapper(lambda chunk: _extract_chunk(*chunk, out, data_count), selected):
+            if part is not None:
+                intact[header.index] = part
+            if progress:
+                progress(1, header.length * 8)
+        return intact
+    return extract_all
+
+
+def _restore_lost(out, first, intact, chunks, extract_all):
+    # Data chunks that are missing or damaged fail the decode, or are
+    # rebuilt from parity when the payload has some
+    data_count = first.count - first.parity
+    lost = [n for n in range(data_count) if n not in intact]
+    if lost and not first.parity:
+        raise ValueError(f"Chunk(s) {', '.join(str(n + 1) for n in lost)} are damaged or truncated.")
+    if lost:
+        _rebuild(out, first, intact, lost, chunks, extract_all)
+
+
+def _rebuild(out, first, intact, lost, chunks, extract_all):
+    # Extract parity chunks until there are as many intact ones as lost data
+    # chunks, then solve for the lost chunks and fill them into the buffer
+    data_count = first.count - first.parity
+    candidates = deque(n for n in range(data_count, first.count) if n in chunks)
+    parity = {}
+    while len(parity) < len(lost) and candidates:
+        batch = [chunks[candidates.popleft()] for _ in range(min(len(lost) - len(parity), len(candidates)))]
+        parity.update((n - data_count, part) for n, part in extract_all(batch).items())
+    if len(parity) < len(lost):
+        raise ValueError(f"Cannot rebuild the payload: {len(lost)} data chunk(s) lost, "
+                         f"only {len(parity)} intact parity chunk(s).")
+
+    shard = _shard_size(first)
+    logger.warning("Rebuilding chunk(s) %s from parity", ', '.join(str(n + 1) for n in lost))
+    for n, part in fec.recover(data_count, first.parity, shard, intact, parity).items():
+        offset, length = _shard_span(n, shard, first.total)
+        out[offset:offset + length] = np.frombuffer(part, dtype=np.uint8)[:length]
+    metrics.count('chunks_rebuilt', len(lost))
+
+
+def _plan_manifest(image_paths, length, mode, parity=0):
+    # (cover, byte offset, size) per cover used; covers too small for a
+    # chunk header are skipped
+    if parity:
+        return _plan_parity(image_paths, length, mode, parity)
+    return list(_fill_covers(image_paths, length, mode))
+
+
+def _fill_covers(image_paths, length, mode):
+    # (cover, byte offset, size) as each cover is read (header only); covers
+    # are pulled only until the payload fits, so an iterator of arriving
+    # uploads is not waited on past that
+    offset = 0
+    used = 0
+    for i, path in enumerate(image_paths):
+        w, h = _cover(path).size
+        if w * h <= CHUNK_HEADER_PIXELS:
+            logger.warning("Skipping cover %d: too small for a chunk header", i + 1)
+            continue
+        size = min(length - offset, mode.capacity(w, h, CHUNK_HEADER_PIXELS) * mode.bits // 8)
+        yield path, offset, size
+        offset += size
+        used += 1
+        if offset >= length:
+            break
+    if offset < length or not used:
+        raise ValueError(f"❌ Not enough image capacity: needed {length * 8} bits, only encoded {offset * 8}")
+
+
+def _plan_parity(image_paths, length, mode, parity):
+    # Every cover is opened, since the split depends on all their sizes
+    image_paths = list(image_paths)
+    capacities = []
+    for i, path in enumerate(image_paths):
+        w, h = _cover(path).size
+        if w * h <= CHUNK_HEADER_PIXELS:
+            logger.warning("Skipping cover %d: too small for a chunk header", i + 1)
+            capacities.append(0)
+        else:
+            capacities.append(mode.capacity(w, h, CHUNK_HEADER_PIXELS) * mode.bits // 8)
+    shards = plan_shards(length, capacities, parity)
+    if shards is None:
+        raise ValueError(f"❌ Not enough image capacity: {length * 8} bits plus {parity} parity chunk(s) "
+                         f"do not fit in {len(image_paths)} image(s)")
+    chosen, shard = shards
+    data_count = len(chosen) - parity
+    return ([(image_paths[i], n * shard, max(min(shard, length - n * shard), 0))
+             for n, i in enumerate(chosen[:data_count])]
+            + [(image_paths[i], 0, shard) for i in chosen[data_count:]])
+
+
+def _cover(source):
+    # Open a cover for its header only, leaving file-like covers where they were
+    if hasattr(source, 'seek'):
+        pos = source.tell()
+        try:
+            return open_image(source)
+        finally:
+            source.seek(pos)
+    return open_image(source)
+
+
+def _picklable(source):
+    # File-like covers (spooled uploads) are read into bytes, from the
+    # start, only as they are handed to a worker process
+    if hasattr(source, 'read'):
+        pos = source.tell()
+        try:
+            source.seek(0)
+            return source.read()
+        finally:
+            source.seek(pos)
+    return source
+
+
+def _chunk_bodies(data, headers):
+    # Each chunk's bytes in index order: data chunks read off the payload,
+    # then the parity chunks computed from them
+    first = headers[0]
+    data_count = first.count - first.parity
+    encoder = fec.ParityEncoder(data_count, first.parity, _shard_size(first)) if first.parity else None
+    reader = SymbolReader(data)
+    for header in headers[:data_count]:
+        body = reader.read_bytes(header.length)
+        if len(body) < header.length:
+            raise ValueError(f"Payload ended early: expected {header.total} bytes.")
+        if encoder:
+            encoder.add(header.index, body)
+        yield body
+    if encoder:
+        yield from encoder.parity()
+
+
+def _shard_size(header: ChunkHeader) -> int:
+    # Size of every data chunk but the last, and of each parity chunk
+    return -(-header.total // (header.count - header.parity))
+
+
+def _encode_manifest_parallel(workers, chunks, output_dir, profile, output_zip, progress):
+    # Keep a bounded number of chunks in flight so payload slices are not all copied at once
+    results = []
+    pending = deque()
+    for path, header, body in chunks:
+        name = f'chunk_{header.index + 1}.png'
+        out_path = os.path.join(output_dir, name) if output_dir and output_zip is None else None
+        pending.append((name, pool_submit(workers, _encode_manifest_chunk, _picklable(path), header, body, out_path,
+                                             profile)))
+        if len(pending) >= workers * 2:
+            results.append(_collect_chunk(*pending.popleft(), output_zip, progress))
+    while pending:
+        results.append(_collect_chunk(*pending.popleft(), output_zip, progress))
+    logger.debug("All data encoded")
+    return results
+
+
+def _encode_manifest_chunk(img_path, header, body: bytes, out_path, profile):
+    # Worker: embed one chunk and compress the PNG
+    img = load_cover(img_path, header.mode)
+    embed_chunk(img, header, body)
+    return save_png(img, out_path, profile), len(body) * 8
+
+
+def _encode_stream(image_paths, data, length, output_dir, workers, output_profile, output_zip, mode, progress):
+    # Single length-framed stream across all covers, in cover order
+    total_symbols = mode.symbol_count(length + LENGTH_HEADER_SIZE)
+    total_bits = (length + LENGTH_HEADER_SIZE) * 8
+
+    if workers and workers > 1 and isinstance(data, (bytes, bytearray, memoryview)):
+        if process_pool(workers) is not None:
+            return _encode_stream_parallel(workers, image_paths, data, output_dir, output_profile,
+                                           output_zip, mode, progress)
+
+    reader = SymbolReader(struct.pack('>I', length), data, bits=mode.bits)
+
+    results = []
+    index = 0  # symbols embedded so far
 
     for i, img_path in enumerate(image_paths):
-        img = Image.open(img_path).convert('RGB')
-        pixels = list(img.getdata())
-        capacity_bits = len(pixels) * 3 * BITS_PER_CHANNEL
+        img = load_cover(img_path, mode)
+        capacity = channel_capacity(img, mode)
 
-        bits_this = min(total_bits - index, capacity_bits)
-        if bits_this <= 0:
-            print(f"⚠️ Skipping {img_path} (eempty chunk)")
+        count = min(total_symbols - index, capacity)
+        if count <= 0:
+            logger.warning("Skipping cover %d: nothing left to embed", i + 1)
             continue
 
-        new_pixels = []
-        di = 0  # bit index within this chunk
-
-        for r, g, b in pixels:
-            new_channels = []
-            for c in (r, g, b):
-                if di + 1 < bits_this:
-                    b1 = bit_list[index + di]
-                    b2 = bit_list[index + di + 1]
-                    new_c = (c & ~0b11) | int(b1 + b2, 2)
-                    di += 2
-                elif di < bits_this:
-                    b1 = bit_list[index + di]
-                    new_c = (c & ~0b11) | int(b1 + '0', 2)  # pad last bit with 0
-                    di += 1
-                else:
-                    new_c = c
-                new_channels.append(new_c)
-            new_pixels.append(tuple(new_channels))
-
-        index += bits_this
-        out_path = os.path.join(output_dir, f'chunk_{i+1}.png')
-        img.putdata(new_pixels)
-        img.save(out_path, 'PNG')
-        results.append(out_path)
-        print(f"✅ Saved: {out_path}, bits encoded: {bits_this}")
-
-        if index >= total_bits:
-            print("✅ All data successfully encoded.")
+        symbols = reader.read(count)
+        if len(symbols) < count:
+            raise ValueError(f"Payload ended early: expected {length} bytes.")
+
+        embed_symbols(img, symbols, mode)
+        index += count
+
+        name = f'chunk_{i+1}.png'
+        results.append(_write_chunk(img, name, output_dir, output_zip, output_profile))
+        logger.debug("Saved %s, bits encoded: %d", name, count * mode.bits)
+        if progress:
+            progress(1, count * mode.bits)
+
+        if index >= total_symbols:
+            logger.debug("All data encoded")
+            break
+
+    if index < total_symbols:
+        raise ValueError(f"❌ Not enough image capacity: needed {total_bits} bits, only encoded {index * mode.bits}")
+
+    return results
+
+
+def _decode_stream(image_paths, images, workers, progress):
+    if workers and workers > 1 and len(image_paths) > 1:
+        if process_pool(workers) is not None:
+            data = _decode_stream_parallel(workers, image_paths, progress)
+            logger.debug("Total payload: %d bytes -> %d bits", len(data), (len(data) + LENGTH_HEADER_SIZE) * 8)
+            return data
+
+    data = extract_bytes(images)
+    logger.debug("Total payload: %d bytes -> %d bits", len(data), (len(data) + LENGTH_HEADER_SIZE) * 8)
+    if progress:
+        progress(len(image_paths), (len(data) + LENGTH_HEADER_SIZE) * 8)
+    return data
+
+
+def _write_chunk(img, name, output_dir, output_zip, profile):
+    # Save one stego chunk to the archive, the output directory or memory
+    if output_zip is not None:
+        with output_zip.open(name, 'w') as entry:
+            save_png(img, entry, profile)
+        return name
+    out_path = os.path.join(output_dir, name) if output_dir else None
+    return save_png(img, out_path, profile)
+
+
+_pools = {}  # worker count -> ProcessPoolExecutor
+_pools_lock = threading.Lock()
+
+
+def process_pool(workers: int):
+    """The shared process pool of `workers` processes, started on first use.
+
+    Pools live for the whole process instead of one per call, and their
+    workers come from a fork server (or are spawned where there is none),
+    so a multithreaded caller such as the web app is never forked. As with
+    any non-fork start method, a script calling in here must guard its
+    entry point with `if __name__ == '__main__':`. Returns None where
+    worker processes are unavailable; callers then run serially.
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is not None:
+            return pool
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            # Workers fork from a server that has already imported this
+            # module, NumPy and Pillow
+            context.set_forkserver_preload([__name__])
+        else:
+            context = multiprocessing.get_context('spawn')
+        try:
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        except (OSError, NotImplementedError, ValueError) as e:
+            logger.warning("Process pool unavailable, running serially: %s", e)
+            return None
+        return pool
+
+
+def pool_submit(workers: int, fn, *args):
+    """Submit `fn(*args)` to the shared pool of `workers` processes.
+
+    A pool whose worker died refuses new tasks for good (tasks already in
+    it fail with BrokenProcessPool); it is then dropped and the task goes
+    to a fresh pool. Call only where `process_pool(workers)` gave a pool.
+    """
+    pool = process_pool(workers)
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        with _pools_lock:
+            if _pools.get(workers) is pool:
+                del _pools[workers]
+        pool.shutdown(wait=False)
+        pool = process_pool(workers)
+        if pool is None:
+            raise
+        return pool.submit(fn, *args)
+
+
+def _plan_stream(image_paths, total_symbols, mode):
+    # (chunk index, cover path, first symbol, symbol count) per cover used
+    plan = []
+    offset = 0
+    for i, path in enumerate(image_paths):
+        if offset >= total_symbols:
             break
+        count = min(total_symbols - offset, channel_count(path, mode))
+        plan.append((i, path, offset, count))
+        offset += count
+    return plan, offset
+
+
+def _encode_stream_parallel(workers, image_paths, data, output_dir, profile, output_zip, mode, progress):
+    data = memoryview(data).cast('B')
+    header = struct.pack('>I', len(data))
+    total_bits = (len(data) + LENGTH_HEADER_SIZE) * 8
+    total_symbols = mode.symbol_count(len(data) + LENGTH_HEADER_SIZE)
+    plan, planned = _plan_stream(image_paths, total_symbols, mode)
 
-    if index < total_bits:
-        raise ValueError(f"❌ Not enough image capacity: needed {total_bits} bits, only encoded {index}")
+    if planned < total_symbols:
+        raise ValueError(f"❌ Not enough image capacity: needed {total_bits} bits, only encoded {planned * mode.bits}")
 
+    # Keep a bounded number of chunks in flight so payload slices are not all copied at once
+    results = []
+    pending = deque()
+    for i, path, start, count in plan:
+        name = f'chunk_{i+1}.png'
+        out_path = os.path.join(output_dir, name) if output_dir and output_zip is None else None
+        part, skip = framed_slice(header, data, start, count, mode.bits)
+        pending.append((name, pool_submit(workers, _encode_stream_chunk, _picklable(path), part, skip, count,
+                                          out_path, profile, mode)))
+        if len(pending) >= workers * 2:
+            results.append(_collect_chunk(*pending.popleft(), output_zip, progress))
+    while pending:
+        results.append(_collect_chunk(*pending.popleft(), output_zip, progress))
+    logger.debug("All data encoded")
     return results
 
 
-def decode_chunks_from_images(image_paths):
-    bit_arrays = []
+def _collect_chunk(name, future, output_zip, progress):
+    output, bits = future.result()
+    logger.debug("Saved %s, bits encoded: %d", name, bits)
+    if progress:
+        progress(1, bits)
+    if output_zip is not None:
+        output_zip.writestr(name, output)
+        return name
+    return output
+
+
+def _encode_stream_chunk(img_path, part: bytes, skip: int, count: int, out_path, profile, mode):
+    # Worker: embed one cover's share of the payload and compress the PNG
+    img = load_cover(img_path, mode)
+    stream = np.unpackbits(np.frombuffer(part, dtype=np.uint8))[skip:skip + count * mode.bits]
+    embed_symbols(img, bits_to_symbols(stream, mode.bits), mode)
+    return save_png(img, out_path, profile), count * mode.bits
 
-    for path in image_paths:
-        img = Image.open(path).convert('RGB')
-        raw = np.frombuffer(img.tobytes(), dtype=np.uint8)
-        two_bits = raw & 0b11  # Array of 2-bit values (0–3)
-        bit_arrays.append(two_bits)
-        print(f"Decoded chunk {os.path.basename(path)}: {len(two_bits)*BITS_PER_CHANNEL} bits")
 
-    all_bits = np.concatenate(bit_arrays)
-    # Convert to a string of bits
-    binary = ''.join(f"{b:02b}" for b in all_bits)
+def _decode_stream_parallel(workers, image_paths, progress):
+    images = [open_image(path) for path in image_paths]
+    mode, data_len = read_frame_header(images)
+    total_symbols = mode.symbol_count(data_len + LENGTH_HEADER_SIZE)
+    plan, planned = _plan_stream(image_paths, total_symbols, mode)
 
-    # Extract header
-    if len(binary) < 32:
-        raise ValueError("Not enough data for header")
-    hbits = binary[:32]
-    data_len = struct.unpack('>I', int(hbits, 2).to_bytes(4, 'big'))[0]
-    total_bits = (data_len + 4) * 8
+    if planned < total_symbols:
+        raise ValueError(f"Incomplete data: expected {(data_len + LENGTH_HEADER_SIZE) * 8} bits, got {planned * mode.bits} bits")
 
-    if len(binary) < total_bits:
-        raise ValueError(f"Incomplete data: expected {total_bits}, got {len(binary)} bits")
+    symbols = np.empty(total_symbols, dtype=np.uint8)
+    futures = [(start, pool_submit(workers, _extract_stream_chunk, _picklable(path), count, mode))
+               for _, path, start, count in plan]
+    for start, future in futures:
+        part = future.result()
+        symbols[start:start + len(part)] = part
+        if progress:
+            progress(1, len(part) * mode.bits)
+    return unframe_symbols(symbols, data_len, mode)
 
-    data_bits = binary[32:total_bits]
-    print(f"Total payload: {data_len} bytes -> {total_bits} bits")
 
-    # Convert bitstring to bytes
-    return bytes(int(data_bits[i:i+8], 2) for i in range(0, len(data_bits), 8))
\ No newline at end of file
+def _extract_stream_chunk(img_path, count: int, mode):
+    # Worker: read the low bits of the first `count` payload slots of one image
+    return read_symbols(open_image(img_path), 0, count, mode)
@@ -0,0 +1,129 @@
+import itertools
+import struct
+from collections import namedtuple
+from .compression_utils import (
+    COMPRESSION_BZ2, COMPRESSION_LZMA, COMPRESSION_NONE, COMPRESSION_ZIP, COMPRESSION_ZLIB, COMPRESSION_ZSTD,
+    decompress, decompress_stream, unzip_bytes,
+)
+
+# Versioned header written in front of every (plaintext) payload so the
+# decoder can dispatch in a single pass:
+#   magic (4) | version (1) | type (1) | compression (1) | flags (1)
+#   | filename length (2, big-endian) | filename (utf-8)
+# The compression byte is one of the codec IDs in compression_utils. The
+# magic starts with a NUL byte, which neither a legacy ZIP payload nor a
+# legacy `name::FN::` filename can start with.
+PAYLOAD_MAGIC = b'\x00SGP'
+PAYLOAD_VERSION = 2
+_HEADER = struct.Struct('>4sBBBBH')
+
+# Version 1 had the same fields behind a bare b'SGP', which a legacy
+# filename may also start with; such a header only counts when every
+# field is one version 1 could have written.
+_V1_MAGIC = b'SGP'
+_V1_HEADER = struct.Struct('>3sBBBBH')
+_CODEC_IDS = (COMPRESSION_NONE, COMPRESSION_ZIP, COMPRESSION_ZLIB, COMPRESSION_LZMA, COMPRESSION_BZ2,
+              COMPRESSION_ZSTD)
+
+PAYLOAD_TEXT = 1
+PAYLOAD_FILE = 2
+
+FLAG_MULTI_CHUNK = 0x01  # payload was spread across several cover images
+
+LEGACY_FILENAME_MARKER = b'::FN::'
+_ZIP_SIGNATURE = b'PK\x03\x04'
+
+PayloadHeader = namedtuple('PayloadHeader', 'version payload_type compression flags filename')
+
+
+def pack_payload(body: bytes, payload_type: int, compression: int,
+                 filename: str = '', flags: int = 0) -> bytes:
+    name = filename.encode()
+    header = _HEADER.pack(PAYLOAD_MAGIC, PAYLOAD_VERSION, payload_type, compression, flags, len(name))
+    return header + name + body
+
+
+def unpack_payload(data: bytes):
+    """Split a decrypted payload into (PayloadHeader, body).
+
+    Returns (None, data) for legacy payloads written without a header.
+    """
+    layout = _header_layout(data)
+    if layout is None or len(data) < layout.size:
+        return None, data
+
+    magic, version, payload_type, compression, flags, name_len = layout.unpack_from(data)
+    end = layout.size + name_len
+    if layout is _V1_HEADER:
+        if (version != 1 or payload_type not in (PAYLOAD_TEXT, PAYLOAD_FILE) or compression not in _CODEC_IDS
+                or flags & ~FLAG_MULTI_CHUNK or len(data) < end):
+            return None, data
+        try:
+            filename = bytes(data[layout.size:end]).decode()
+        except UnicodeDecodeError:
+            return None, data
+        return PayloadHeader(version, payload_type, compression, flags, filename), data[end:]
+
+    if version > PAYLOAD_VERSION:
+        raise ValueError(f"Unsupported payload version {version}.")
+    filename = bytes(data[layout.size:end]).decode()
+    return PayloadHeader(version, payload_type, compression, flags, filename), data[end:]
+
+
+def _header_layout(data):
+    # The header struct `data` starts with, or None if it has no header
+    if bytes(data[:len(PAYLOAD_MAGIC)]) == PAYLOAD_MAGIC:
+        return _HEADER
+    if bytes(data[:len(_V1_MAGIC)]) == _V1_MAGIC:
+        return _V1_HEADER
+    return None
+
+
+def read_payload(data: bytes):
+    """Return (payload_type, filename, content) for a decrypted payload.
+
+    Headered payloads dispatch directly; legacy ones fall back to the old
+    layouts (a zipped text archive, or `name::FN::zip` for files).
+    """
+    header, body = unpack_payload(data)
+    if header is not None:
+        return header.payload_type, header.filename, decompress(body, header.compression)
+
+    if data.startswith(_ZIP_SIGNATURE):
+        name, content = next(iter(unzip_bytes(data).items()))
+        return PAYLOAD_TEXT, name, content
+    if LEGACY_FILENAME_MARKER in data:
+        filename, zipped = data.split(LEGACY_FILENAME_MARKER, 1)
+        return PAYLOAD_FILE, filename.decode(), next(iter(unzip_bytes(zipped).values()))
+    return PAYLOAD_TEXT, '', data
+
+
+def stream_payload(segments):
+    """read_payload for a payload arriving in pieces (say, from decrypt_stream).
+
+    Returns (payload_type, filename, chunks), where `chunks` yields the
+    content as it is decompressed. Only the header is gathered up front;
+    legacy payloads, which have none, are read whole and go through
+    read_payload.
+    """
+    segments = iter(segments)
+    head = bytearray()
+    layout = None
+    needed = _HEADER.size  # enough to tell either header layout apart
+    for segment in segments:
+        head += segment
+        if layout is None and len(head) >= needed:
+            layout = _header_layout(head)
+            if layout is None:
+                break
+            needed = layout.size + layout.unpack_from(head)[-1]  # the filename follows
+        if layout is not None and len(head) >= needed:
+            break
+    header, body = unpack_payload(head) if layout is not None and len(head) >= needed else (None, head)
+    if header is None:
+        for segment in segments:
+            head += segment
+        payload_type, filename, content = read_payload(bytes(head))
+        return payload_type, filename, iter([content])
+
+    return header.payload_type, header.filename, decompress_stream(itertools.chain([body], segments), header.compression)
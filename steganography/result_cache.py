@@ -0,0 +1,180 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import threading
+from . import metrics
+
+# On-disk cache of finished encode results, for client retries.
+#
+# A client that times out and sends the same encode again would otherwise
+# pay for compression, the KDF, encryption, embedding and PNG output a
+# second time. Requests that carry an idempotency key are looked up by a
+# digest of that key and everything that determines the output (cover
+# bytes, payload, password and settings); a hit returns the stored PNG or
+# chunk archive as it was first sent. Entries are evicted least recently
+# used first once the cache grows past its byte budget; a hit refreshes the
+# entry's mtime, which is the recency the eviction goes by.
+#
+# A stored result embeds the salt and nonce drawn when it was encrypted, so
+# it is only ever returned for the same idempotency key and the same
+# inputs: requests without a key are not cached, and any other request
+# encrypts afresh. Keys are HMACs under a random secret kept in the cache
+# directory, so entry names reveal nothing about payloads or passwords.
+
+RESULT_CACHE_DIR = os.environ.get('STEGO_RESULT_CACHE_DIR', '')
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('STEGO_RESULT_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+READ_SIZE = 1024 * 1024
+SECRET_NAME = 'secret'
+_ENTRY = re.compile(r'[0-9a-f]{64}\Z')
+
+
+class ResultCache:
+    def __init__(self, root: str, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._counts = dict.fromkeys(('hit', 'miss', 'store', 'evict'), 0)
+        self._lock = threading.Lock()
+        self._secret = None
+
+    def key(self, idempotency_key: str, params: dict, inputs=()) -> str:
+        """Digest of one request for get() and put().
+
+        `params` must be JSON-serialisable; `inputs` are (name, data) pairs
+        whose data is bytes or a seekable file, hashed from the start and
+        rewound afterwards.
+        """
+        digest = hmac.new(self._secret_key(), digestmod=hashlib.sha256)
+        for part in (idempotency_key, json.dumps(params, sort_keys=True)):
+            _update_framed(digest, part.encode('utf-8'))
+        for name, data in inputs:
+            _update_framed(digest, name.encode('utf-8'))
+            _update_framed(digest, _content_digest(data))
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        # The stored result, or None; a hit makes the entry the most recently used
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self._record('miss')
+            return None
+        self._record('hit')
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        # Write to a temporary file and rename, so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._record('store')
+        self._evict()
+
+    def stats(self) -> dict:
+        # Hit counts are this process's; entries and bytes are the shared directory's
+        entries = self._entries()
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts['hit'] + counts['miss']
+        return {
+            'hits': counts['hit'],
+            'misses': counts['miss'],
+            'hit_rate': counts['hit'] / lookups if lookups else 0.0,
+            'stores': counts['store'],
+            'evictions': counts['evict'],
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+    def _path(self, key: str) -> str:
+        if not _ENTRY.match(key or ''):
+            raise ValueError(f"Invalid result cache key '{key}'.")
+        return os.path.join(self.root, key)
+
+    def _entries(self):
+        # (mtime, size, path) of every entry, oldest first
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for name in os.listdir(self.root):
+            if not _ENTRY.match(name):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue  # evicted by another worker meanwhile
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                self._record('evict')
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _record(self, event):
+        with self._lock:
+            self._counts[event] += 1
+        metrics.count('result_cache', event=event)
+
+    def _secret_key(self) -> bytes:
+        # Created once per cache directory and shared by every worker using it
+        if self._secret is None:
+            path = os.path.join(self.root, SECRET_NAME)
+            try:
+                with open(path, 'rb') as f:
+                    self._secret = f.read()
+            except FileNotFoundError:
+                os.makedirs(self.root, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(os.urandom(32))
+                try:
+                    os.link(tmp, path)  # the first worker to get here wins
+                except FileExistsError:
+                    pass
+                finally:
+                    os.unlink(tmp)
+                with open(path, 'rb') as f:
+                    self._secret = f.read()
+        return self._secret
+
+
+def _update_framed(digest, data: bytes):
+    # Length-prefixed, so adjacent parts cannot run into each other
+    digest.update(len(data).to_bytes(8, 'big'))
+    digest.update(data)
+
+
+def _content_digest(data) -> bytes:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(data).digest()
+    digest = hashlib.sha256()
+    data.seek(0)
+    for block in iter(lambda: data.read(READ_SIZE), b''):
+        digest.update(block)
+    data.seek(0)
+    return digest.digest()
@@ -0,0 +1,455 @@
+import io
+import os
+import struct
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from . import metrics
+from .capacity import read_image_size
+from .embedding import (
+    BITS_PER_CHANNEL, DEFAULT_MODE, DEFAULT_PNG_PROFILE, HEADER_SYMBOLS, LENGTH_HEADER_SIZE, PNG_PROFILES,
+    STREAM_READ_SIZE, EmbedMode, StoredCover, _has_alpha, bits_to_symbols, framed_slice, load_cover, open_image,
+    pack_symbols, read_pixels, symbols_to_bytes, write_pixels,
+)
+
+# Tiled embedding for very large single covers.
+#
+# The on-image layout is unchanged: the frame still runs through the pixels
+# in order, so tiled and flat encodes decode either way. Only the work is
+# split: the image is handled as bands of BAND_ROWS rows, each band embeds
+# or extracts its own slice of the payload on a thread pool (NumPy and zlib
+# release the GIL for the bulk of it), and output PNGs are written band by
+# band, each band deflated on its own and the pieces joined into one stream.
+#
+# 8-bit RGB/RGBA PNGs are decoded from the IDAT stream a band at a time, as
+# long as their rows use the None, Sub or Up filters (everything written
+# here does), so memory follows the band size rather than the image. Any
+# other cover, or a PNG that turns out to use Average or Paeth rows, is
+# handed to Pillow for the remaining rows, which decodes it whole.
+BAND_ROWS = int(os.environ.get('STEGO_BAND_ROWS', 256))
+TILE_WORKERS = int(os.environ.get('STEGO_TILE_WORKERS', os.cpu_count() or 1))
+# Covers this large (in pixels) are tiled automatically; 0 turns that off
+TILE_MIN_PIXELS = int(os.environ.get('STEGO_TILE_MIN_PIXELS', 50_000_000))
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_ZLIB_HEADER = b'\x78\x9c'
+_ADLER_BASE = 65521
+# Enough pixels in the first band for the mode and length headers
+_MIN_BAND_PIXELS = 64
+
+
+class _Unsupported(Exception):
+    # The PNG needs Pillow: a layout or row filter the band decoder skips
+    pass
+
+
+def use_tiles(source, tiled=None) -> bool:
+    """Whether to process `source` in bands.
+
+    An explicit `tiled` wins; otherwise covers of at least TILE_MIN_PIXELS
+    are tiled. Only the image header is read.
+    """
+    if tiled is not None:
+        return bool(tiled)
+    if not TILE_MIN_PIXELS or isinstance(source, Image.Image):
+        return False
+    if isinstance(source, StoredCover):
+        width, height = source.size
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        width, height = read_image_size(io.BytesIO(source))
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            width, height = read_image_size(f)
+    else:
+        width, height = read_image_size(source)
+    return width * height >= TILE_MIN_PIXELS
+
+
+def embed_bytes_tiled(image_source, data, output=None, output_profile: str = DEFAULT_PNG_PROFILE,
+                      mode: EmbedMode = DEFAULT_MODE, workers: int = None, band_rows: int = BAND_ROWS):
+    """Frame and embed `data` band by band, writing the stego PNG as it goes.
+
+    Same result as embed_bytes, pixel for pixel; only the PNG encoding
+    differs. Returns the PNG bytes when no output is given.
+    """
+    if output_profile not in PNG_PROFILES:
+        raise ValueError(f"Unknown PNG output profile '{output_profile}'.")
+    options = PNG_PROFILES[output_profile]
+    level = options.get('compress_level', 6)
+    strategy = options.get('compress_type', zlib.Z_DEFAULT_STRATEGY)
+
+    cover = BandSource(image_source, mode.image_mode)
+    width, height = cover.size
+    count = mode.symbol_count(len(data) + LENGTH_HEADER_SIZE)
+    if count > mode.capacity(width, height):
+        cover.close()
+        raise ValueError("Payload too large to encode in this image.")
+    # (first pixel, mode, header, data, symbols) for each run of symbols
+    segments = [(mode.header_pixels, mode, struct.pack('>I', len(data)), memoryview(data).cast('B'), count)]
+    if not mode.is_default:
+        segments.insert(0, (0, DEFAULT_MODE, mode.pack(), b'', HEADER_SYMBOLS))
+
+    workers = workers or TILE_WORKERS
+    rows = _band_rows(width, band_rows)
+    target = io.BytesIO() if output is None else output
+    with metrics.span('embed_tiled', symbols=count, bits=mode.bits, workers=workers, profile=output_profile), \
+            _open_output(target) as stream, ThreadPoolExecutor(max_workers=workers) as pool:
+        writer = _PngWriter(stream, width, height, cover.channels)
+        pending = deque()
+        for top, band in cover.bands(rows):
+            final = top + len(band) >= height
+            pending.append(pool.submit(_encode_band, band, top * width, segments, level, strategy, final))
+            if len(pending) >= workers * 2:
+                writer.write(*pending.popleft().result())
+        while pending:
+            writer.write(*pending.popleft().result())
+        writer.close()
+    metrics.count('payload_bytes', len(data), stage='embed')
+    metrics.count('pixels', width * height, stage='embed_tiled')
+    return target.getvalue() if output is None else output
+
+
+def extract_bytes_tiled(image_source, workers: int = None, band_rows: int = BAND_ROWS) -> bytes:
+    """Read a length-framed payload from one image, band by band.
+
+    Bands stop being decoded once the payload is complete. Payload bytes
+    are split at multiples of 8 pixels, which always hold whole bytes, so
+    each band's share is unpacked straight into the output.
+    """
+    cover = BandSource(image_source)
+    width, height = cover.size
+    workers = workers or TILE_WORKERS
+    bands = cover.bands(_band_rows(width, band_rows))
+    with metrics.span('extract_tiled', workers=workers) as stage, ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            top, band = next(bands)
+            mode, data_len = _frame_header(band.reshape(-1, cover.channels))
+            total = mode.symbol_count(data_len + LENGTH_HEADER_SIZE)
+            available = mode.capacity(width, height)
+            if available < total:
+                raise ValueError(f"Incomplete data: expected {(data_len + LENGTH_HEADER_SIZE) * 8} bits, "
+                                 f"got {available * mode.bits} bits")
+
+            out = np.zeros(data_len, dtype=np.uint8)
+            per_pixel = len(mode.channels)
+            start_pixel = mode.header_pixels
+            end_pixel = start_pixel + -(-total // per_pixel)
+            carry, pending = None, deque()
+            while True:
+                pixels, first = band.reshape(-1, cover.channels), top * width
+                if carry is not None:
+                    pixels, first = np.concatenate((carry, pixels)), carry_first
+                last = first + len(pixels)
+                cut = end_pixel if last >= end_pixel else start_pixel + (last - start_pixel) // 8 * 8
+                lo = max(first, start_pixel)
+                if cut > lo:
+                    start = (lo - start_pixel) * per_pixel
+                    count = min((cut - start_pixel) * per_pixel, total) - start
+                    pending.append(pool.submit(_extract_run, pixels[lo - first:cut - first], count, mode,
+                                               start * mode.bits // 8, out))
+                    if len(pending) >= workers * 2:
+                        pending.popleft().result()
+                if last >= end_pixel:
+                    break
+                carry, carry_first = pixels[cut - first:], cut
+                top, band = next(bands)
+            while pending:
+                pending.popleft().result()
+        finally:
+            bands.close()
+        stage.set(payload_bytes=data_len, bits=mode.bits)
+    metrics.count('payload_bytes', data_len, stage='extract')
+    return out.tobytes()
+
+
+class BandSource:
+    """Pixels of a cover handed out as bands of rows, top to bottom.
+
+    `image_mode` ('RGB' or 'RGBA') converts like load_cover; with None the
+    cover keeps its own RGB or RGBA layout. `size` and `channels` are known
+    up front, before any pixels are decoded.
+    """
+
+    def __init__(self, source, image_mode: str = None):
+        self.source = source
+        self.image_mode = image_mode
+        self._png = self._image = self._file = None
+        self._start = None
+        if isinstance(source, StoredCover):
+            if image_mode == 'RGBA':
+                raise ValueError("Stored covers have no alpha channel.")
+            self.size, self.channels = source.size, 3
+            return
+        if not isinstance(source, Image.Image):
+            self._png = self._open_png()
+        if self._png is not None and (image_mode != 'RGBA' or self._png.channels == 4):
+            self.size = (self._png.width, self._png.height)
+            self.channels = len(image_mode) if image_mode else self._png.channels
+        else:
+            self.close()
+            self._image = self._load()
+            self.size, self.channels = self._image.size, len(self._image.mode)
+
+    def bands(self, rows: int):
+        # Yields (top row, writable (rows, width, channels) uint8 array)
+        top = 0
+        width, height = self.size
+        try:
+            if isinstance(self.source, StoredCover):
+                pixels = self.source.pixels()
+                for top in range(0, height, rows):
+                    yield top, np.array(pixels[top:top + rows])
+                return
+            if self._png is not None:
+                try:
+                    for band in self._png.bands(rows):
+                        if band.shape[-1] != self.channels:
+                            band = np.ascontiguousarray(band[..., :self.channels])
+                        yield top, band
+                        top += len(band)
+                    return
+                except _Unsupported:
+                    self.close()
+                    self._image = self._load()
+            for top in range(top, height, rows):
+                yield top, np.array(self._image.crop((0, top, width, min(top + rows, height))))
+        finally:
+            self.close()
+
+    def close(self):
+        if self._file is not None and self._file is not self.source:
+            self._file.close()
+        self._file = self._png = None
+
+    def _stream(self):
+        # A fresh binary stream positioned at the start of the image
+        source = self.source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return io.BytesIO(source)
+        if isinstance(source, (str, os.PathLike)):
+            return open(source, 'rb')
+        if self._start is None:
+            self._start = source.tell()
+        source.seek(self._start)
+        return source
+
+    def _open_png(self):
+        self._file = self._stream()
+        try:
+            return _PngRows(self._file)
+        except _Unsupported:
+            self.close()
+            return None
+
+    def _load(self):
+        # Pillow decode of the whole cover, converted as load_cover would
+        source = self.source if isinstance(self.source, Image.Image) else self._stream()
+        if self.image_mode:
+            return load_cover(source, EmbedMode(channels=self.image_mode))
+        image = open_image(source)
+        return image.convert('RGBA' if _has_alpha(image) else 'RGB')
+
+
+class _PngRows:
+    """Band decoder for non-interlaced 8-bit RGB and RGBA PNGs.
+
+    Reads chunks up to the first IDAT on construction; bands() then inflates
+    just enough of the image data for each band. Raises _Unsupported for
+    anything else, including a row filtered with Average or Paeth (those
+    depend on the pixel to their left and do not vectorise).
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        if stream.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+            raise _Unsupported
+        kind, data = self._chunk()
+        if kind != b'IHDR':
+            raise _Unsupported
+        self.width, self.height, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', data)
+        if depth != 8 or color not in (2, 6) or interlace:
+            raise _Unsupported
+        self.channels = 4 if color == 6 else 3
+        while True:
+            length, kind = struct.unpack('>I4s', self._read(8))
+            if kind == b'IDAT':
+                self._idat_length = length
+                return
+            if kind in (b'tRNS', b'IEND'):
+                raise _Unsupported  # transparency needs Pillow's conversion
+            self._read(length + 4)
+
+    def _read(self, size: int) -> bytes:
+        data = self._stream.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated PNG file.")
+        return data
+
+    def _chunk(self):
+        length, kind = struct.unpack('>I4s', self._read(8))
+        data = self._read(length)
+        self._read(4)
+        return kind, data
+
+    def _idat(self):
+        # IDAT payload pieces, CRC-checked, until the first other chunk
+        length = self._idat_length
+        while True:
+            crc = zlib.crc32(b'IDAT')
+            while length:
+                piece = self._read(min(length, STREAM_READ_SIZE))
+                crc = zlib.crc32(piece, crc)
+                length -= len(piece)
+                yield piece
+            if struct.unpack('>I', self._read(4))[0] != crc:
+                raise ValueError("Broken PNG file: bad IDAT checksum.")
+            length, kind = struct.unpack('>I4s', self._read(8))
+            if kind != b'IDAT':
+                return
+
+    def bands(self, rows: int):
+        stride = 1 + self.width * self.channels
+        inflate = zlib.decompressobj()
+        pieces = self._idat()
+        prior = np.zeros(self.width * self.channels, dtype=np.uint8)
+        for top in range(0, self.height, rows):
+            count = min(rows, self.height - top)
+            raw = bytearray()
+            while len(raw) < count * stride:
+                # Drain pending output first; feed more IDAT data only when dry
+                chunk = inflate.decompress(inflate.unconsumed_tail, count * stride - len(raw))
+                if not chunk:
+                    piece = next(pieces, None)
+                    if piece is None or inflate.eof:
+                        raise ValueError("Truncated PNG image data.")
+                    chunk = inflate.decompress(piece, count * stride - len(raw))
+                raw += chunk
+            filtered = np.frombuffer(raw, dtype=np.uint8).reshape(count, stride)
+            kinds = filtered[:, 0]
+            if kinds.max() > 2:
+                if kinds.max() > 4:
+                    raise ValueError("Broken PNG file: unknown row filter.")
+                raise _Unsupported
+            band = np.empty((count, self.width * self.channels), dtype=np.uint8)
+            for i, kind in enumerate(kinds):
+                row = filtered[i, 1:]
+                if kind == 0:
+                    band[i] = row
+                elif kind == 1:
+                    band[i] = row.reshape(-1, self.channels).cumsum(axis=0, dtype=np.uint8).reshape(-1)
+                else:
+                    np.add(row, prior, out=band[i])
+                prior = band[i]
+            prior = prior.copy()  # the band is the caller's to modify
+            yield band.reshape(count, self.width, self.channels)
+
+
+class _PngWriter:
+    # Streams a PNG whose IDAT data arrives as raw deflate pieces, each
+    # ending on a byte boundary (sync flush), with their Adler-32 checksums
+    def __init__(self, stream, width: int, height: int, channels: int):
+        self._stream = stream
+        self._adler = 1
+        self._started = False
+        stream.write(PNG_SIGNATURE)
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6 if channels == 4 else 2, 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self._stream.write(struct.pack('>I', len(data)) + kind)
+        self._stream.write(data)
+        self._stream.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, deflated: bytes, adler: int, length: int):
+        if not self._started:
+            deflated = _ZLIB_HEADER + deflated
+            self._started = True
+        self._adler = _adler32_combine(self._adler, adler, length)
+        self._chunk(b'IDAT', deflated)
+
+    def close(self):
+        self._chunk(b'IDAT', struct.pack('>I', self._adler))
+        self._chunk(b'IEND', b'')
+
+
+def _adler32_combine(adler1: int, adler2: int, length2: int) -> int:
+    # Adler-32 of A + B from those of A and B (zlib's adler32_combine)
+    rem = length2 % _ADLER_BASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = rem * sum1 % _ADLER_BASE
+    sum1 += (adler2 & 0xFFFF) + _ADLER_BASE - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + _ADLER_BASE - rem
+    return sum1 % _ADLER_BASE | sum2 % _ADLER_BASE << 16
+
+
+def _band_rows(width: int, rows: int) -> int:
+    return max(rows, -(-_MIN_BAND_PIXELS // width), 1)
+
+
+@contextmanager
+def _open_output(output):
+    # A path is opened (and closed) here; a file-like object is the caller's
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb') as f:
+            yield f
+    else:
+        yield output
+
+
+def _encode_band(band, first_pixel: int, segments, level: int, strategy: int, final: bool):
+    # Embed this band's share of each segment, then filter and deflate it
+    pixels = band.reshape(-1, band.shape[-1])
+    for start_pixel, mode, header, data, count in segments:
+        per_pixel = len(mode.channels)
+        lo = max((first_pixel - start_pixel) * per_pixel, 0)
+        hi = min((first_pixel + len(pixels) - start_pixel) * per_pixel, count)
+        if hi <= lo:
+            continue
+        part, skip = framed_slice(header, data, lo, hi - lo, mode.bits)
+        stream = np.unpackbits(np.frombuffer(part, dtype=np.uint8))[skip:skip + (hi - lo) * mode.bits]
+        first = start_pixel + lo // per_pixel - first_pixel
+        write_pixels(pixels[first:], bits_to_symbols(stream, mode.bits), mode, lo % per_pixel)
+
+    # Sub filter (stored profiles: None) keeps each row independent of the
+    # band above, so bands deflate in any order
+    rows = band.reshape(len(band), -1)
+    raw = np.empty((len(band), rows.shape[1] + 1), dtype=np.uint8)
+    if level:
+        raw[:, 0] = 1
+        raw[:, 1:] = rows
+        raw[:, 1 + band.shape[-1]:] -= rows[:, :-band.shape[-1]]
+    else:
+        raw[:, 0] = 0
+        raw[:, 1:] = rows
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, 8, strategy)
+    deflated = compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+    return deflated, zlib.adler32(raw), raw.size
+
+
+def _frame_header(pixels: np.ndarray):
+    # (mode, payload length) from the first pixels of an image
+    header = symbols_to_bytes(read_pixels(pixels, HEADER_SYMBOLS), BITS_PER_CHANNEL)
+    if len(header) < LENGTH_HEADER_SIZE:
+        raise ValueError("Not enough data for header")
+    mode = EmbedMode.unpack(header)
+    if mode is None:
+        return DEFAULT_MODE, struct.unpack('>I', header)[0]
+    if max(mode.channel_indices) >= pixels.shape[1]:
+        raise ValueError("Image has no alpha channel.")
+    length = symbols_to_bytes(read_pixels(pixels[mode.header_pixels:], mode.symbol_count(LENGTH_HEADER_SIZE), mode),
+                              mode.bits)
+    if len(length) < LENGTH_HEADER_SIZE:
+        raise ValueError("Not enough data for header")
+    return mode, struct.unpack('>I', length[:LENGTH_HEADER_SIZE])[0]
+
+
+def _extract_run(pixels: np.ndarray, count: int, mode: EmbedMode, frame_offset: int, out: np.ndarray):
+    # Unpack `count` symbols into frame bytes from `frame_offset`, minus the length header
+    data = pack_symbols(read_pixels(pixels, count, mode), mode.bits)
+    offset = frame_offset - LENGTH_HEADER_SIZE
+    if offset < 0:
+        data, offset = data[-offset:], 0
+    data = data[:len(out) - offset]
+    out[offset:offset + len(data)] = data
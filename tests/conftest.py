@@ -0,0 +1,58 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+@pytest.fixture
+def make_png():
+    # make_png(width, height, mode='RGB') -> PNG bytes of random pixels
+    rng = np.random.default_rng(0)
+
+    def make(width, height, mode='RGB'):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (height, width, len(mode)), dtype=np.uint8), mode).save(buffer, 'PNG')
+        return buffer.getvalue()
+    return make
+
+
+@pytest.fixture
+def damage():
+    # damage(png) -> the image with a few pixels past the chunk header flipped
+    def flip(png):
+        pixels = np.array(Image.open(io.BytesIO(png)))
+        pixels.reshape(-1, pixels.shape[2])[70:75] ^= 7
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, 'PNG')
+        return buffer.getvalue()
+    return flip
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    # The app with its stores under tmp_path and the serial encode path
+    from app import app
+    saved = dict(app.config)
+    app.config.update(TESTING=True, STEGO_WORKERS=1, STEGO_COVER_DIR=str(tmp_path / 'covers'),
+                      STEGO_RESULT_CACHE_DIR='')
+    yield app
+    queue = app.extensions.pop('stego_jobs', None)
+    if queue is not None:
+        queue.shutdown()
+    app.extensions.pop('stego_results', None)
+    app.config.clear()
+    app.config.update(saved)
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+def upload(data: bytes, name: str):
+    # A file part for the test client's multipart forms
+    return io.BytesIO(data), name
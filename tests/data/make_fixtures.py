@@ -0,0 +1,73 @@
+"""Regenerate the stego images that older releases wrote, for test_compat.
+
+Run against a checkout of the release in question, which must come first
+on the path:
+
+    PYTHONPATH=<baseline checkout> python tests/data/make_fixtures.py baseline
+    PYTHONPATH=<checkout of the first chunk headers> python tests/data/make_fixtures.py chunks-v1
+
+`baseline` is the original code: one-shot AES-GCM tokens, ZIP payloads
+and a single length-framed stream across covers. `chunks-v1` is the first
+release with per-chunk headers (version 1, without parity or body CRC),
+carrying the streaming container and a headered payload.
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'fixture-password'
+TEXT = 'legacy text payload'
+FILE_NAME = 'doc.bin'
+FILE_BYTES = bytes(range(256)) * 2
+MULTI_TEXT = 'legacy multi-image payload ' + ''.join(f'{i:04x}' for i in range(300))
+
+
+def cover(path, width, height, seed):
+    pixels = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(path)
+    return path
+
+
+def baseline(tmp):
+    from steganography import encryption, file_steganography, multi_image_steganography, text_steganography
+    from steganography.compression_utils import zip_file, zip_text
+
+    text_steganography.encode_text_to_image(cover(os.path.join(tmp, 'a.png'), 48, 32, 1),
+                                            encryption.encrypt_data(zip_text(TEXT), PASSWORD),
+                                            os.path.join(DATA_DIR, 'baseline_text.png'))
+    doc = os.path.join(tmp, FILE_NAME)
+    with open(doc, 'wb') as f:
+        f.write(FILE_BYTES)
+    file_steganography.encode_file_to_image(cover(os.path.join(tmp, 'b.png'), 48, 32, 2),
+                                            encryption.encrypt_data(FILE_NAME.encode() + b'::FN::' + zip_file(doc),
+                                                                    PASSWORD),
+                                            os.path.join(DATA_DIR, 'baseline_file.png'))
+    covers = [cover(os.path.join(tmp, f'm{i}.png'), 24, 16, 10 + i) for i in range(3)]
+    multi_image_steganography.encode_chunks_to_images(covers, encryption.encrypt_data(zip_text(MULTI_TEXT), PASSWORD),
+                                                      tmp)
+    for n in (1, 2, 3):
+        os.replace(os.path.join(tmp, f'chunk_{n}.png'), os.path.join(DATA_DIR, f'baseline_chunk_{n}.png'))
+
+
+def chunks_v1(tmp):
+    from steganography import encryption, multi_image_steganography
+    from steganography.compression_utils import compress
+    from steganography.payload import FLAG_MULTI_CHUNK, PAYLOAD_TEXT, pack_payload
+
+    codec, packed = compress(MULTI_TEXT.encode(), 'zlib-6')
+    token = encryption.encrypt_data(pack_payload(packed, PAYLOAD_TEXT, codec, flags=FLAG_MULTI_CHUNK), PASSWORD)
+    covers = [cover(os.path.join(tmp, f'v{i}.png'), 24, 16, 20 + i) for i in range(3)]
+    for n, chunk in enumerate(multi_image_steganography.encode_chunks_to_images(covers, token), 1):
+        with open(os.path.join(DATA_DIR, f'v1_chunk_{n}.png'), 'wb') as f:
+            f.write(chunk)
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        {'baseline': baseline, 'chunks-v1': chunks_v1}[sys.argv[1]](tmp)
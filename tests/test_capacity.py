@@ -0,0 +1,179 @@
+import io
+import os
+import struct
+
+import pytest
+from PIL import Image
+
+from steganography.capacity import (
+    capacity_for_size, plan_capacity, plan_shards, read_image_size, recommend_covers, required_bytes, stream_capacity,
+)
+from steganography.encryption import encrypt_data, encrypted_size
+from steganography.file_steganography import encode_file_to_image
+from steganography.formats import DEFAULT_MODE, EmbedMode
+from steganography.multi_image_steganography import encode_chunks_to_images
+
+WIDTH, HEIGHT = 37, 23
+
+
+def _save(fmt, mode='RGB', **options):
+    buffer = io.BytesIO()
+    Image.new(mode, (WIDTH, HEIGHT), 'red').save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _exif_jpeg():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated: the header size is still the stored one
+    return _save('JPEG', exif=exif.tobytes())
+
+
+def _top_down_bmp():
+    data = bytearray(_save('BMP'))
+    data[22:26] = struct.pack('<i', -HEIGHT)
+    return bytes(data)
+
+
+def _jpeg_with_fill_bytes():
+    # Any number of 0xFF may pad the gap before a marker
+    data = _save('JPEG')
+    return data[:2] + b'\xff\xff\xff' + data[2:]
+
+
+HEADERS = {
+    'png': lambda: _save('PNG'),
+    'png-rgba': lambda: _save('PNG', 'RGBA'),
+    'gif': lambda: _save('GIF'),
+    'bmp': lambda: _save('BMP'),
+    'bmp-top-down': _top_down_bmp,
+    'jpeg': lambda: _save('JPEG'),
+    'jpeg-progressive': lambda: _save('JPEG', progressive=True),
+    'jpeg-exif': _exif_jpeg,
+    'jpeg-fill-bytes': _jpeg_with_fill_bytes,
+    'webp': lambda: _save('WEBP'),  # through Pillow
+    'tiff': lambda: _save('TIFF'),
+}
+
+
+@pytest.mark.parametrize('name', HEADERS)
+def test_read_image_size(name):
+    data = HEADERS[name]()
+    stream = io.BytesIO(data)
+    assert read_image_size(stream) == (WIDTH, HEIGHT) == Image.open(io.BytesIO(data)).size
+    assert stream.tell() == 0
+
+
+@pytest.mark.parametrize('name', ['png', 'gif', 'bmp', 'jpeg-exif'])
+def test_parsed_headers_are_read_from_the_stream_position(name):
+    stream = io.BytesIO(b'prefix' + HEADERS[name]())
+    stream.seek(6)
+    assert read_image_size(stream) == (WIDTH, HEIGHT)
+    assert stream.tell() == 6
+
+
+def test_malformed_jpeg_segments_end_the_scan():
+    # A zero segment length would otherwise loop forever; Pillow then reads the size
+    assert read_image_size(io.BytesIO(b'\xff\xd8\xff\xe0\x00\x00' + _save('JPEG')[2:])) == (WIDTH, HEIGHT)
+
+
+def _truncated():
+    jpeg = _save('JPEG')
+    sof = jpeg.index(b'\xff\xc0')
+    png = _save('PNG')
+    yield 'empty', b''
+    yield 'garbage', b'not an image at all'
+    yield 'png-signature', png[:8]
+    yield 'png-ihdr', png[:20]
+    yield 'gif', b'GIF89a\x01'
+    yield 'bmp', b'BM\x00\x00'
+    yield 'jpeg-soi', jpeg[:2]
+    yield 'jpeg-segment-length', jpeg[:5]
+    yield 'jpeg-before-sof', jpeg[:sof]
+    yield 'jpeg-sof', jpeg[:sof + 6]
+
+
+@pytest.mark.parametrize('data', [data for _, data in _truncated()], ids=[name for name, _ in _truncated()])
+def test_unreadable_headers(data):
+    stream = io.BytesIO(data)
+    with pytest.raises(ValueError):
+        read_image_size(stream)
+    assert stream.tell() == 0
+
+
+@pytest.mark.parametrize('mode', [DEFAULT_MODE, EmbedMode(1, 'G'), EmbedMode(4, 'RGBA')], ids=str)
+def test_stream_capacity(mode):
+    data = _save('PNG', mode.image_mode)
+    assert stream_capacity(io.BytesIO(data), mode) == capacity_for_size(WIDTH, HEIGHT, mode)
+    assert stream_capacity(io.BytesIO(data), mode, chunked=True) < capacity_for_size(WIDTH, HEIGHT, mode)
+
+
+def test_required_bytes_match_the_encrypted_size():
+    for length in (0, 1, 100, 70000):
+        token = encrypt_data(os.urandom(length), 'pw')
+        assert len(token) == encrypted_size(length) == required_bytes(length, chunked=True)
+        assert required_bytes(length) == len(token) + 4  # plus the length header
+
+
+def _largest_fitting(capacities, chunked=False, parity=0):
+    length = 0
+    while plan_capacity(length + 1, capacities, chunked, parity).fits:
+        length += 1
+    return length
+
+
+def test_single_image_plan_matches_the_encoder(make_png):
+    cover = make_png(40, 30)
+    capacity = stream_capacity(io.BytesIO(cover))
+    length = _largest_fitting([capacity])
+    encode_file_to_image(cover, encrypt_data(os.urandom(length), 'pw'))
+    with pytest.raises(ValueError):
+        encode_file_to_image(cover, encrypt_data(os.urandom(length + 1), 'pw'))
+
+
+@pytest.mark.parametrize('parity', [0, 1])
+def test_multi_image_plan_matches_the_encoder(make_png, parity):
+    covers = [make_png(w, h) for w, h in ((40, 30), (64, 32), (20, 20), (48, 40))]
+    capacities = [stream_capacity(io.BytesIO(cover), chunked=True) for cover in covers]
+    length = _largest_fitting(capacities, True, parity)
+    plan = plan_capacity(length, capacities, True, parity)
+    token = encrypt_data(os.urandom(length), 'pw')
+    chunks = encode_chunks_to_images(covers, token, parity=parity)
+    assert len(chunks) == len(plan.recommended)
+    # The recommended covers alone are enough
+    encode_chunks_to_images([covers[i] for i in plan.recommended], token, parity=parity)
+    with pytest.raises(ValueError):
+        encode_chunks_to_images(covers, encrypt_data(os.urandom(length + 1), 'pw'), parity=parity)
+
+
+@pytest.mark.parametrize('required, capacities, expected', [
+    (0, [10, 20], []),
+    (15, [10, 20], [1]),
+    (55, [10, 50, 30, 5], [1, 3]),  # the fewest covers, the last pick as small as will do
+    (75, [10, 50, 30, 5], [1, 2]),
+    (95, [10, 50, 30, 5], [0, 1, 2, 3]),
+    (96, [10, 50, 30, 5], None),
+    (1, [], None),
+])
+def test_recommend_covers(required, capacities, expected):
+    assert recommend_covers(required, capacities) == expected
+
+
+@pytest.mark.parametrize('length, capacities, parity, expected', [
+    (100, [120, 10], 0, ([0], 100)),
+    (100, [60, 55, 50], 1, ([0, 1, 2], 50)),
+    (100, [60, 40, 50], 1, None),
+    (100, [70, 10, 50, 60, 50], 2, ([0, 2, 3, 4], 50)),
+    (10, [0, 0], 0, None),
+])
+def test_plan_shards(length, capacities, parity, expected):
+    assert plan_shards(length, capacities, parity) == expected
+
+
+@pytest.mark.parametrize('parity', [0, 2])
+def test_more_covers_needed(parity):
+    capacities = [300, 500, 400]
+    plan = plan_capacity(5000, capacities, chunked=True, parity=parity)
+    assert not plan.fits and plan.recommended is None and plan.more_needed
+    average = sum(capacities) // len(capacities)
+    assert plan_capacity(5000, capacities + [average] * plan.more_needed, True, parity).fits
+    assert plan_capacity(5000, [], True, parity).more_needed is None
@@ -0,0 +1,197 @@
+import base64
+import json
+import os
+
+import pytest
+
+from steganography import cli, encryption
+
+PASSWORD = 'cli-password'
+
+
+@pytest.fixture(autouse=True)
+def fresh_key_cache():
+    # Derivation counts in the summary come from the shared key cache
+    encryption.key_cache.clear()
+    yield
+    encryption.key_cache.clear()
+
+
+@pytest.fixture
+def covers(tmp_path, make_png):
+    cover_dir = tmp_path / 'covers'
+    cover_dir.mkdir()
+    for name in ('a.png', 'b.png', 'c.png'):
+        (cover_dir / name).write_bytes(make_png(120, 90))
+    (cover_dir / 'notes.txt').write_text('not an image')
+    return cover_dir
+
+
+def _run(capsys, *argv):
+    code = cli.main(list(argv))
+    out = capsys.readouterr().out
+    return code, json.loads(out)
+
+
+def test_expand_inputs_directory_glob_and_duplicates(covers):
+    a = str(covers / 'a.png')
+    paths = cli.expand_inputs([str(covers), str(covers / '*.png'), a])
+    assert paths == [str(covers / name) for name in ('a.png', 'b.png', 'c.png')]
+    assert cli.expand_inputs([str(covers / 'missing.png')]) == [str(covers / 'missing.png')]
+
+
+def test_output_names_number_repeated_stems():
+    assert cli._output_names(['x/a.png', 'y/a.png', 'b.bmp'], '.png') == ['a.png', 'a_2.png', 'b.png']
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_encode_then_decode_text(capsys, tmp_path, covers, workers):
+    out_dir = tmp_path / 'stego'
+    code, summary = _run(capsys, 'encode', str(covers), '--text', 'hello batch', '--password', PASSWORD,
+                         '-o', str(out_dir), '--workers', str(workers))
+    assert code == 0
+    assert summary['command'] == 'encode'
+    assert (summary['ok'], summary['failed']) == (3, 0)
+    assert summary['key_derivations'] == 1  # one salt for the whole batch
+    assert sorted(os.listdir(out_dir)) == ['a.png', 'b.png', 'c.png']
+    for entry in summary['files']:
+        assert os.path.getsize(entry['output']) == entry['output_bytes']
+
+    encryption.key_cache.clear()
+    decoded_dir = tmp_path / 'decoded'
+    code, summary = _run(capsys, 'decode', str(out_dir), '--password', PASSWORD, '-o', str(decoded_dir),
+                         '--workers', str(workers))
+    assert code == 0
+    assert summary['ok'] == 3
+    assert 1 <= summary['key_derivations'] <= workers
+    for entry in summary['files']:
+        assert entry['payload_type'] == 'text'
+        with open(entry['output'], 'rb') as f:
+            assert f.read() == b'hello batch'
+
+
+def test_encode_then_decode_file(capsys, tmp_path, covers):
+    secret = tmp_path / 'secret.bin'
+    secret.write_bytes(bytes(range(256)) * 4)
+    out_dir = tmp_path / 'stego'
+    code, _ = _run(capsys, 'encode', str(covers / 'a.png'), '--file', str(secret), '--password', PASSWORD,
+                   '-o', str(out_dir), '--workers', '1')
+    assert code == 0
+
+    code, summary = _run(capsys, 'decode', str(out_dir / 'a.png'), '--password', PASSWORD,
+                         '-o', str(tmp_path), '--workers', '1')
+    assert code == 0
+    entry = summary['files'][0]
+    assert (entry['payload_type'], entry['filename'], entry['payload_bytes']) == ('file', 'secret.bin', 1024)
+    with open(entry['output'], 'rb') as f:
+        assert f.read() == secret.read_bytes()
+
+
+def test_decode_without_output_dir_only_audits(capsys, tmp_path, covers, monkeypatch):
+    monkeypatch.setenv('STEGO_PASSWORD', PASSWORD)
+    out_dir = tmp_path / 'stego'
+    _run(capsys, 'encode', str(covers / 'b.png'), '--text', 'audit me', '-o', str(out_dir), '--workers', '1')
+    code, summary = _run(capsys, 'decode', str(out_dir / 'b.png'), '--workers', '1')
+    assert code == 0
+    assert summary['files'][0]['payload_bytes'] == len('audit me')
+    assert 'output' not in summary['files'][0]
+
+
+def test_wrong_password_fails_every_file(capsys, tmp_path, covers):
+    out_dir = tmp_path / 'stego'
+    _run(capsys, 'encode', str(covers), '--text', 'x', '--password', PASSWORD, '-o', str(out_dir), '--workers', '1')
+    code, summary = _run(capsys, 'decode', str(out_dir), '--password', 'wrong', '--workers', '1')
+    assert code == 1
+    assert (summary['ok'], summary['failed']) == (0, 3)
+    assert all(entry['status'] == 'error' and entry['error'] for entry in summary['files'])
+
+
+def test_missing_input_is_reported(capsys, tmp_path, covers):
+    missing = str(tmp_path / 'missing.png')
+    code, summary = _run(capsys, 'encode', missing, str(covers / 'a.png'), '--text', 'x', '--password', PASSWORD,
+                         '-o', str(tmp_path / 'stego'), '--workers', '1')
+    assert code == 1
+    assert [entry['status'] for entry in summary['files']] == ['error', 'ok']
+    assert summary['files'][0]['input'] == missing
+
+
+def test_capacity(capsys, covers, make_png):
+    (covers / 'big.png').write_bytes(make_png(400, 300))
+    code, summary = _run(capsys, 'capacity', str(covers / 'a.png'), str(covers / 'big.png'),
+                         '--payload-size', '20000')
+    assert code == 0
+    small, big = summary['files']
+    assert (small['width'], small['height']) == (120, 90)
+    assert small['capacity_bytes'] < big['capacity_bytes']
+    assert (small['fits'], big['fits']) == (False, True)
+    assert summary['key_derivations'] == 0
+
+
+def test_capacity_of_a_non_image(capsys, covers):
+    code, summary = _run(capsys, 'capacity', str(covers / 'notes.txt'))
+    assert code == 1
+    assert summary['files'][0]['status'] == 'error'
+
+
+def test_multi_encode_and_decode_with_parity(capsys, tmp_path, covers):
+    # Too much for one cover: two data chunks plus the parity chunk
+    text = base64.b64encode(os.urandom(9000)).decode('ascii')
+    out_dir = tmp_path / 'chunks'
+    code, summary = _run(capsys, 'multi', 'encode', str(covers), '--text', text, '--password', PASSWORD,
+                         '--parity', '1', '-o', str(out_dir), '--workers', '1')
+    assert code == 0
+    assert summary['command'] == 'multi encode'
+    outputs = summary['files'][0]['output']
+    assert len(outputs) == 3
+
+    # Any one image may be lost with one parity chunk
+    os.remove(outputs[0])
+    decoded_dir = tmp_path / 'decoded'
+    code, summary = _run(capsys, 'multi', 'decode', *outputs[1:], '--password', PASSWORD,
+                         '-o', str(decoded_dir), '--workers', '1')
+    assert code == 0
+    entry = summary['files'][0]
+    assert entry['payload_type'] == 'text'
+    with open(entry['output'], encoding='utf-8') as f:
+        assert f.read() == text
+
+
+def test_multi_encode_needs_a_payload(capsys, covers):
+    with pytest.raises(SystemExit):
+        cli.main(['multi', 'encode', str(covers), '--password', PASSWORD])
+
+
+def test_summary_file_keeps_stdout_empty(capsys, tmp_path, covers):
+    summary_path = tmp_path / 'summary.json'
+    code = cli.main(['encode', str(covers / 'a.png'), '--text', 'quiet', '--password', PASSWORD,
+                     '-o', str(tmp_path / 'stego'), '--workers', '1', '--summary', str(summary_path)])
+    captured = capsys.readouterr()
+    assert code == 0
+    assert captured.out == ''
+    assert json.loads(summary_path.read_text())['ok'] == 1
+    assert 'ok' in captured.err  # progress goes to stderr
+
+
+def test_stdout_is_only_the_summary(capsys, tmp_path, covers):
+    # Library output must not corrupt the JSON, even with --verbose
+    out_dir = tmp_path / 'stego'
+    cli.main(['encode', str(covers), '--text', 'x', '--password', PASSWORD, '-o', str(out_dir),
+              '--workers', '1', '--verbose'])
+    json.loads(capsys.readouterr().out)
+    cli.main(['multi', 'encode', str(covers), '--text', 'y' * 500, '--password', PASSWORD,
+              '-o', str(tmp_path / 'chunks'), '--workers', '1', '--verbose'])
+    json.loads(capsys.readouterr().out)
+
+
+def test_verbose_logs_library_progress_to_stderr(capsys, tmp_path, covers):
+    cli.main(['multi', 'encode', str(covers), '--text', 'z' * 500, '--password', PASSWORD,
+              '-o', str(tmp_path / 'chunks'), '--workers', '1', '--verbose'])
+    assert 'steganography.' in capsys.readouterr().err
+    cli.main(['multi', 'encode', str(covers), '--text', 'z' * 500, '--password', PASSWORD,
+              '-o', str(tmp_path / 'again'), '--workers', '1'])
+    assert 'steganography.' not in capsys.readouterr().err
+
+
+def test_importing_main_does_not_run_the_cli():
+    # Pool workers started by spawn or forkserver import the main module
+    import steganography.__main__  # noqa: F401
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from conftest import DATA_DIR, upload
+from steganography.embedding import open_image
+from steganography.encryption import decrypt_data
+from steganography.file_steganography import decode_file_from_image
+from steganography.multi_image_steganography import decode_chunks_from_images, read_chunk_header
+from steganography.payload import PAYLOAD_FILE, PAYLOAD_TEXT, read_payload
+from steganography.text_steganography import decode_text_from_image
+
+# Images written by earlier releases; see data/make_fixtures.py for how
+# they were made and what they carry.
+PASSWORD = 'fixture-password'
+MULTI_TEXT = 'legacy multi-image payload ' + ''.join(f'{i:04x}' for i in range(300))
+
+
+def _data(name):
+    return os.path.join(DATA_DIR, name)
+
+
+def _read(name):
+    with open(_data(name), 'rb') as f:
+        return f.read()
+
+
+def test_baseline_text_image():
+    token = decode_text_from_image(_data('baseline_text.png'))
+    assert read_payload(decrypt_data(token, PASSWORD)) == (PAYLOAD_TEXT, 'text.txt', b'legacy text payload')
+
+
+def test_baseline_file_image():
+    token = decode_file_from_image(_data('baseline_file.png'))
+    assert read_payload(decrypt_data(token, PASSWORD)) == (PAYLOAD_FILE, 'doc.bin', bytes(range(256)) * 2)
+
+
+def test_baseline_multi_image_stream():
+    # No chunk headers: the single stream is read in upload order
+    token = decode_chunks_from_images([_data(f'baseline_chunk_{n}.png') for n in (1, 2, 3)])
+    assert read_payload(decrypt_data(token, PASSWORD))[2] == MULTI_TEXT.encode()
+    with pytest.raises(ValueError):
+        decode_chunks_from_images([_data(f'baseline_chunk_{n}.png') for n in (1, 2)])
+
+
+@pytest.mark.parametrize('order', [(1, 2, 3), (3, 1, 2), (2, 3, 1)])
+def test_version_1_chunk_headers(order):
+    headers = [read_chunk_header(open_image(_data(f'v1_chunk_{n}.png'))) for n in order]
+    assert {header.version for header in headers} == {1}
+    token = decode_chunks_from_images([_data(f'v1_chunk_{n}.png') for n in order])
+    assert read_payload(decrypt_data(token, PASSWORD))[2] == MULTI_TEXT.encode()
+
+
+def test_version_1_missing_chunk():
+    with pytest.raises(ValueError, match='Missing chunk'):
+        decode_chunks_from_images([_data('v1_chunk_1.png'), _data('v1_chunk_3.png')])
+
+
+def test_baseline_images_through_the_app(client):
+    r = client.post('/decode', data={'encoded_image': upload(_read('baseline_text.png'), 't.png'),
+                                     'password': PASSWORD})
+    assert 'legacy text payload' in r.get_data(as_text=True)
+
+    r = client.post('/decode', data={'encoded_image': upload(_read('baseline_file.png'), 'f.png'),
+                                     'password': PASSWORD})
+    assert r.get_data() == bytes(range(256)) * 2
+    assert 'doc.bin' in r.headers['Content-Disposition']
+
+    r = client.post('/advanced/decode', data={
+        'password': PASSWORD,
+        'stego_images': [upload(_read(f'baseline_chunk_{n}.png'), f'chunk_{n}.png') for n in (1, 2, 3)]})
+    assert MULTI_TEXT in r.get_data(as_text=True)
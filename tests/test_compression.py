@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from steganography.compression_utils import (
+    AUTO_CODEC, CODECS, COMPRESSION_NONE, COMPRESSION_ZIP, compress, decompress, decompress_stream, looks_compressed,
+    zip_text,
+)
+
+TEXT = b'the same words over and over ' * 400
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+def test_codec_round_trip(codec):
+    codec_id, packed = compress(TEXT, codec)
+    assert codec_id == CODECS[codec][0]
+    assert decompress(packed, codec_id) == TEXT
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+def test_stream_matches_one_shot(codec):
+    codec_id, packed = compress(TEXT, codec)
+    pieces = [packed[i:i + 100] for i in range(0, len(packed), 100)]
+    assert b''.join(decompress_stream(pieces, codec_id)) == TEXT
+
+
+def test_legacy_zip_codec():
+    packed = zip_text('zipped')
+    assert decompress(packed, COMPRESSION_ZIP) == b'zipped'
+    assert b''.join(decompress_stream([packed[:10], packed[10:]], COMPRESSION_ZIP)) == b'zipped'
+
+
+def test_auto_compresses_text():
+    codec_id, packed = compress(TEXT, 'auto')
+    assert codec_id == CODECS[AUTO_CODEC][0] and len(packed) < len(TEXT)
+
+
+@pytest.mark.parametrize('data', [b'\x89PNG\r\n\x1a\n' + TEXT, b'PK\x03\x04' + TEXT, b'%PDF-1.7' + TEXT, os.urandom(4096)],
+                         ids=['png', 'zip', 'pdf', 'random'])
+def test_auto_stores_compressed_data(data):
+    assert looks_compressed(data)
+    assert compress(data, 'auto') == (COMPRESSION_NONE, data)
+
+
+def test_codec_that_does_not_shrink_falls_back_to_none():
+    data = os.urandom(1000)
+    assert compress(data, 'zlib-9') == (COMPRESSION_NONE, data)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        compress(TEXT, 'snappy')
+    with pytest.raises(ValueError):
+        decompress(TEXT, 99)
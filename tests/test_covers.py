@@ -0,0 +1,121 @@
+import io
+import os
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import upload
+from steganography.capacity import capacity_for_size
+from steganography.cover_store import CoverStore
+from steganography.embedding import StoredCover
+from steganography.formats import EmbedMode
+from steganography.multi_image_steganography import decode_chunks_from_images, encode_chunks_to_images
+from steganography.text_steganography import decode_text_from_image, encode_text_to_image
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CoverStore(str(tmp_path / 'covers'))
+
+
+def _pixels(png):
+    return np.asarray(Image.open(io.BytesIO(png)).convert('RGB'))
+
+
+def test_register_list_and_remove(store, make_png):
+    png = make_png(40, 30)
+    meta = store.add(png, 'a.png')
+    assert (meta['name'], meta['width'], meta['height']) == ('a.png', 40, 30)
+    assert meta['capacity_bytes'] == capacity_for_size(40, 30)
+    assert store.add(io.BytesIO(png), 'again.png') == meta  # same pixels, same entry
+    other = store.add(make_png(30, 40, 'RGBA'))
+    assert sorted(m['id'] for m in store.list()) == sorted([meta['id'], other['id']])
+
+    cover = store.get(meta['id'])
+    assert isinstance(cover, StoredCover) and cover.size == (40, 30)
+    assert np.array_equal(cover.pixels(), _pixels(png))
+
+    store.remove(meta['id'])
+    assert [m['id'] for m in store.list()] == [other['id']]
+    for cover_id in (meta['id'], 'not-an-id', '../secret', None):
+        with pytest.raises(KeyError):
+            store.get(cover_id)
+    with pytest.raises(KeyError):
+        store.remove(meta['id'])
+
+
+def test_stored_covers_encode_like_their_images(store, make_png):
+    png = make_png(50, 50)
+    cover = store.get(store.add(png)['id'])
+    data = os.urandom(200)
+    stego = encode_text_to_image(cover, data)
+    assert np.array_equal(_pixels(stego), _pixels(encode_text_to_image(png, data)))
+    assert decode_text_from_image(io.BytesIO(stego)) == data
+
+    chunks = encode_chunks_to_images([cover, store.get(store.add(make_png(50, 50))['id'])], os.urandom(2500))
+    assert len(chunks) == 2
+    with pytest.raises(ValueError):
+        encode_text_to_image(cover, data, mode=EmbedMode(2, 'RGBA'))
+
+
+def _register(client, png, name='c.png'):
+    r = client.post('/covers', data={'image': upload(png, name)})
+    assert r.status_code == 201
+    return r.get_json()
+
+
+def test_cover_routes(client, make_png):
+    meta = _register(client, make_png(40, 30))
+    assert client.get('/covers').get_json() == [meta]
+    assert client.get(f"/covers/{meta['id']}").get_json() == meta
+    assert client.post('/covers', data={}).status_code == 400
+    assert client.post('/covers', data={'image': upload(b'not an image', 'x.png')}).status_code == 400
+    assert client.delete(f"/covers/{meta['id']}").status_code == 204
+    assert client.delete(f"/covers/{meta['id']}").status_code == 404
+    assert client.get(f"/covers/{meta['id']}").status_code == 404
+    assert client.get('/covers').get_json() == []
+
+
+def test_encode_by_cover_id(client, make_png):
+    cover_id = _register(client, make_png(60, 60))['id']
+    r = client.post('/encode', data={'cover_id': cover_id, 'text_data': 'by id', 'password': 'pw'})
+    assert r.mimetype == 'image/png'
+    r = client.post('/decode', data={'encoded_image': upload(r.get_data(), 's.png'), 'password': 'pw'})
+    assert 'by id' in r.get_data(as_text=True)
+
+    r = client.post('/encode', data={'cover_id': 'f' * 32, 'text_data': 'x', 'password': 'pw'})
+    assert 'Unknown cover ID' in r.get_data(as_text=True)
+
+
+def test_advanced_encode_mixes_registered_and_uploaded_covers(client, make_png):
+    ids = [_register(client, make_png(60, 60), f'{n}.png')['id'] for n in range(2)]
+    payload = os.urandom(7000)  # needs all three covers
+    r = client.post('/advanced/encode', data={
+        'file_data': upload(payload, 'p.bin'), 'password': 'pw', 'cover_ids': ','.join(ids),
+        'images': [upload(make_png(60, 60), 'up.png')]})
+    assert r.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(r.get_data())) as archive:
+        chunks = [archive.read(name) for name in archive.namelist()]
+    assert len(chunks) == 3
+    r = client.post('/advanced/decode', data={'password': 'pw', 'stego_images': [upload(c, 'c.png') for c in chunks]})
+    assert r.get_data() == payload
+    assert decode_chunks_from_images([io.BytesIO(c) for c in chunks])  # registered covers decode like any other
+
+    r = client.post('/advanced/encode', data={'text_data': 'x', 'password': 'pw', 'cover_ids': 'nope'})
+    assert 'Unknown cover ID' in r.get_data(as_text=True)
+
+
+def test_capacity_of_registered_covers_follows_the_mode(client, make_png):
+    cover_id = _register(client, make_png(60, 60))['id']
+    form = {'text_data': 'fits', 'password': 'pw', 'cover_ids': cover_id}
+    r = client.post('/check_capacity', data=dict(form, bits_per_channel='1', channels='G'))
+    available = capacity_for_size(60, 60, EmbedMode(1, 'G'), chunked=True) * 8
+    assert f'Available: {available} bits' in r.get_data(as_text=True)
+
+    # Stored covers have no alpha, so alpha modes are refused up front instead of failing the encode
+    for url in ('/check_capacity', '/advanced/encode'):
+        text = client.post(url, data=dict(form, channels='RGBA')).get_data(as_text=True)
+        assert 'stored without alpha' in text and 'Capacity OK' not in text
+    assert client.post('/jobs/encode', data=dict(form, channels='RGBA')).status_code == 400
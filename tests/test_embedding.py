@@ -0,0 +1,127 @@
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from steganography.capacity import stream_capacity
+from conftest import upload
+from steganography.embedding import bytes_to_symbols, extract_bytes, save_png, symbols_to_bytes
+from steganography.file_steganography import decode_file_from_image, encode_file_to_image
+from steganography.formats import DEFAULT_MODE, PNG_PROFILES, EmbedMode
+from steganography.multi_image_steganography import calculate_capacity
+from steganography.text_steganography import decode_text_from_image, encode_text_to_image
+
+MODES = [EmbedMode(1, 'RGB'), DEFAULT_MODE, EmbedMode(3, 'GB'), EmbedMode(4, 'R'), EmbedMode(2, 'RGBA'),
+         EmbedMode(1, 'A')]
+
+
+def _cover(make_png, mode):
+    return make_png(53, 41, mode.image_mode)
+
+
+@pytest.mark.parametrize('bits', [1, 2, 3, 4])
+def test_symbols_round_trip(bits):
+    data = os.urandom(37)
+    assert symbols_to_bytes(bytes_to_symbols(data, bits), bits) == data
+
+
+@pytest.mark.parametrize('mode', MODES, ids=str)
+@pytest.mark.parametrize('encode, decode', [(encode_text_to_image, decode_text_from_image),
+                                            (encode_file_to_image, decode_file_from_image)])
+def test_single_image_round_trip(make_png, mode, encode, decode):
+    cover = _cover(make_png, mode)
+    capacity = stream_capacity(io.BytesIO(cover), mode)
+    for size in (0, 1, 7, capacity - 4):
+        data = os.urandom(size)
+        assert decode(io.BytesIO(encode(cover, data, mode=mode))) == data
+
+
+@pytest.mark.parametrize('mode', MODES, ids=str)
+def test_payload_over_capacity_is_rejected(make_png, mode):
+    cover = _cover(make_png, mode)
+    with pytest.raises(ValueError):
+        encode_file_to_image(cover, os.urandom(stream_capacity(io.BytesIO(cover), mode) - 3), mode=mode)
+
+
+@pytest.mark.parametrize('mode', MODES, ids=str)
+def test_chunk_capacity_matches_header_estimate(make_png, mode):
+    cover = _cover(make_png, mode)
+    assert calculate_capacity(cover, mode) == stream_capacity(io.BytesIO(cover), mode, chunked=True)
+
+
+@pytest.mark.parametrize('mode', [EmbedMode(1, 'G'), EmbedMode(4, 'RB'), EmbedMode(3, 'A')], ids=str)
+def test_only_low_bits_of_selected_channels_change(make_png, mode):
+    cover = _cover(make_png, mode)
+    stego = encode_text_to_image(cover, os.urandom(50), mode=mode)
+    diff = np.asarray(Image.open(io.BytesIO(stego))) ^ np.asarray(Image.open(io.BytesIO(cover)))
+    assert diff.max() < 1 << max(mode.bits, 2)  # the mode header is written 2 bits deep
+    # Past the mode header only the selected channels carry data
+    body = diff.reshape(-1, diff.shape[2])[mode.header_pixels:]
+    for i, channel in enumerate('RGBA'[:diff.shape[2]]):
+        if channel not in mode.channels:
+            assert not body[:, i].any()
+
+
+def test_alpha_mode_needs_an_alpha_cover(make_png):
+    with pytest.raises(ValueError):
+        encode_text_to_image(make_png(20, 20), b'x', mode=EmbedMode(2, 'RGBA'))
+
+
+@pytest.mark.parametrize('bits, channels', [(0, 'RGB'), (5, 'RGB'), (2, ''), (2, 'RGX'), (2, 'RR')])
+def test_invalid_modes(bits, channels):
+    with pytest.raises(ValueError):
+        EmbedMode(bits, channels)
+
+
+def test_channel_order_is_canonical():
+    assert EmbedMode(2, 'bgr') == DEFAULT_MODE
+
+
+def test_extract_reads_default_mode_covers(make_png):
+    data = os.urandom(100)
+    assert extract_bytes([encode_text_to_image(make_png(30, 30), data)]) == data
+
+
+def _gradient():
+    # Compressible, with noise in the low bits like a stego image, so every profile gives different bytes
+    rng = np.random.default_rng(1)
+    pixels = np.add.outer(np.arange(48), np.arange(64))[..., None] * [1, 2, 3] + rng.integers(0, 4, (48, 64, 3))
+    return Image.fromarray(pixels.astype(np.uint8), 'RGB')
+
+
+def test_png_profiles_give_different_files():
+    image = _gradient()
+    assert len({save_png(image, profile=profile) for profile in PNG_PROFILES}) == len(PNG_PROFILES)
+
+
+@pytest.mark.parametrize('profile', PNG_PROFILES)
+def test_png_profiles_are_lossless(tmp_path, profile):
+    image = _gradient()
+    png = save_png(image, profile=profile)
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(png))), np.asarray(image))
+    path = str(tmp_path / 'out.png')
+    assert save_png(image, path, profile) == path
+    with open(path, 'rb') as f:
+        assert f.read() == png
+    if profile != 'store':
+        assert len(png) < len(save_png(image, profile='store'))
+
+
+def test_unknown_png_profile():
+    with pytest.raises(ValueError):
+        save_png(_gradient(), profile='tiny')
+
+
+@pytest.mark.parametrize('requested, used', [('store', 'store'), ('fast', 'fast'), ('', 'small'), ('tiny', 'small')])
+def test_output_profile_form_field(client, flask_app, requested, used):
+    # Unknown or missing names fall back to the configured profile
+    flask_app.config['STEGO_PNG_PROFILE'] = 'small'
+    cover = save_png(_gradient(), profile='store')
+    r = client.post('/encode', data={'image': upload(cover, 'c.png'), 'text_data': 'profiles', 'password': 'pw',
+                                     'output_profile': requested})
+    assert r.mimetype == 'image/png'
+    png = r.get_data()
+    stego = Image.open(io.BytesIO(png))
+    assert png == save_png(stego, profile=used) != save_png(stego, profile='balanced')
@@ -0,0 +1,139 @@
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from steganography import encryption
+from steganography.encryption import (
+    AES_TAG_SIZE, STREAM_HEADER_SIZE, decrypt_data, decrypt_stream, derive_key, encrypt_data, encrypt_stream,
+    encrypted_size,
+)
+
+SEGMENT = 64
+SEALED = SEGMENT + AES_TAG_SIZE
+
+
+def _token(plaintext, password='pw'):
+    return b''.join(encrypt_stream([plaintext], password, segment_size=SEGMENT))
+
+
+def _segments(token):
+    body = token[STREAM_HEADER_SIZE:]
+    return token[:STREAM_HEADER_SIZE], [body[i:i + SEALED] for i in range(0, len(body), SEALED)]
+
+
+def _decrypt(token, password='pw'):
+    return b''.join(decrypt_stream(token, password))
+
+
+@pytest.mark.parametrize('size', [0, 1, SEGMENT - 1, SEGMENT, SEGMENT + 1, 5 * SEGMENT])
+def test_round_trip(size):
+    plaintext = os.urandom(size)
+    token = _token(plaintext)
+    assert len(token) == encrypted_size(size, SEGMENT)
+    assert _decrypt(token) == plaintext
+    assert _decrypt(bytearray(token)) == plaintext
+    assert _decrypt(memoryview(token)) == plaintext
+    # Arbitrary chunking of the input
+    assert b''.join(decrypt_stream((token[i:i + 7] for i in range(0, len(token), 7)), 'pw')) == plaintext
+
+
+def test_segments_are_released_as_they_verify():
+    token = _token(os.urandom(3 * SEGMENT))
+    segments = decrypt_stream(token, 'pw')
+    assert len(next(segments)) == SEGMENT
+
+
+def test_wrong_password_fails():
+    with pytest.raises(InvalidTag):
+        _decrypt(_token(b'secret'), 'other')
+
+
+@pytest.mark.parametrize('where', [0, STREAM_HEADER_SIZE - 5, STREAM_HEADER_SIZE, STREAM_HEADER_SIZE + SEALED + 3, -1])
+def test_tampering_is_rejected(where):
+    token = bytearray(_token(os.urandom(3 * SEGMENT)))
+    token[where] ^= 1
+    with pytest.raises((InvalidTag, ValueError)):
+        _decrypt(bytes(token))
+
+
+def test_truncation_is_rejected():
+    header, segments = _segments(_token(os.urandom(3 * SEGMENT)))
+    for kept in range(1, len(segments)):
+        with pytest.raises(InvalidTag):
+            _decrypt(header + b''.join(segments[:kept]))
+    with pytest.raises(ValueError):
+        _decrypt(header)
+    with pytest.raises(ValueError):
+        _decrypt(header[:-1])
+    with pytest.raises(InvalidTag):
+        _decrypt(header + b''.join(segments)[:-1])
+
+
+def test_extension_is_rejected():
+    token = _token(os.urandom(2 * SEGMENT + 10))
+    header, segments = _segments(token)
+    with pytest.raises(InvalidTag):
+        _decrypt(token + segments[0])
+    with pytest.raises(InvalidTag):
+        _decrypt(token + os.urandom(SEALED))
+
+
+def test_reordering_is_rejected():
+    header, segments = _segments(_token(os.urandom(3 * SEGMENT + 10)))
+    with pytest.raises(InvalidTag):
+        _decrypt(header + segments[1] + segments[0] + b''.join(segments[2:]))
+    with pytest.raises(InvalidTag):
+        _decrypt(header + b''.join(segments[:-2]) + segments[-1] + segments[-2])
+
+
+def test_segments_from_another_container_are_rejected():
+    first_header, first = _segments(_token(os.urandom(2 * SEGMENT)))
+    _, second = _segments(_token(os.urandom(2 * SEGMENT)))
+    with pytest.raises(InvalidTag):
+        _decrypt(first_header + first[0] + second[1])
+
+
+def _legacy_token(plaintext, password, salt=None):
+    # The original one-shot format: salt + nonce + ciphertext + tag
+    salt = salt or os.urandom(16)
+    nonce = os.urandom(12)
+    return salt + nonce + AESGCM(derive_key(password, salt)).encrypt(nonce, plaintext, None)
+
+
+def test_legacy_tokens_decrypt():
+    token = _legacy_token(b'old format', 'pw')
+    assert decrypt_data(token, 'pw') == b'old format'
+    assert _decrypt(token) == b'old format'
+
+
+def test_wrong_password_costs_one_key_derivation():
+    token = encrypt_data(b'payload', 'pw')
+    encryption.key_cache.clear()
+    with pytest.raises(InvalidTag):
+        decrypt_data(token, 'wrong')
+    assert encryption.key_cache_stats()['misses'] == 1
+
+
+def test_shared_salt_reuses_the_derived_key():
+    encryption.key_cache.clear()
+    salt = os.urandom(16)
+    tokens = [encrypt_data(os.urandom(10), 'pw', salt) for _ in range(3)]
+    assert len({token[:STREAM_HEADER_SIZE] for token in tokens}) == 3  # fresh nonce prefixes
+    assert [decrypt_data(token, 'pw') for token in tokens]
+    assert encryption.key_cache_stats()['misses'] == 1
+
+
+def test_key_cache_is_bounded():
+    cache = encryption.KeyCache(maxsize=2, ttl=60)
+    calls = []
+
+    def derive(password, salt):
+        calls.append(salt)
+        return salt * 2
+
+    for salt in (b'a', b'b', b'a', b'c', b'b'):
+        cache.get('pw', salt, derive)
+    assert calls == [b'a', b'b', b'c', b'b']
+    assert cache.stats()['size'] == 2
@@ -0,0 +1,190 @@
+import io
+import zipfile
+
+import pytest
+
+from conftest import upload
+from steganography import ingest
+from steganography.ingest import FieldOrderError, Ingest, UploadTooLarge
+from steganography.multi_image_steganography import decode_chunks_from_images, encode_chunks_to_images
+
+BOUNDARY = 'test-boundary'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def multipart(parts):
+    # Body for (name, value) parts in the order given; a (filename, bytes) value is a file
+    body = b''
+    for name, value in parts:
+        if isinstance(value, tuple):
+            filename, data = value
+            body += (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n').encode() + data + b'\r\n'
+        else:
+            body += f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+    return body + f'--{BOUNDARY}--\r\n'.encode()
+
+
+class TrackedStream(io.BytesIO):
+    # Remembers how far the body has been read
+    def read(self, size=-1):
+        data = super().read(size)
+        self.high_water = self.tell()
+        return data
+
+
+def test_files_are_handed_over_as_they_complete():
+    body = multipart([('password', 'pw'), ('images', ('a.png', b'A' * 10)), ('images', ('b.png', b'B' * 200_000)),
+                      ('action', 'encode')])
+    stream = TrackedStream(body)
+    with Ingest(stream, CONTENT_TYPE, len(body)) as upload:
+        images = upload.iter_files('images')
+        first = next(images)
+        assert first.filename == 'a.png' and first.stream.read() == b'A' * 10
+        assert upload.form['password'] == 'pw' and not upload.complete
+        assert stream.high_water < len(body)
+        assert next(images).stream.read() == b'B' * 200_000
+        assert next(images, None) is None
+        assert upload.complete and upload.form['action'] == 'encode'
+        assert upload.order == ['password', 'images', 'images', 'action']
+        assert upload.sent_after('images') == {'images', 'action'}
+
+
+def test_large_files_spill_to_disk():
+    body = multipart([('images', ('a.png', b'A' * 5000))])
+    with Ingest(io.BytesIO(body), CONTENT_TYPE, spool_size=1000) as upload:
+        image = upload.finish().files['images']
+        assert image.stream._rolled and image.stream.read() == b'A' * 5000
+
+
+def test_kept_uploads_outlive_the_ingest():
+    body = multipart([('images', ('a.png', b'A' * 50)), ('images', ('b.png', b'B'))])
+    with Ingest(io.BytesIO(body), CONTENT_TYPE) as upload:
+        first, second = upload.finish().files.getlist('images')
+        kept = upload.keep(first)
+    assert kept.read() == b'A' * 50
+    assert second.stream.closed
+    kept.close()
+
+
+def test_byte_limit():
+    body = multipart([('images', ('a.png', b'A' * 200_000))])
+    with pytest.raises(UploadTooLarge):
+        Ingest(io.BytesIO(body), CONTENT_TYPE, len(body), max_bytes=1000)
+    # A body without a length fails at the read that crosses the limit
+    stream = TrackedStream(body)
+    with pytest.raises(UploadTooLarge), Ingest(stream, CONTENT_TYPE, max_bytes=1000) as upload:
+        upload.finish()
+    assert stream.high_water < len(body)
+
+
+def test_file_count_limit():
+    body = multipart([('images', (f'{i}.png', b'x')) for i in range(3)])
+    with pytest.raises(UploadTooLarge), Ingest(io.BytesIO(body), CONTENT_TYPE, max_files=2) as upload:
+        upload.finish()
+
+
+def test_field_size_limit():
+    body = multipart([('images', ('a.png', b'A' * 100_000)), ('text_data', 'x' * 100)])
+    with pytest.raises(UploadTooLarge, match='text_data'), \
+            Ingest(io.BytesIO(body), CONTENT_TYPE, max_field_size=50) as upload:
+        next(upload.iter_files('images'))  # files are not fields
+        upload.finish()
+
+
+def test_field_order():
+    body = multipart([('images', ('a.png', b'x')), ('action', 'encode'), ('password', 'pw')])
+    with Ingest(io.BytesIO(body), CONTENT_TYPE) as upload:
+        upload.finish()
+        upload.require_fields_first('images', ('action', 'password'))
+        with pytest.raises(FieldOrderError, match='password'):
+            upload.require_fields_first('images', ('action',))
+
+
+def test_not_multipart():
+    with pytest.raises(ValueError):
+        Ingest(io.BytesIO(b'x'), 'text/plain')
+
+
+def test_encode_pulls_only_the_covers_it_needs(make_png):
+    covers = [make_png(90, 80 + 10 * i) for i in range(6)]
+    pulled = []
+
+    def arriving():
+        for cover in covers:
+            pulled.append(cover)
+            yield io.BytesIO(cover)
+
+    data = bytes(range(256)) * 30
+    chunks = encode_chunks_to_images(arriving(), data)
+    assert len(pulled) == len(chunks) < len(covers)
+    assert decode_chunks_from_images(io.BytesIO(chunk) for chunk in chunks[::-1]) == data
+
+
+@pytest.fixture
+def covers(make_png):
+    return [make_png(200, 200) for _ in range(3)]
+
+
+def _post(client, url, parts):
+    return client.post(url, data=multipart(parts), content_type=CONTENT_TYPE)
+
+
+def test_advanced_round_trip(client, covers):
+    r = _post(client, '/advanced/encode', [('text_data', 'hello ' * 2000), ('password', 'pw')]
+              + [('images', (f'c{i}.png', cover)) for i, cover in enumerate(covers)] + [('action', 'encode')])
+    assert r.status_code == 200 and r.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(r.get_data())) as archive:
+        chunks = [(name, archive.read(name)) for name in archive.namelist()]
+    # The password may follow the images on decode
+    r = _post(client, '/advanced/decode', [('stego_images', chunk) for chunk in chunks[::-1]] + [('password', 'pw')])
+    assert 'hello hello' in r.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('late', [[('text_data', 'late'), ('password', 'pw')], [('bits_per_channel', '3')]])
+def test_settings_after_the_images_are_refused(client, covers, late):
+    r = _post(client, '/advanced/encode', [('text_data', 'early'), ('password', 'pw')]
+              + [('images', (f'c{i}.png', cover)) for i, cover in enumerate(covers)] + late)
+    assert r.status_code == 400
+
+
+def test_capacity_check_needs_its_action_first(client, covers):
+    images = [('images', ('a.png', covers[0]))]
+    r = _post(client, '/advanced/encode', [('text_data', 'x'), ('action', 'check')] + images)
+    assert r.status_code == 200 and 'Capacity OK' in r.get_data(as_text=True)
+    r = _post(client, '/advanced/encode', [('text_data', 'x')] + images + [('action', 'check')])
+    assert r.status_code == 400
+
+
+@pytest.mark.parametrize('url, name', [('/advanced/encode', 'images'), ('/advanced/decode', 'stego_images'),
+                                       ('/jobs/encode', 'images'), ('/jobs/decode', 'stego_images')])
+def test_upload_limits(client, flask_app, covers, url, name):
+    parts = [('text_data', 'x'), ('password', 'pw')] + [(name, (f'c{i}.png', cover)) for i, cover in enumerate(covers)]
+    flask_app.config['STEGO_UPLOAD_MAX_FILES'] = 2
+    assert _post(client, url, parts).status_code == 413
+    flask_app.config['STEGO_UPLOAD_MAX_FILES'] = ingest.UPLOAD_MAX_FILES
+    flask_app.config['STEGO_UPLOAD_MAX_BYTES'] = 50_000
+    assert _post(client, url, parts).status_code == 413
+
+
+def test_non_multipart_body(client):
+    assert client.post('/advanced/decode', data='x', content_type='text/plain').status_code == 400
+
+
+def test_urlencoded_encode_with_registered_covers(client, covers):
+    # No uploads to stream: the form is read whole, as before ingest
+    from test_jobs import _job
+    cover_id = client.post('/covers', data={'image': upload(covers[0], 'c.png')}).get_json()['id']
+    form = {'text_data': 'registered', 'password': 'pw', 'cover_ids': cover_id}
+    r = client.post('/advanced/encode', data=dict(form, action='check'))
+    assert r.status_code == 200 and 'Capacity OK' in r.get_data(as_text=True)
+    r = client.post('/advanced/encode', data=form)
+    assert r.status_code == 200 and r.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(r.get_data())) as archive:
+        chunks = [upload(archive.read(name), name) for name in archive.namelist()]
+    r = client.post('/advanced/decode', data={'password': 'pw', 'stego_images': chunks})
+    assert 'registered' in r.get_data(as_text=True)
+
+    info = _job(client, client.post('/jobs/encode', data=form))
+    assert info['status'] == 'done', info.get('error')
+    assert 'Unknown cover ID' in client.post('/advanced/encode', data=dict(form, cover_ids='nope')).get_data(as_text=True)
@@ -0,0 +1,159 @@
+import io
+import os
+import tempfile
+import threading
+import time
+import zipfile
+
+import pytest
+
+from conftest import upload
+from steganography import jobs
+
+
+def _wait(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def queue():
+    queue = jobs.JobQueue(workers=1, max_pending=2, ttl=60)
+    yield queue
+    queue.shutdown()
+
+
+def test_queue_is_bounded(queue):
+    gate = threading.Event()
+    running = queue.submit('x', lambda job: gate.wait())
+    queued = queue.submit('x', lambda job: 1)
+    extra = tempfile.TemporaryFile()
+    with pytest.raises(jobs.QueueFull):
+        queue.submit('x', lambda job: 1, inputs=[extra])
+    assert extra.closed
+    assert queue.cancel(queued.id).status == jobs.CANCELLED
+    queue.submit('x', lambda job: 1)
+    gate.set()
+    _wait(lambda: queue.get(running.id).status == jobs.DONE)
+    with pytest.raises(KeyError):
+        queue.get(queued.id)
+
+
+def test_running_jobs_are_not_cancelled(queue):
+    gate = threading.Event()
+    job = queue.submit('x', lambda job: gate.wait())
+    _wait(lambda: job.status == jobs.RUNNING)
+    assert queue.cancel(job.id).status == jobs.RUNNING
+    gate.set()
+
+
+def test_results_and_inputs(queue):
+    source = tempfile.TemporaryFile()
+
+    def run(job):
+        job.progress(images=1, bits=8)
+        with job.create_result() as f:
+            f.write(b'result')
+        return 'text/plain'
+
+    job = queue.submit('x', run, bits_total=8, inputs=[source])
+    _wait(lambda: job.status == jobs.DONE)
+    assert source.closed and job.result == 'text/plain'
+    with open(job.result_path, 'rb') as f:
+        assert f.read() == b'result'
+    info = job.to_dict()
+    assert (info['images_done'], info['bits_done'], info['bits_total']) == (1, 8, 8)
+    queue.cancel(job.id)
+    assert not os.path.exists(job.result_path)
+
+
+def test_failed_jobs_keep_no_partial_result(queue):
+    source = tempfile.TemporaryFile()
+
+    def run(job):
+        with job.create_result() as f:
+            f.write(b'partial')
+        raise ValueError('broken')
+
+    job = queue.submit('x', run, inputs=[source])
+    _wait(lambda: job.status == jobs.FAILED)
+    assert job.error == 'broken' and source.closed
+    assert not os.path.exists(job.result_path)
+
+
+def test_finished_jobs_expire_without_lookups():
+    queue = jobs.JobQueue(workers=1, max_pending=2, ttl=0.2)
+
+    def run(job):
+        with job.create_result() as f:
+            f.write(b'result')
+
+    job = queue.submit('x', run)
+    _wait(lambda: job.status == jobs.DONE)
+    _wait(lambda: not os.path.exists(job.result_path))
+    assert job.id not in queue._jobs
+    queue.shutdown()
+
+
+@pytest.fixture
+def covers(make_png):
+    return [make_png(60, 60) for _ in range(3)]
+
+
+def _job(client, response):
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert response.headers['Location'].endswith(f'/jobs/{job_id}')
+    _wait(lambda: client.get(f'/jobs/{job_id}').get_json()['status'] in (jobs.DONE, jobs.FAILED))
+    return client.get(f'/jobs/{job_id}').get_json()
+
+
+def test_encode_and_decode_jobs(client, covers):
+    payload = os.urandom(3000)
+    info = _job(client, client.post('/jobs/encode', data={
+        'file_data': upload(payload, 'p.bin'), 'password': 'pw', 'bits_per_channel': '3', 'parity': '1',
+        'images': [upload(cover, f'c{i}.png') for i, cover in enumerate(covers)]}))
+    assert info['status'] == jobs.DONE and info['bits_done'] == info['bits_total']
+    with zipfile.ZipFile(io.BytesIO(client.get(info['result_url']).get_data())) as archive:
+        chunks = [upload(archive.read(name), name) for name in archive.namelist()]
+
+    info = _job(client, client.post('/jobs/decode', data={'password': 'pw', 'stego_images': chunks}))
+    r = client.get(info['result_url'])
+    assert r.get_data() == payload and 'p.bin' in r.headers['Content-Disposition']
+
+    assert client.delete(f"/jobs/{info['id']}").status_code == 204
+    assert client.get(f"/jobs/{info['id']}").status_code == 404
+
+
+def test_failed_decode_job(client, covers):
+    r = client.post('/jobs/decode', data={'password': 'pw', 'stego_images': [upload(covers[0], 'c.png')]})
+    info = _job(client, r)
+    assert info['status'] == jobs.FAILED and info['error']
+    assert client.get(f"/jobs/{info['id']}/result").status_code == 409
+
+
+def test_job_requests_are_checked_up_front(client, covers):
+    r = client.post('/jobs/encode', data={'password': 'pw', 'images': [upload(covers[0], 'c.png')]})
+    assert r.status_code == 400  # nothing to encode
+    assert client.post('/jobs/decode', data={'password': 'pw'}).status_code == 400
+    assert client.get('/jobs/unknown').status_code == 404
+    assert client.get('/jobs/unknown/result').status_code == 404
+
+
+def test_full_queue_answers_503(client, flask_app, covers):
+    flask_app.config['STEGO_JOB_QUEUE_SIZE'] = 0
+    r = client.post('/jobs/decode', data={'password': 'pw', 'stego_images': [upload(covers[0], 'c.png')]})
+    assert r.status_code == 503 and r.headers['Retry-After']
+
+
+def test_decode_job_reads_legacy_streams_in_the_process_pool(client, flask_app):
+    # Single-stream images from before chunk headers take the parallel stream path
+    from test_compat import MULTI_TEXT, PASSWORD, _read
+    flask_app.config['STEGO_WORKERS'] = 2
+    images = [upload(_read(f'baseline_chunk_{n}.png'), f'chunk_{n}.png') for n in (1, 2, 3)]
+    info = _job(client, client.post('/jobs/decode', data={'password': PASSWORD, 'stego_images': images}))
+    assert info['status'] == jobs.DONE, info.get('error')
+    assert client.get(info['result_url']).get_data(as_text=True) == MULTI_TEXT
@@ -0,0 +1,106 @@
+import logging
+import re
+
+import pytest
+
+from conftest import upload
+from steganography import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics(caplog):
+    caplog.set_level(logging.INFO, logger='steganography.metrics')
+    metrics.reset()
+    yield
+    metrics.disable()
+    metrics.reset()
+
+
+def _records(caplog):
+    return [record.getMessage() for record in caplog.records if record.name == 'steganography.metrics']
+
+
+def test_disabled_by_default_costs_nothing(caplog):
+    metrics.disable()
+    with metrics.request('r'), metrics.span('embed') as span:
+        span.set(images=1)
+        metrics.count('payload_bytes', 10, stage='embed')
+    assert _records(caplog) == []
+    assert metrics.render_prometheus() == '\n'
+
+
+def test_log_backend_records_spans_and_request_counters(caplog):
+    metrics.enable(log=True, prometheus=False)
+    with metrics.request('POST /encode', status=200):
+        with metrics.span('embed', images=1) as span:
+            span.set(bits=2)
+            metrics.count('payload_bytes', 10, stage='embed')
+            metrics.count('payload_bytes', 5, stage='embed')
+            metrics.count('images')
+    span_record, request_record = _records(caplog)
+    assert re.fullmatch(r'stage=embed duration_ms=\d+\.\d\d images=1 bits=2', span_record)
+    assert re.fullmatch(r'request=POST /encode duration_ms=\d+\.\d\d status=200 images=1 '
+                        r'payload_bytes\{stage=embed\}=15', request_record)
+
+    # Counters are also totalled without the Prometheus backend
+    with metrics.request('GET /'):
+        metrics.count('payload_bytes', 1, stage='embed')
+    assert _records(caplog)[-1].endswith(' payload_bytes{stage=embed}=1')
+    assert 'stego_payload_bytes_total{stage="embed"} 16' in metrics.render_prometheus()
+
+
+def test_failed_spans_are_marked(caplog):
+    metrics.enable(log=True, prometheus=False)
+    with pytest.raises(ValueError), metrics.request('job encode'), metrics.span('kdf'):
+        raise ValueError
+    assert [record.endswith(' error=ValueError') for record in _records(caplog)] == [True, True]
+
+
+def test_prometheus_exposition(monkeypatch):
+    metrics.enable(log=False, prometheus=True)
+    clock = iter([0.0, 0.003, 10.0, 10.2])
+    monkeypatch.setattr(metrics.time, 'perf_counter', lambda: next(clock))
+    for _ in range(2):
+        with metrics.span('embed'):
+            pass
+    metrics.count('images', 3, stage='extract')
+    metrics.count('chunks_rebuilt')
+    lines = metrics.render_prometheus().splitlines()
+
+    assert lines[:2] == ['# HELP stego_stage_duration_seconds Time spent in each pipeline stage.',
+                         '# TYPE stego_stage_duration_seconds histogram']
+    buckets = {line.split('le="')[1].split('"')[0]: int(line.split()[-1]) for line in lines if '_bucket{' in line}
+    # Bucket counts are cumulative: 3 ms falls in 0.005 and up, 200 ms in 0.25 and up
+    assert (buckets['0.001'], buckets['0.005'], buckets['0.1'], buckets['0.25'], buckets['+Inf']) == (0, 1, 1, 2, 2)
+    assert 'stego_stage_duration_seconds_count{stage="embed"} 2' in lines
+    sum_line = next(line for line in lines if line.startswith('stego_stage_duration_seconds_sum'))
+    assert float(sum_line.split()[-1]) == pytest.approx(0.203)
+    assert lines[-4:] == ['# TYPE stego_chunks_rebuilt_total counter', 'stego_chunks_rebuilt_total 1',
+                          '# TYPE stego_images_total counter', 'stego_images_total{stage="extract"} 3']
+
+
+def test_metrics_route(client, make_png):
+    metrics.disable()
+    assert client.get('/metrics').status_code == 404
+
+    metrics.enable(log=False, prometheus=True)
+    r = client.post('/encode', data={'image': upload(make_png(40, 40), 'c.png'), 'text_data': 'hi',
+                                     'password': 'pw'})
+    assert r.mimetype == 'image/png'
+    r = client.get('/metrics')
+    assert r.status_code == 200 and r.mimetype == 'text/plain'
+    text = r.get_data(as_text=True)
+    for stage in ('upload_read', 'image_convert', 'kdf', 'encrypt', 'embed', 'png_save'):
+        assert f'stego_stage_duration_seconds_count{{stage="{stage}"}} 1' in text
+    assert 'stego_pixels_total{stage="image_convert"} 1600' in text
+    assert 'stego_images_total{stage="image_convert"} 1' in text
+
+
+def test_one_log_record_per_request(client, caplog, make_png):
+    metrics.enable(log=True, prometheus=False)
+    client.post('/encode', data={'image': upload(make_png(40, 40), 'c.png'), 'text_data': 'hi', 'password': 'pw'})
+    requests = [record for record in _records(caplog) if record.startswith('request=')]
+    assert len(requests) == 1
+    assert requests[0].startswith('request=POST /encode duration_ms=')
+    assert ' status=200 ' in requests[0]
+    assert ' pixels{stage=image_convert}=1600' in requests[0]
@@ -0,0 +1,169 @@
+import io
+import os
+import random
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from steganography.embedding import open_image
+from steganography.formats import (
+    CHUNK_VERSION, DEFAULT_MODE, ChunkHeader, EmbedMode, pack_chunk_header, unpack_chunk_header,
+)
+from steganography.multi_image_steganography import (
+    calculate_capacity, decode_chunks_from_images, encode_chunks_to_images, pool_submit, process_pool,
+    read_chunk_header,
+)
+
+
+@pytest.fixture
+def covers(make_png):
+    # The 5x5 cover is too small for a chunk header and is skipped
+    return [make_png(40, 30), make_png(5, 5), make_png(64, 20), make_png(30, 30), make_png(50, 50)]
+
+
+@pytest.fixture
+def data(covers):
+    return os.urandom(sum(calculate_capacity(cover) for cover in covers) - 10)
+
+
+def test_chunk_header_round_trip():
+    header = ChunkHeader(EmbedMode(3, 'GB'), 0, b'12345678', 2, 5, 1000, 500, 2400, 1, 0xDEADBEEF)
+    assert unpack_chunk_header(pack_chunk_header(header)) == header._replace(version=CHUNK_VERSION)
+    # No count is only valid for a set without parity
+    arrived = header._replace(count=0, parity=0)
+    assert unpack_chunk_header(pack_chunk_header(arrived)) == arrived._replace(version=CHUNK_VERSION)
+    assert unpack_chunk_header(pack_chunk_header(header._replace(count=0))) is None
+
+
+def test_damaged_or_foreign_chunk_headers():
+    raw = bytearray(pack_chunk_header(ChunkHeader(DEFAULT_MODE, 0, bytes(8), 0, 1, 0, 10, 10)))
+    assert unpack_chunk_header(b'not a header') is None
+    raw[10] ^= 1
+    assert unpack_chunk_header(bytes(raw)) is None
+    raw[2] = CHUNK_VERSION + 1
+    with pytest.raises(ValueError):
+        unpack_chunk_header(bytes(raw))
+
+
+def test_any_order(covers, data):
+    chunks = encode_chunks_to_images(covers, data)
+    assert len(chunks) == 4
+    for _ in range(3):
+        random.shuffle(chunks)
+        assert decode_chunks_from_images(chunks) == data
+    assert decode_chunks_from_images(chunks + chunks[:1]) == data
+
+
+def test_incomplete_or_mixed_sets_are_rejected(covers, data):
+    chunks = encode_chunks_to_images(covers, data)
+    other = encode_chunks_to_images(covers, data)
+    with pytest.raises(ValueError, match='Missing chunk'):
+        decode_chunks_from_images(chunks[1:])
+    with pytest.raises(ValueError, match='different payloads'):
+        decode_chunks_from_images(chunks[:2] + other[2:])
+    with pytest.raises(ValueError, match='carry no chunk header'):
+        decode_chunks_from_images(chunks + [covers[0]])
+
+
+def test_not_enough_capacity(covers, data):
+    with pytest.raises(ValueError, match='Not enough image capacity'):
+        encode_chunks_to_images(covers, data + os.urandom(20))
+
+
+def test_empty_payload(covers):
+    assert decode_chunks_from_images(encode_chunks_to_images(covers, b'')) == b''
+
+
+def test_progress_reports_every_bit(covers, data):
+    seen = []
+    chunks = encode_chunks_to_images(covers, data, progress=lambda images, bits: seen.append((images, bits)))
+    assert sum(images for images, _ in seen) == len(chunks)
+    assert sum(bits for _, bits in seen) == len(data) * 8
+
+
+def test_payload_and_cover_sources(covers, data):
+    # File-like covers, a file-like payload and a chunked payload of known length
+    assert decode_chunks_from_images(encode_chunks_to_images([io.BytesIO(c) for c in covers], data)) == data
+    assert decode_chunks_from_images(encode_chunks_to_images(covers, io.BytesIO(data))) == data
+    pieces = iter([data[:7], data[7:99], data[99:]])
+    assert decode_chunks_from_images(encode_chunks_to_images(covers, pieces, data_length=len(data))) == data
+
+
+def test_chunks_written_to_a_zip_or_directory(covers, data, tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        names = encode_chunks_to_images(covers, data, output_zip=archive)
+    with zipfile.ZipFile(buffer) as archive:
+        assert decode_chunks_from_images([archive.read(name) for name in names]) == data
+    paths = encode_chunks_to_images(covers, data, output_dir=str(tmp_path))
+    assert decode_chunks_from_images(paths) == data
+
+
+def test_decode_as_images_arrive(covers, data):
+    chunks = encode_chunks_to_images(covers, data)
+    assert decode_chunks_from_images(iter(chunks[::-1]), workers=2) == data
+    with pytest.raises(ValueError, match='Missing chunk'):
+        decode_chunks_from_images(iter(chunks[1:]))
+
+
+def test_damaged_chunk_without_parity(covers, data, damage):
+    chunks = encode_chunks_to_images(covers, data)
+    chunks[0] = damage(chunks[0])
+    with pytest.raises(ValueError, match='damaged'):
+        decode_chunks_from_images(chunks)
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_single_stream_layout(covers, data, workers):
+    data = data[:len(data) // 2]
+    chunks = encode_chunks_to_images(covers, data, manifest=False, workers=workers)
+    assert decode_chunks_from_images(chunks, workers=workers) == data
+
+
+def test_process_pool(covers, data):
+    chunks = encode_chunks_to_images(covers, data, workers=2, mode=EmbedMode(3, 'RGB'))
+    assert decode_chunks_from_images(chunks, workers=2) == data
+
+
+def test_broken_process_pool_is_replaced():
+    broken = process_pool(3)
+    with pytest.raises(BrokenProcessPool):
+        pool_submit(3, os._exit, 1).result()  # the worker dies
+    assert pool_submit(3, pow, 2, 10).result() == 1024
+    assert process_pool(3) is not broken
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_covers_are_embedded_as_they_arrive(covers, data, workers):
+    events = []
+
+    def arriving():
+        for n, cover in enumerate(covers + [b'never read']):
+            events.append(('arrived', n))
+            yield cover
+
+    chunks = encode_chunks_to_images(arriving(), data, workers=workers,
+                                     progress=lambda images, bits: events.append(('written', images)))
+    assert len(chunks) == 4 and ('arrived', 5) not in events  # nothing waits for covers past the payload
+    if not workers:
+        assert events[:2] == [('arrived', 0), ('written', 1)]  # before the next cover is pulled
+
+    headers = [read_chunk_header(open_image(chunk)) for chunk in chunks]
+    assert [header.count for header in headers] == [0] * 4  # not known until the last cover
+    assert {header.version for header in headers} == {CHUNK_VERSION}
+    for order in (chunks, chunks[::-1]):
+        assert decode_chunks_from_images(order, workers=workers) == data
+        assert decode_chunks_from_images(iter(order), workers=workers) == data
+
+
+def test_incomplete_sets_of_arrived_chunks(covers, data):
+    chunks = encode_chunks_to_images(iter(covers), data)
+    with pytest.raises(ValueError, match=r'Missing chunk\(s\) 2 of 4'):
+        decode_chunks_from_images(chunks[:1] + chunks[2:])
+    with pytest.raises(ValueError, match=r'Missing chunk\(s\) after 3'):
+        decode_chunks_from_images(iter(chunks[:3]))
+    with pytest.raises(ValueError, match='different payloads'):
+        decode_chunks_from_images(chunks[:2] + encode_chunks_to_images(covers, data)[2:])
+    with pytest.raises(ValueError, match='Not enough image capacity'):
+        encode_chunks_to_images(iter(covers), data + os.urandom(20))
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import steganography
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('numpy', 'PIL', 'cryptography')
+
+
+def _run(code):
+    # A fresh interpreter, so nothing the other tests imported is loaded
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.split()
+
+
+def test_planning_and_header_parsing_load_no_heavy_dependencies(make_png):
+    code = f'''
+import io, sys
+import steganography
+from steganography import capacity, formats, payload
+steganography.plan_capacity(1000, [600, 600], chunked=True, parity=1)
+steganography.read_image_size(io.BytesIO({make_png(40, 30)!r}))
+payload.read_payload(payload.pack_payload(b'text', payload.PAYLOAD_TEXT, 0))
+print(*[name for name in {HEAVY!r} if name in sys.modules])
+'''
+    assert _run(code) == []
+
+
+def test_lazy_attribute_resolves_on_first_access():
+    code = '''
+import sys
+import steganography
+print('steganography.encryption' in sys.modules, 'encrypt_data' in vars(steganography))
+steganography.encrypt_data
+print('steganography.encryption' in sys.modules, 'encrypt_data' in vars(steganography))
+'''
+    assert _run(code) == ['False', 'False', 'True', 'True']
+
+
+def test_exports():
+    from steganography.encryption import encrypt_data
+    assert steganography.encrypt_data is encrypt_data
+    assert steganography.formats.EmbedMode is steganography.EmbedMode
+    assert set(steganography.__all__) <= set(dir(steganography))
+    with pytest.raises(AttributeError):
+        steganography.not_a_name
@@ -0,0 +1,94 @@
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+from steganography.capacity import plan_shards
+from steganography.embedding import open_image
+from steganography.fec import encode_parity, invert_matrix, parity_matrix, recover
+from steganography.formats import DEFAULT_MODE, EmbedMode
+from steganography.multi_image_steganography import decode_chunks_from_images, encode_chunks_to_images, read_chunk_header
+
+
+@pytest.fixture
+def covers(make_png):
+    return [make_png(40, 30), make_png(5, 5), make_png(64, 20), make_png(30, 30), make_png(50, 50), make_png(45, 45)]
+
+
+@pytest.mark.parametrize('k, m', [(1, 1), (3, 1), (4, 2), (5, 3)])
+def test_any_k_shards_rebuild_the_data(k, m):
+    size = 50
+    shards = [os.urandom(size - (i == k - 1) * 7) for i in range(k)]  # the last one short
+    parity = encode_parity(shards, m, size)
+    for lost in range(1, m + 1):
+        for missing in itertools.combinations(range(k + m), lost):
+            data = {i: shards[i] for i in range(k) if i not in missing}
+            kept = {j: parity[j] for j in range(m) if k + j not in missing}
+            rebuilt = recover(k, m, size, data, kept)
+            for i, shard in rebuilt.items():
+                assert shard[:len(shards[i])] == shards[i]
+            assert set(rebuilt) == {i for i in missing if i < k}
+
+
+def test_too_many_losses():
+    shards = [os.urandom(10) for _ in range(3)]
+    parity = encode_parity(shards, 1, 10)
+    with pytest.raises(ValueError, match='Cannot rebuild'):
+        recover(3, 1, 10, {0: shards[0]}, {0: parity[0]})
+
+
+def test_cauchy_submatrices_are_invertible():
+    matrix = parity_matrix(6, 3)
+    for rows in itertools.combinations(range(3), 2):
+        for cols in itertools.combinations(range(6), 2):
+            sub = matrix[np.ix_(rows, cols)]
+            assert invert_matrix(sub).shape == (2, 2)
+
+
+def test_plan_shards():
+    assert plan_shards(100, [50, 0, 60, 10, 80], 1) == ([0, 2, 4], 50)
+    assert plan_shards(0, [0, 5], 1) is None
+    assert plan_shards(0, [3, 5], 1) == ([0, 1], 0)
+    assert plan_shards(100, [50], 1) is None
+
+
+@pytest.mark.parametrize('parity', [1, 2])
+@pytest.mark.parametrize('mode', [DEFAULT_MODE, EmbedMode(1, 'G'), EmbedMode(3, 'RGB')], ids=str)
+def test_lost_and_damaged_chunks_are_rebuilt(covers, damage, mode, parity):
+    data = os.urandom(700 if mode.bits > 1 else 150)
+    chunks = encode_chunks_to_images(covers, data, parity=parity, mode=mode)
+    headers = [read_chunk_header(open_image(chunk)) for chunk in chunks]
+    assert all(header.parity == parity and header.count == len(chunks) for header in headers)
+    assert decode_chunks_from_images(chunks) == data
+
+    for missing in itertools.combinations(range(len(chunks)), parity):
+        assert decode_chunks_from_images([c for i, c in enumerate(chunks) if i not in missing]) == data
+    damaged = list(chunks)
+    damaged[0] = damage(damaged[0])  # fails its CRC
+    assert decode_chunks_from_images(damaged) == data
+    headerless = list(chunks)
+    headerless[1] = covers[0]
+    assert decode_chunks_from_images(headerless) == data
+    assert decode_chunks_from_images(iter(damaged), workers=2) == data
+
+
+def test_more_losses_than_parity(covers, damage):
+    chunks = encode_chunks_to_images(covers, os.urandom(2500), parity=1)
+    with pytest.raises(ValueError, match='Missing chunk'):
+        decode_chunks_from_images(chunks[2:])
+    chunks[0], chunks[1] = damage(chunks[0]), damage(chunks[1])
+    with pytest.raises(ValueError, match='Cannot rebuild'):
+        decode_chunks_from_images(chunks)
+
+
+@pytest.mark.parametrize('data', [b'', b'x'])
+def test_tiny_payloads(covers, data):
+    assert decode_chunks_from_images(encode_chunks_to_images(covers, data, parity=2)[1:]) == data
+
+
+def test_parity_needs_room_and_chunk_headers(covers):
+    with pytest.raises(ValueError, match='Not enough image capacity'):
+        encode_chunks_to_images(covers, os.urandom(5000), parity=2)
+    with pytest.raises(ValueError, match='manifest'):
+        encode_chunks_to_images(covers, b'x', parity=1, manifest=False)
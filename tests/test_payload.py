@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from steganography.compression_utils import COMPRESSION_NONE, COMPRESSION_ZLIB, compress, zip_bytes, zip_text
+from steganography.payload import (
+    FLAG_MULTI_CHUNK, PAYLOAD_FILE, PAYLOAD_TEXT, PAYLOAD_VERSION, pack_payload, read_payload, stream_payload,
+    unpack_payload,
+)
+
+
+def _pieces(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)] or [b'']
+
+
+def test_header_round_trip():
+    data = pack_payload(b'body', PAYLOAD_FILE, COMPRESSION_NONE, 'résumé.txt', FLAG_MULTI_CHUNK)
+    header, body = unpack_payload(data)
+    assert header == (PAYLOAD_VERSION, PAYLOAD_FILE, COMPRESSION_NONE, FLAG_MULTI_CHUNK, 'résumé.txt')
+    assert body == b'body'
+
+
+def test_newer_versions_are_refused():
+    data = bytearray(pack_payload(b'body', PAYLOAD_TEXT, COMPRESSION_NONE))
+    data[4] = PAYLOAD_VERSION + 1
+    with pytest.raises(ValueError):
+        unpack_payload(bytes(data))
+
+
+@pytest.mark.parametrize('payload_type, filename', [(PAYLOAD_TEXT, ''), (PAYLOAD_FILE, 'data.bin')])
+def test_read_headered_payload(payload_type, filename):
+    content = b'hello ' * 100
+    codec, packed = compress(content, 'zlib-6')
+    assert codec == COMPRESSION_ZLIB
+    assert read_payload(pack_payload(packed, payload_type, codec, filename)) == (payload_type, filename, content)
+
+
+def test_legacy_text_payload():
+    assert read_payload(zip_text('old text')) == (PAYLOAD_TEXT, 'text.txt', b'old text')
+
+
+def test_legacy_file_payload():
+    content = os.urandom(300)
+    data = b'notes.bin::FN::' + zip_bytes(content, 'notes.bin')
+    assert read_payload(data) == (PAYLOAD_FILE, 'notes.bin', content)
+
+
+def test_version_1_header():
+    # The first headered release wrote a bare b'SGP' magic
+    content = b'first release ' * 20
+    data = b'SGP' + bytes([1, PAYLOAD_FILE, COMPRESSION_ZLIB, FLAG_MULTI_CHUNK, 0, 5]) + b'a.txt'
+    data += compress(content, 'zlib-6')[1]
+    assert unpack_payload(data)[0] == (1, PAYLOAD_FILE, COMPRESSION_ZLIB, FLAG_MULTI_CHUNK, 'a.txt')
+    assert read_payload(data) == (PAYLOAD_FILE, 'a.txt', content)
+
+
+@pytest.mark.parametrize('filename', ['SGPreport.pdf', 'SGP', 'SGP\x01\x01\x09.bin'])
+def test_legacy_file_named_like_the_version_1_magic(filename):
+    content = os.urandom(300)
+    data = filename.encode() + b'::FN::' + zip_bytes(content, filename)
+    assert unpack_payload(data) == (None, data)
+    assert read_payload(data) == (PAYLOAD_FILE, filename, content)
+    payload_type, name, pieces = stream_payload(_pieces(data, 3))
+    assert (payload_type, name, b''.join(pieces)) == (PAYLOAD_FILE, filename, content)
+
+
+def test_headerless_bytes_are_text():
+    assert read_payload(b'plain') == (PAYLOAD_TEXT, '', b'plain')
+    assert unpack_payload(b'SG') == (None, b'SG')
+
+
+@pytest.mark.parametrize('piece_size', [1, 5, 4096])
+@pytest.mark.parametrize('data', [
+    pack_payload(compress(b'streamed ' * 500, 'zlib-6')[1], PAYLOAD_FILE, COMPRESSION_ZLIB, 'long-name.txt'),
+    pack_payload(b'raw', PAYLOAD_TEXT, COMPRESSION_NONE),
+    zip_text('old text'),
+    b'notes.bin::FN::' + zip_bytes(b'old file', 'notes.bin'),
+    b'SGP\x01\x01\x00\x00\x00\x00version 1',
+    b'',
+], ids=['zlib-file', 'raw-text', 'legacy-text', 'legacy-file', 'version-1', 'empty'])
+def test_stream_payload_matches_read_payload(data, piece_size):
+    payload_type, filename, content = stream_payload(_pieces(data, piece_size))
+    assert (payload_type, filename, b''.join(content)) == read_payload(data)
+
+
+def test_stream_payload_detects_truncated_compression():
+    content = os.urandom(2000).hex().encode()
+    data = pack_payload(compress(content, 'zlib-6')[1], PAYLOAD_TEXT, COMPRESSION_ZLIB)
+    _, _, pieces = stream_payload(_pieces(data[:-10], 64))
+    with pytest.raises(ValueError):
+        b''.join(pieces)
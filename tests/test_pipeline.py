@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from steganography.compression_utils import CODECS, compress
+from steganography.encryption import decrypt_stream, encrypt_data
+from steganography.formats import DEFAULT_MODE, EmbedMode
+from steganography.multi_image_steganography import decode_chunks_from_images, encode_chunks_to_images
+from steganography.payload import FLAG_MULTI_CHUNK, PAYLOAD_FILE, PAYLOAD_TEXT, pack_payload, stream_payload
+
+# Every mode, codec and parity setting through the same steps as the
+# multi-image routes: compress, payload header, encrypt, embed, then the
+# reverse. One salt keeps the key derivation cached across cases.
+SALT = bytes(16)
+PASSWORD = 'pipeline'
+MODES = [DEFAULT_MODE, EmbedMode(1, 'G'), EmbedMode(3, 'RGB'), EmbedMode(4, 'RGBA')]
+
+
+@pytest.fixture
+def covers(make_png):
+    return {image_mode: [make_png(w, h, image_mode) for w, h in ((64, 48), (80, 40), (48, 48), (60, 60), (56, 56))]
+            for image_mode in ('RGB', 'RGBA')}
+
+
+@pytest.mark.parametrize('parity', [0, 1, 2])
+@pytest.mark.parametrize('codec', ['auto'] + sorted(CODECS))
+@pytest.mark.parametrize('mode', MODES, ids=str)
+def test_round_trip(covers, mode, codec, parity):
+    content = (b'text that compresses well ' * 20) + os.urandom(40)
+    for payload_type, filename in ((PAYLOAD_TEXT, ''), (PAYLOAD_FILE, 'report.bin')):
+        codec_id, packed = compress(content, codec)
+        token = encrypt_data(pack_payload(packed, payload_type, codec_id, filename, FLAG_MULTI_CHUNK), PASSWORD, SALT)
+        chunks = encode_chunks_to_images(covers[mode.image_mode], token, mode=mode, parity=parity)
+        merged = decode_chunks_from_images(chunks[::-1])
+        assert bytes(merged) == token
+        got_type, got_name, pieces = stream_payload(decrypt_stream(merged, PASSWORD))
+        assert (got_type, got_name, b''.join(pieces)) == (payload_type, filename, content)
@@ -0,0 +1,119 @@
+import io
+import os
+
+import pytest
+
+from conftest import upload
+from steganography import encryption
+from steganography.result_cache import ResultCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / 'results'), max_bytes=100)
+
+
+def test_key_covers_every_input(cache):
+    key = cache.key('k1', {'a': 1}, [('image', b'pixels')])
+    assert key == cache.key('k1', {'a': 1}, [('image', io.BytesIO(b'pixels'))])
+    assert len({key,
+                cache.key('k2', {'a': 1}, [('image', b'pixels')]),
+                cache.key('k1', {'a': 2}, [('image', b'pixels')]),
+                cache.key('k1', {'a': 1}, [('image', b'pixelz')]),
+                cache.key('k1', {'a': 1}, [('imag', b'epixels')])}) == 5
+
+
+def test_keys_depend_on_the_directory_secret(tmp_path):
+    one, two = ResultCache(str(tmp_path / 'one')), ResultCache(str(tmp_path / 'two'))
+    assert one.key('k', {}) != two.key('k', {})
+    assert one.key('k', {}) == ResultCache(str(tmp_path / 'one')).key('k', {})
+
+
+def test_hashed_streams_are_rewound(cache):
+    stream = io.BytesIO(b'upload')
+    stream.read(3)
+    cache.key('k', {}, [('file', stream)])
+    assert stream.tell() == 0
+
+
+def test_get_and_put(cache):
+    key = cache.key('k', {})
+    assert cache.get(key) is None
+    cache.put(key, b'result')
+    assert cache.get(key) == b'result'
+    assert cache.stats() | {'bytes': 0} == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'stores': 1, 'evictions': 0,
+                                            'entries': 1, 'bytes': 0, 'max_bytes': 100}
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    keys = [cache.key(str(i), {}) for i in range(3)]
+    for age, key in enumerate(keys):
+        cache.put(key, b'x' * 30)
+        os.utime(cache._path(key), (1000 + age, 1000 + age))
+    assert cache.get(keys[0]) == b'x' * 30  # now the most recently used
+    cache.put(cache.key('3', {}), b'x' * 30)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    assert cache.stats()['evictions'] == 1 and cache.stats()['bytes'] <= 100
+
+
+def test_oversized_results_are_not_stored(cache):
+    key = cache.key('k', {})
+    cache.put(key, b'x' * 101)
+    assert cache.get(key) is None
+
+
+def test_invalid_keys_are_refused(cache):
+    with pytest.raises(ValueError):
+        cache.get('../secret')
+
+
+@pytest.fixture
+def encrypts(monkeypatch):
+    calls = []
+    encrypt = encryption.encrypt_data
+
+    def counting(*args, **kwargs):
+        calls.append(args)
+        return encrypt(*args, **kwargs)
+    monkeypatch.setattr(encryption, 'encrypt_data', counting)
+    return calls
+
+
+def test_retried_encodes_are_served_from_the_cache(client, flask_app, tmp_path, make_png, encrypts):
+    flask_app.config['STEGO_RESULT_CACHE_DIR'] = str(tmp_path / 'results')
+    cover = make_png(100, 100)
+
+    def encode(key=None, text='hi there', password='pw'):
+        headers = {'Idempotency-Key': key} if key else {}
+        return client.post('/encode', data={'image': upload(cover, 'c.png'), 'text_data': text, 'password': password},
+                           headers=headers).get_data()
+
+    first = encode('k1')
+    assert encode('k1') == first and len(encrypts) == 1
+    assert encode('k2') != first
+    assert encode('k1', password='other') != first
+    assert encode('k1', text='other') != first
+    assert encode() != encode()  # without a key nothing is cached
+    assert len(encrypts) == 6
+    stats = client.get('/result-cache').get_json()
+    assert stats['hits'] == 1 and stats['entries'] == 4
+
+
+def test_retried_advanced_encodes_are_served_from_the_cache(client, flask_app, tmp_path, make_png, encrypts):
+    flask_app.config['STEGO_RESULT_CACHE_DIR'] = str(tmp_path / 'results')
+    covers = [make_png(100, 100) for _ in range(3)]
+
+    def encode(key):
+        return client.post('/advanced/encode', headers={'Idempotency-Key': key}, data={
+            'text_data': 'multi ' * 500, 'password': 'pw',
+            'images': [upload(cover, f'c{i}.png') for i, cover in enumerate(covers)]})
+
+    first = encode('m1')
+    assert first.mimetype == 'application/zip'
+    assert encode('m1').get_data() == first.get_data() and len(encrypts) == 1
+    assert encode('m2').get_data() != first.get_data()
+
+
+def test_cache_stats_route_without_a_cache(client):
+    assert client.get('/result-cache').status_code == 404
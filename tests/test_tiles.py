@@ -0,0 +1,63 @@
+import io
+import os
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from steganography import tiles
+from steganography.embedding import embed_bytes, extract_bytes
+from steganography.file_steganography import decode_file_from_image, encode_file_to_image
+from steganography.formats import DEFAULT_MODE, EmbedMode
+from steganography.tiles import embed_bytes_tiled, extract_bytes_tiled
+
+MODES = [DEFAULT_MODE, EmbedMode(1, 'G'), EmbedMode(3, 'RB'), EmbedMode(4, 'RGBA'), EmbedMode(2, 'A')]
+
+
+def _pixels(png):
+    return np.asarray(Image.open(io.BytesIO(png)))
+
+
+def test_adler32_combine():
+    a, b = os.urandom(1000), os.urandom(777)
+    assert tiles._adler32_combine(zlib.adler32(a), zlib.adler32(b), len(b)) == zlib.adler32(a + b)
+
+
+@pytest.mark.parametrize('mode', MODES, ids=str)
+@pytest.mark.parametrize('profile', ['store', 'fast', 'balanced'])
+def test_tiled_matches_flat(make_png, mode, profile):
+    width, height = 97, 120
+    cover = make_png(width, height, mode.image_mode)
+    for size in (0, 57, mode.capacity(width, height) * mode.bits // 8 - 4):
+        data = os.urandom(size)
+        flat = embed_bytes(cover, data, None, profile, mode)
+        for rows in (1, 7, 64):
+            tiled = embed_bytes_tiled(cover, data, None, profile, mode, workers=2, band_rows=rows)
+            assert np.array_equal(_pixels(flat), _pixels(tiled))
+            assert extract_bytes_tiled(tiled, workers=2, band_rows=rows) == data
+            assert extract_bytes_tiled(flat, workers=2, band_rows=rows) == data
+        assert extract_bytes([tiled]) == data
+
+
+def test_non_png_covers_fall_back_to_pillow(make_png):
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(make_png(64, 64))).save(buffer, 'BMP')
+    data = os.urandom(200)
+    stego = embed_bytes_tiled(buffer.getvalue(), data, band_rows=8)
+    assert extract_bytes_tiled(stego, band_rows=8) == data
+
+
+def test_payload_over_capacity(make_png):
+    with pytest.raises(ValueError):
+        embed_bytes_tiled(make_png(20, 20), os.urandom(10_000))
+
+
+def test_large_covers_are_tiled_automatically(make_png, monkeypatch):
+    cover = make_png(60, 50)
+    assert not tiles.use_tiles(cover)
+    monkeypatch.setattr(tiles, 'TILE_MIN_PIXELS', 3000)
+    assert tiles.use_tiles(cover) and tiles.use_tiles(io.BytesIO(cover))
+    assert not tiles.use_tiles(cover, tiled=False)
+    data = os.urandom(300)
+    assert decode_file_from_image(encode_file_to_image(cover, data)) == data